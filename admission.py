@@ -0,0 +1,135 @@
+"""
+admission.py
+Controle de Admissão na frente da execução do grafo.
+- No máximo ADMISSION_MAX_CONCURRENT execuções ao mesmo tempo.
+- Fila de espera limitada (ADMISSION_MAX_QUEUE), ordenada por prioridade e chegada.
+- Cada pedido tem um prazo: se a espera estimada (fila à frente x tempo médio de
+  execução / slots) passar do prazo, ou o prazo vencer na fila, o pedido é
+  recusado na hora com Overloaded(retry_after) -> 503 + Retry-After na API.
+Turnos em andamento têm prioridade sobre criação de jogo e tarefas em lote.
+"""
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from metrics import metrics
+
+# --- CONFIGURAÇÃO ---
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "8"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+ADMISSION_DEADLINE = float(os.getenv("ADMISSION_DEADLINE_SECONDS", "20"))
+# Palpite inicial do tempo de um turno, até termos medições
+ADMISSION_INITIAL_SERVICE_TIME = float(os.getenv("ADMISSION_INITIAL_SERVICE_TIME", "8"))
+
+# Classes de prioridade (menor = passa na frente)
+PRIORITY_TURN = 0
+PRIORITY_NEW_GAME = 1
+PRIORITY_BACKGROUND = 2
+_PRIORITY_NAMES = {PRIORITY_TURN: "turn", PRIORITY_NEW_GAME: "new_game", PRIORITY_BACKGROUND: "background"}
+
+metrics.describe("admission_active", "Execuções do grafo em andamento")
+metrics.describe("admission_queue_depth", "Pedidos aguardando admissão, por prioridade")
+metrics.describe("admission_wait_seconds", "Tempo de espera na fila até a admissão")
+metrics.describe("admission_rejected_total", "Pedidos recusados por sobrecarga")
+metrics.describe("admission_service_seconds", "Duração das execuções admitidas")
+
+
+class Overloaded(Exception):
+    """Pedido recusado: o servidor não consegue atendê-lo dentro do prazo."""
+
+    def __init__(self, retry_after: float, reason: str):
+        super().__init__(f"Servidor sobrecarregado ({reason}). Tente novamente em {math.ceil(retry_after)}s.")
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.reason = reason
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int = ADMISSION_MAX_CONCURRENT, max_queue: int = ADMISSION_MAX_QUEUE,
+                 initial_service_time: float = ADMISSION_INITIAL_SERVICE_TIME):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting: List[Tuple[int, int]] = []  # heap de (prioridade, ordem de chegada)
+        self._seq = itertools.count()
+        self._service_time = initial_service_time  # Média móvel (EWMA) da duração
+
+    def estimated_wait(self, priority: int) -> float:
+        """Espera estimada para um novo pedido desta prioridade (chamar com o lock)."""
+        ahead = sum(1 for p, _ in self._waiting if p <= priority)
+        busy = self._active + ahead - self.max_concurrent + 1
+        if busy <= 0: return 0.0
+        return math.ceil(busy / self.max_concurrent) * self._service_time
+
+    def _publish(self):
+        metrics.set_gauge("admission_active", self._active)
+        for priority, name in _PRIORITY_NAMES.items():
+            metrics.set_gauge("admission_queue_depth", sum(1 for p, _ in self._waiting if p == priority), priority=name)
+
+    def _reject(self, priority: int, reason: str, retry_after: float):
+        metrics.inc("admission_rejected_total", reason=reason, priority=_PRIORITY_NAMES.get(priority, priority))
+        raise Overloaded(retry_after, reason)
+
+    def acquire(self, priority: int = PRIORITY_TURN, deadline: Optional[float] = ADMISSION_DEADLINE) -> float:
+        """Bloqueia até haver slot. Retorna o tempo esperado na fila. Levanta Overloaded."""
+        start = time.monotonic()
+        with self._cond:
+            estimate = self.estimated_wait(priority)
+            if estimate > 0 and len(self._waiting) >= self.max_queue:
+                self._reject(priority, "queue_full", estimate)
+            if deadline is not None and estimate > deadline:
+                self._reject(priority, "deadline", estimate)
+
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            self._publish()
+
+            def my_turn():
+                return self._active < self.max_concurrent and self._waiting[0] == ticket
+
+            remaining = None if deadline is None else max(0.0, deadline - (time.monotonic() - start))
+            admitted = self._cond.wait_for(my_turn, timeout=remaining)
+            self._waiting.remove(ticket)
+            heapq.heapify(self._waiting)
+            if not admitted:
+                self._publish()
+                self._cond.notify_all()
+                self._reject(priority, "deadline", self.estimated_wait(priority))
+
+            self._active += 1
+            self._publish()
+            # O próximo da fila pode ter slot livre também
+            self._cond.notify_all()
+
+        waited = time.monotonic() - start
+        metrics.observe("admission_wait_seconds", waited, priority=_PRIORITY_NAMES.get(priority, priority))
+        return waited
+
+    def release(self, service_time: Optional[float] = None):
+        with self._cond:
+            self._active -= 1
+            if service_time is not None:
+                self._service_time = 0.8 * self._service_time + 0.2 * service_time
+            self._publish()
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, priority: int = PRIORITY_TURN, deadline: Optional[float] = ADMISSION_DEADLINE):
+        """with admission.admit(PRIORITY_TURN): ... (levanta Overloaded se não couber no prazo)."""
+        self.acquire(priority, deadline)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            metrics.observe("admission_service_seconds", elapsed, priority=_PRIORITY_NAMES.get(priority, priority))
+            self.release(elapsed)
+
+
+# Instância global
+admission = AdmissionController()
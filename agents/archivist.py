@@ -1,20 +1,124 @@
 """
 agents/archivist.py
 Gerencia a Memória de Curto (Resumo) e Longo Prazo (RAG) da sessão.
+Roda de forma incremental: uma política decide QUANDO arquivar e só as
+mensagens novas desde a última execução são resumidas. O cursor é a sequência
+da última mensagem resumida (state.message_seq), que nunca se repete no jogo.
 """
-from langchain_core.messages import SystemMessage
+import os
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage, ToolMessage
 from pydantic import BaseModel, Field
-from llm_setup import get_llm, ModelTier
+from context_builder import Section, build_context, message_tokens
+from llm_setup import get_llm
+from prompt_prefix import register_prefix
+from tier_policy import Importance, choose_tier
+from turn_budget import ARCHIVE_MIN_BUDGET, TurnBudget
 from rag import add_memory_to_session
-from state import GameState
+from state import GameState, message_seq
+
+# --- POLÍTICA DE FREQUÊNCIA ---
+ARCHIVIST_TURN_INTERVAL = int(os.getenv("ARCHIVIST_TURN_INTERVAL", "5"))
+ARCHIVIST_TOKEN_THRESHOLD = int(os.getenv("ARCHIVIST_TOKEN_THRESHOLD", "1500"))
+# Resumo anterior entra sempre (cortado se passar disso); o resto do orçamento é dos eventos
+ARCHIVIST_SUMMARY_MAX_TOKENS = int(os.getenv("ARCHIVIST_SUMMARY_MAX_TOKENS", "2000"))
 
 class MemoryUpdate(BaseModel):
     new_summary: str = Field(description="Um parágrafo atualizado resumindo a situação ATUAL e imediata da história.")
     important_facts: list[str] = Field(description="Lista de fatos PERMANENTES para salvar no banco de dados (ex: 'Player matou o Rei'). Se nada importante, lista vazia.")
 
+# Parte fixa do prompt (prefixo estável para o cache do provider); o resumo anterior vem depois
+ARCHIVIST_PROMPT = register_prefix("archivist", """
+    <ROLE>Memory Manager do RPG</ROLE>
+
+    <TAREFA>
+    1. ATUALIZAR O RESUMO: Escreva um novo parágrafo que combine o resumo anterior com os novos eventos recentes. Mantenha foco no "Aqui e Agora".
+    2. EXTRAIR FATOS (LONG TERM): Identifique fatos cruciais que devem ser lembrados para sempre e salvos no banco de dados.
+
+    Se nada grandioso aconteceu, 'important_facts' deve ser [] (vazio).
+    </TAREFA>
+    """)
+
+def _estimate_tokens(messages: List[BaseMessage]) -> int:
+    """Estimativa barata (a mesma do context_builder)."""
+    return sum(message_tokens(m) for m in messages)
+
+def _has_active_enemies(state: Dict[str, Any]) -> bool:
+    return any(e.get("status", "ativo") == "ativo" for e in state.get("enemies") or [])
+
+def messages_since_last_run(state: Dict[str, Any]) -> List[BaseMessage]:
+    """Mensagens depois da última já arquivada (as sem sequência ainda não passaram pelo reducer)."""
+    messages = state.get("messages", [])
+    cursor = state.get("archivist_last_message")
+    if cursor is None: return list(messages)  # Primeira execução
+    # Cursor antigo (fingerprint de saves anteriores): não dá para saber o que já foi resumido,
+    # então nada é reenviado; archive_tracking move o cursor para o fim
+    if not isinstance(cursor, int): return []
+    return [m for m in messages if (message_seq(m) or cursor + 1) > cursor]
+
+def archive_trigger(state: Dict[str, Any]) -> Optional[str]:
+    """
+    Decide se o arquivista deve rodar neste turno.
+    Retorna o motivo ('location_change', 'combat_end', 'turn_interval', 'token_budget') ou None.
+    """
+    if not state.get("game_id"): return None
+
+    new_msgs = messages_since_last_run(state)
+    if not new_msgs: return None
+
+    world = state.get("world") or {}
+    last_location = state.get("archivist_last_location")
+    if last_location and last_location != world.get("current_location"):
+        return "location_change"
+
+    if state.get("archivist_combat_active") and not _has_active_enemies(state):
+        return "combat_end"
+
+    turn = world.get("turn_count", 0)
+    if turn - state.get("archivist_last_run", 0) >= ARCHIVIST_TURN_INTERVAL:
+        return "turn_interval"
+
+    if _estimate_tokens(new_msgs) >= ARCHIVIST_TOKEN_THRESHOLD:
+        return "token_budget"
+
+    return None
+
+def archive_tracking(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Campos baratos que a política acompanha a cada turno (sem chamar a LLM)."""
+    tracking = {
+        "archivist_last_location": (state.get("world") or {}).get("current_location"),
+        "archivist_combat_active": _has_active_enemies(state),
+    }
+    cursor = state.get("archivist_last_message")
+    if cursor is not None and not isinstance(cursor, int):
+        tracking["archivist_last_message"] = _last_seq(state.get("messages", []))
+    return tracking
+
+def _last_seq(messages: List[BaseMessage]) -> Optional[int]:
+    return message_seq(messages[-1]) if messages else None
+
 def archive_node(state: GameState):
     """
-    Compacta o histórico recente em um resumo e extrai fatos para o RAG.
+    Nó do grafo: consulta a política e só chama a LLM quando há motivo.
+    """
+    updates = archive_tracking(state)
+    reason = archive_trigger(state)
+    if not reason: return updates
+
+    # Sem tempo no turno: o cursor não anda, então o próximo disparo resume estas mensagens
+    budget = TurnBudget(state, "archivist")
+    if not budget.allow(ARCHIVE_MIN_BUDGET, "deferred"):
+        updates.update(budget.updates())
+        return updates
+
+    print(f"🗄️ [ARCHIVIST] Disparado por: {reason}")
+    updates.update(archive_now(state))
+    return updates
+
+def archive_now(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compacta as mensagens novas em um resumo e extrai fatos para o RAG.
     """
     messages = state.get("messages", [])
     game_id = state.get("game_id")
@@ -25,43 +129,54 @@ def archive_node(state: GameState):
     current_summary = state.get("narrative_summary", "A aventura segue.")
     
     # Executa com modelo inteligente para garantir qualidade do resumo
-    llm = get_llm(temperature=0.3, tier=ModelTier.SMART)
+    llm = get_llm(temperature=0.3, tier=choose_tier("archivist", Importance.HIGH, state=state))
 
-    sys_msg = SystemMessage(content=f"""
-    <ROLE>Memory Manager do RPG</ROLE>
-    
+    def prompt(summary: str) -> str:
+        return ARCHIVIST_PROMPT.render(f"""
     <INPUTS>
-    1. Resumo Anterior: "{current_summary}"
-    2. Histórico Recente: (Ver mensagens abaixo)
+    1. Resumo Anterior: "{summary}"
+    2. Eventos Novos desde o último resumo: (Ver mensagens abaixo)
     </INPUTS>
-    
-    <TAREFA>
-    1. ATUALIZAR O RESUMO: Escreva um novo parágrafo que combine o resumo anterior com os novos eventos recentes. Mantenha foco no "Aqui e Agora".
-    2. EXTRAIR FATOS (LONG TERM): Identifique fatos cruciais que devem ser lembrados para sempre e salvos no banco de dados.
-    
-    Se nada grandioso aconteceu, 'important_facts' deve ser [] (vazio).
     """)
 
     try:
         archivist = llm.with_structured_output(MemoryUpdate)
-        # Usa as últimas 8 mensagens para contexto
-        context_msgs = messages[-8:] if len(messages) > 8 else messages
-        
-        result = archivist.invoke([sys_msg] + context_msgs)
+        # Só o que ainda não foi resumido (ferramentas/turnos de tool-call não agregam ao resumo)
+        context_msgs = [
+            m for m in messages_since_last_run(state)
+            if not isinstance(m, ToolMessage) and not (isinstance(m, AIMessage) and not m.content)
+        ]
+        if not context_msgs: return {}
+
+        # O resumo anterior nunca sai (no máximo é cortado); os eventos entram do mais antigo
+        # para o mais novo e o que não coube fica para a próxima passada
+        ctx = build_context("archivist", context_msgs, fixed=prompt(""), max_messages=len(context_msgs), oldest_first=True,
+                            sections={"summary": Section(current_summary, priority=1, max_tokens=ARCHIVIST_SUMMARY_MAX_TOKENS)})
+        batch = ctx.history or context_msgs[:1]  # Mensagem maior que o orçamento vai sozinha
+        caught_up = len(batch) == len(context_msgs)
+        result = archivist.invoke([SystemMessage(content=prompt(ctx.text("summary")))] + batch)
         
         updates = {}
         
+        turn = state.get("world", {}).get("turn_count", 0)
+
         # 1. Atualiza RAG (Longo Prazo)
         if result.important_facts:
-            add_memory_to_session(game_id, result.important_facts)
+            add_memory_to_session(game_id, result.important_facts, turn=turn)
             print(f"📚 [ARCHIVIST] Fatos: {result.important_facts}")
 
         # 2. Retorna atualização de estado (Curto Prazo)
         updates["narrative_summary"] = result.new_summary
         
-        # Atualiza timestamp da última execução
-        turn = state.get("world", {}).get("turn_count", 0)
-        updates["archivist_last_run"] = turn
+        # O cursor só anda até o que foi resumido de fato. Com backlog (arquivista
+        # adiado por falta de tempo), o resto fica depois do cursor e archivist_last_run
+        # não anda: turn_interval / token_budget disparam a próxima passada.
+        if caught_up:
+            updates["archivist_last_run"] = turn
+            if messages: updates["archivist_last_message"] = _last_seq(messages)
+        else:
+            updates["archivist_last_message"] = message_seq(batch[-1])
+            print(f"🗄️ [ARCHIVIST] Backlog: {len(batch)}/{len(context_msgs)} mensagens resumidas nesta passada")
 
         return updates
 
@@ -4,11 +4,13 @@ Gerador de Inimigos V8 (Refatorado Check-First + RAG).
 Correção: Prompt reforçado para garantir lista de ataques estruturada.
 """
 import json
-import os
 from typing import Dict, List, Optional
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import HumanMessage
 from pydantic import BaseModel, Field
-from llm_setup import ModelTier, get_llm
+from llm_setup import get_llm
+from prompt_prefix import register_prefix
+from tier_policy import choose_tier, enemy_importance
+from durable_io import dumps_json, path_lock, read_bytes, write_file
 
 try:
     from rag import query_rag
@@ -40,26 +42,44 @@ class EnemySchema(BaseModel):
     abilities: List[str] = []
     loot: List[str] = []
 
+# --- PROMPT ---
+# Reforçado com One-Shot Example para o Array de Ataques. Fixo (prefixo estável
+# para o cache do provider); a lore do monstro vem depois.
+DESIGNER_PROMPT = register_prefix("bestiary", """
+    <role>D&D 5e Monster Designer</role>
+
+    <CRITICAL_INSTRUCTION>
+    You MUST populate the 'attacks' field as a LIST OF OBJECTS (JSON), not strings.
+
+    WRONG:
+    "attacks": ["Bite attack dealing 1d6 damage", "Claw attack..."]
+
+    CORRECT:
+    "attacks": [
+      { "name": "Bite", "type": "melee", "bonus": 5, "damage": "1d6+3 piercing" },
+      { "name": "Claw", "type": "melee", "bonus": 5, "damage": "1d4+3 slashing" }
+    ]
+
+    Include all 6 attributes (str, dex, con, int, wis, cha).
+    </CRITICAL_INSTRUCTION>
+    """)
+
 # --- PERSISTÊNCIA ---
 def load_bestiary() -> Dict:
-    if not os.path.exists(BESTIARY_FILE): return {}
-    try:
-        with open(BESTIARY_FILE, 'r', encoding='utf-8') as f: return json.load(f)
+    raw = read_bytes(BESTIARY_FILE)
+    if raw is None: return {}
+    try: return json.loads(raw)
     except: return {}
 
 def save_enemy(data: Dict):
-    db = load_bestiary()
     # Usa ID se existir, senão gera slug
     key = data.get("id", data["name"].lower().replace(" ", "_"))
     if "id" not in data: data["id"] = key
     
-    db[key] = data
-    if not os.path.exists("data"): os.makedirs("data")
-    with open(BESTIARY_FILE, 'w', encoding='utf-8') as f: json.dump(db, f, indent=4, ensure_ascii=False)
-
-def _infer_tier_from_name(name: str) -> ModelTier:
-    if any(x in name.lower() for x in ["dragon", "lich", "boss", "god", "lord"]): return ModelTier.SMART
-    return ModelTier.FAST
+    with path_lock(BESTIARY_FILE):
+        db = load_bestiary()
+        db[key] = data
+        write_file(BESTIARY_FILE, dumps_json(db, indent=4), coalesce=True)
 
 # --- GERADOR ---
 def generate_new_enemy(name: str, context: str = "") -> Dict:
@@ -88,31 +108,12 @@ def generate_new_enemy(name: str, context: str = "") -> Dict:
     lore = query_rag(f"{name} {context}", index_name="lore")
     if not lore: lore = "Standard RPG Monster."
 
-    llm = get_llm(temperature=0.5, tier=_infer_tier_from_name(name))
+    llm = get_llm(temperature=0.5, tier=choose_tier("bestiary", enemy_importance(name)))
     
-    # Prompt Reforçado com One-Shot Example para o Array de Ataques
-    sys_msg = SystemMessage(content=f"""
-    <role>D&D 5e Monster Designer</role>
-    <lore_context>{lore}</lore_context>
-    
-    <CRITICAL_INSTRUCTION>
-    You MUST populate the 'attacks' field as a LIST OF OBJECTS (JSON), not strings.
-    
-    WRONG:
-    "attacks": ["Bite attack dealing 1d6 damage", "Claw attack..."]
-    
-    CORRECT:
-    "attacks": [
-      {{ "name": "Bite", "type": "melee", "bonus": 5, "damage": "1d6+3 piercing" }},
-      {{ "name": "Claw", "type": "melee", "bonus": 5, "damage": "1d4+3 slashing" }}
-    ]
-    
-    Include all 6 attributes (str, dex, con, int, wis, cha).
-    </CRITICAL_INSTRUCTION>
-    """)
+    sys_msg = DESIGNER_PROMPT.system(f"<lore_context>{lore}</lore_context>")
     
     try:
-        designer = llm.with_structured_output(EnemySchema)
+        designer = llm.coalesced().with_structured_output(EnemySchema)
         res = designer.invoke([sys_msg, HumanMessage(content=f"Create monster: {name}. Context: {context}")])
         data = res.model_dump()
         
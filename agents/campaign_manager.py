@@ -1,16 +1,24 @@
 """Campaign planning node used to keep multi-step story arcs coherent."""
 
-from typing import List
+import os
+from typing import List, Optional
 
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import HumanMessage
 from pydantic import BaseModel, Field, field_validator
 
-from llm_setup import ModelTier, get_llm
+from llm_setup import get_llm
+from prompt_prefix import register_prefix
+from tier_policy import Importance, choose_tier
 from state import CampaignBeat, CampaignPlan, GameState
+from turn_budget import RAG_MIN_BUDGET, REPLAN_MIN_BUDGET, TurnBudget
 
 # --- INTEGRAÇÃO RAG ---
 from rag import query_rag  # <--- Importação necessária
 
+# Replanejamento periódico (turnos desde o último plano). 0 = desligado: o plano só
+# muda ao trocar de local, ao terminar os beats ou quando alguém pede (needs_replan).
+CAMPAIGN_REPLAN_INTERVAL = int(os.getenv("CAMPAIGN_REPLAN_INTERVAL", "0"))
+
 
 class CampaignPlanModel(BaseModel):
     """Structured response format for the campaign planner LLM."""
@@ -45,8 +53,8 @@ def _should_replan(state: GameState) -> bool:
     if location_moved:
         return True
 
-    last_turn = plan.get("last_planned_turn", -10)
-    if turn_count - last_turn >= 10:
+    last_turn = plan.get("last_planned_turn", 0)
+    if CAMPAIGN_REPLAN_INTERVAL and turn_count - last_turn >= CAMPAIGN_REPLAN_INTERVAL:
         return True
 
     beats = plan.get("beats") or []
@@ -55,7 +63,27 @@ def _should_replan(state: GameState) -> bool:
     return finished
 
 
-def _build_plan(state: GameState) -> CampaignPlan:
+# Persona, instruções e exemplo fixos (prefixo estável para o cache do provider); local e lore vêm depois
+ARCHITECT_PROMPT = register_prefix("campaign_architect", (
+    "<PERSONA>\n"
+    "You are the Campaign Architect for a rich, immersive tabletop RPG.\n"
+    "</PERSONA>\n"
+
+    "<INSTRUCTIONS>\n"
+    "Design a concise plot roadmap (3-5 beats) for the current scene.\n"
+    "1. USE THE LORE: If the lore mentions specific dangers, factions, or secrets, weave them into the beats.\n"
+    "2. PACING: Start with atmosphere/hook, rise tension, and lead to a climax.\n"
+    "3. ACTIONABLE: Beats must be clear instructions for the Storyteller AI (e.g., 'Reveal the ancient inscription on the wall').\n"
+    "</INSTRUCTIONS>\n"
+
+    "<EXAMPLE>\n"
+    "Lore: 'The Whispering Caves are haunted by echoes of the past.'\n"
+    "Beats: ['Describe the unsettling echoes mimicking the party', 'Player finds a skeleton with a warning note', 'The echoes coalesce into a spectral guardian']\n"
+    "Climax: 'Confrontation with the Specter or solving its riddle.'\n"
+    "</EXAMPLE>"
+))
+
+def _build_plan(state: GameState, budget: Optional[TurnBudget] = None) -> CampaignPlan:
     """Generate a structured campaign plan for the current scene using RAG context."""
 
     world = state.get("world", {})
@@ -68,39 +96,25 @@ def _build_plan(state: GameState) -> CampaignPlan:
     # --- 1. BUSCA DE LORE (RAG) ---
     # Buscamos informações sobre o local atual e o que o jogador quer fazer
     search_query = f"{current_loc} {last_intent}"
-    try:
-        lore_context = query_rag(search_query, index_name="lore")
-    except Exception as exc:  # noqa: BLE001
-        print(f"[CAMPAIGN RAG ERROR] {exc}")
-        lore_context = "No specific lore available for this location."
+    lore_context = "No specific lore available for this location."
+    if not budget or budget.allow(RAG_MIN_BUDGET, "no_rag"):
+        try:
+            lore_context = query_rag(search_query, index_name="lore")
+        except Exception as exc:  # noqa: BLE001
+            print(f"[CAMPAIGN RAG ERROR] {exc}")
 
     # --- 2. CONFIGURAÇÃO DO LLM ---
-    planner_llm = get_llm(temperature=0.4, tier=ModelTier.SMART) # Aumentei levemente a temp para criatividade
+    planner_llm = get_llm(temperature=0.4, tier=choose_tier("campaign_manager", Importance.HIGH, state=state, budget=budget)) # Aumentei levemente a temp para criatividade
     
-    system_msg = SystemMessage(
-        content=(
-            "<PERSONA>\n"
-            "You are the Campaign Architect for a rich, immersive tabletop RPG.\n"
-            
-            "<CONTEXT>\n"
-            f"Location: {current_loc}\n"
-            f"Weather/Time: {world.get('weather', 'unknown')} / {world.get('time_of_day', 'unknown')}\n"
-            
-            "<LORE_CONTEXT>\n"
-            f"{lore_context}\n"
-            "</LORE_CONTEXT>\n"
-
-            "<INSTRUCTIONS>\n"
-            "Design a concise plot roadmap (3-5 beats) for the current scene.\n"
-            "1. USE THE LORE: If the lore mentions specific dangers, factions, or secrets, weave them into the beats.\n"
-            "2. PACING: Start with atmosphere/hook, rise tension, and lead to a climax.\n"
-            "3. ACTIONABLE: Beats must be clear instructions for the Storyteller AI (e.g., 'Reveal the ancient inscription on the wall').\n"
-
-            "<EXAMPLE>\n"
-            "Lore: 'The Whispering Caves are haunted by echoes of the past.'\n"
-            "Beats: ['Describe the unsettling echoes mimicking the party', 'Player finds a skeleton with a warning note', 'The echoes coalesce into a spectral guardian']\n"
-            "Climax: 'Confrontation with the Specter or solving its riddle.'"
-        )
+    system_msg = ARCHITECT_PROMPT.system(
+        "<CONTEXT>\n"
+        f"Location: {current_loc}\n"
+        f"Weather/Time: {world.get('weather', 'unknown')} / {world.get('time_of_day', 'unknown')}\n"
+        "</CONTEXT>\n"
+
+        "<LORE_CONTEXT>\n"
+        f"{lore_context}\n"
+        "</LORE_CONTEXT>"
     )
 
     prefix = "Recent player intent: " if last_human else "Initial setup: "
@@ -143,8 +157,9 @@ def campaign_manager_node(state: GameState):
     """Ensure a coherent multi-step campaign plan exists and is refreshed periodically."""
 
     world = dict(state.get("world", {}))
-    if world.get("turn_count") is None:
-        world["turn_count"] = 0
+    # Relógio do jogo: cada passagem pelo grafo (START -> campaign_manager) é um turno.
+    world["turn_count"] = (world.get("turn_count") or 0) + 1
+    state = {**state, "world": world}  # Política e plano enxergam o turno atual
 
     if not _should_replan(state):
         return {
@@ -154,8 +169,19 @@ def campaign_manager_node(state: GameState):
             "needs_replan": False,
         }
 
+    # Sem tempo no turno: mantém o plano atual e replaneja no próximo
+    budget = TurnBudget(state, "campaign_manager")
+    if not budget.allow(REPLAN_MIN_BUDGET, "skip_replan"):
+        return {
+            "next": "dm_router",
+            "world": world,
+            "campaign_plan": state.get("campaign_plan"),
+            "needs_replan": True,
+            **budget.updates(),
+        }
+
     print(f"🗺️ [CAMPAIGN] Generating new plot for: {world.get('current_location')}")
-    new_plan = _build_plan(state)
+    new_plan = _build_plan(state, budget)
     
     updated_state = {
         "campaign_plan": new_plan,
@@ -163,5 +189,6 @@ def campaign_manager_node(state: GameState):
         "world": world,
         # Importante: Não sobrescrevemos 'messages' aqui para não perder histórico
         "next": "dm_router",
+        **budget.updates(),
     }
     return updated_state
\ No newline at end of file
@@ -4,8 +4,9 @@ Define o que cada classe pode ou não fazer.
 """
 from typing import Dict, List
 from pydantic import BaseModel, Field
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import HumanMessage
 from llm_setup import get_llm, ModelTier
+from prompt_prefix import register_prefix
 
 # Tenta importar RAG, falha silenciosamente se não existir
 try:
@@ -18,6 +19,15 @@ class ClassTheme(BaseModel):
     forbidden: List[str]
     style: str
 
+# Instruções fixas (prefixo estável para o cache do provider); a lore da classe vem depois
+THEME_PROMPT = register_prefix("class_themes", """
+    Defina os LIMITES TEMÁTICOS (Hard Rules) para uma classe de RPG.
+    Defina:
+    - Allowed: Temas centrais permitidos.
+    - Forbidden: O que quebra a imersão se essa classe fizer.
+    - Style: Descrição visual.
+    """)
+
 # Cache em memória
 _THEME_CACHE: Dict[str, ClassTheme] = {}
 
@@ -38,19 +48,12 @@ def get_class_theme(class_name: str, concept_desc: str = "") -> ClassTheme:
 
     llm = get_llm(temperature=0.1, tier=ModelTier.FAST)
     
-    system_msg = SystemMessage(content=f"""
-    Defina os LIMITES TEMÁTICOS (Hard Rules) para uma classe de RPG.
-    LORE: {lore_context}
-    Defina:
-    - Allowed: Temas centrais permitidos.
-    - Forbidden: O que quebra a imersão se essa classe fizer.
-    - Style: Descrição visual.
-    """)
+    system_msg = THEME_PROMPT.system(f"LORE: {lore_context}")
     
     human_msg = HumanMessage(content=f"Classe: {class_name}\nConceito: {concept_desc}")
     
     try:
-        gen = llm.with_structured_output(ClassTheme)
+        gen = llm.coalesced().with_structured_output(ClassTheme)
         theme = gen.invoke([system_msg, human_msg])
         if theme:
             _THEME_CACHE[key] = theme
@@ -9,10 +9,14 @@ from pydantic import BaseModel, Field
 
 # Imports do Projeto
 from state import GameState, EnemyStats
+from context_builder import build_context
 from llm_setup import ModelTier, get_llm
+from prompt_prefix import register_prefix
 from gamedata import ARTIFACTS_DB
 from engine_utils import execute_engine
 from agents.ruler_completo import resolve_action
+from tier_policy import Importance, choose_tier, enemy_importance
+from turn_budget import RAG_MIN_BUDGET, TurnBudget
 
 # --- IMPORTAÇÃO CRÍTICA DO BESTIÁRIO ---
 # Isso garante que usaremos o cache/DB existente
@@ -27,6 +31,23 @@ class EncounterScanner(BaseModel):
     detected_enemies: List[EnemyIdentification]
     flavor_text: str = Field(description="Descrição curta da entrada dos inimigos em combate.")
 
+# --- PROMPTS (prefixos estáveis para o cache do provider; dados do turno vêm depois) ---
+SCAN_PROMPT = register_prefix("combat_scan", """
+    Analise a narrativa recente. O combate começou.
+    Identifique QUAIS inimigos estão presentes e QUANTOS.
+
+    Exemplo: Se o texto diz "Três orcs surgem", retorne: [{name: "Orc", count: 3}].
+    """)
+
+COMBAT_PROMPT = register_prefix("combat", """
+    <role>Combat Engine</role>
+    <instructions>
+    1. Resolve Hero Action based on [RULER] or description.
+    2. Resolve Enemy Counter-Actions (Roll vs AC).
+    3. Narrate broadly.
+    </instructions>
+    """)
+
 # --- FUNÇÃO DE SPAWN INTEGRADA ---
 def _spawn_enemies_integrated(messages: List, target_hint: str) -> List[EnemyStats]:
     """
@@ -39,17 +60,12 @@ def _spawn_enemies_integrated(messages: List, target_hint: str) -> List[EnemySta
     llm = get_llm(temperature=0.0, tier=ModelTier.FAST)
     
     # Prompt focado apenas em IDENTIFICAR, não em criar stats
-    sys_prompt = f"""
-    Analise a narrativa recente. O combate começou.
-    Identifique QUAIS inimigos estão presentes e QUANTOS.
-    Use a dica do alvo se ajudar: "{target_hint}".
-    
-    Exemplo: Se o texto diz "Três orcs surgem", retorne: [{{name: "Orc", count: 3}}].
-    """
+    sys_prompt = SCAN_PROMPT.render(f'Use a dica do alvo se ajudar: "{target_hint}".')
     
     try:
-        scanner = llm.with_structured_output(EncounterScanner)
-        scan_result = scanner.invoke([SystemMessage(content=sys_prompt)] + messages[-4:])
+        scanner = llm.with_structured_output(EncounterScanner).cached("combat_scan", ttl=3600)
+        ctx = build_context("combat_scan", messages, fixed=sys_prompt)
+        scan_result = scanner.invoke([SystemMessage(content=sys_prompt)] + ctx.history)
         
         final_enemies_list = []
         
@@ -101,6 +117,7 @@ def combat_node(state: GameState):
     player = state["player"]
     party = state.get("party", []) 
     enemies = state.get("enemies", []) or []
+    budget = TurnBudget(state, "combat")
     
     # 1. VERIFICAÇÃO DE INÍCIO (HANDOFF)
     last_msg = messages[-1]
@@ -186,15 +203,14 @@ def combat_node(state: GameState):
     ruling_instruction = ""
     if is_combat_start and spawned_flavor:
         ruling_instruction = f"EVENTO INICIAL: {spawned_flavor} O combate começa agora."
-    elif last_msg and not isinstance(last_msg, (ToolMessage, AIMessage, SystemMessage)):
+    elif last_msg and not isinstance(last_msg, (ToolMessage, AIMessage, SystemMessage)) and budget.allow(RAG_MIN_BUDGET, "no_ruler"):
         try:
             ruling = resolve_action(player, last_msg.content)
             ruling_instruction = f"[RULER]: Formula '{ruling.get('dice_formula')}', Effect: {ruling.get('mechanical_effect')}"
-        except: pass
+        except Exception: pass
 
     # 4. EXECUÇÃO
-    system_msg = SystemMessage(content=f"""
-    <role>Combat Engine</role>
+    system_msg = COMBAT_PROMPT.system(f"""
     <hero>
     {player['name']} | HP: {player['hp']} | AC: {current_ac}
     ATK: +{total_atk} ({active_attr_key.upper()})
@@ -203,18 +219,14 @@ def combat_node(state: GameState):
     <enemies>\n{enemy_str}\n</enemies>
     <party>{party_str}</party>
     {ruling_instruction}
-    
-    <instructions>
-    1. Resolve Hero Action based on [RULER] or description.
-    2. Resolve Enemy Counter-Actions (Roll vs AC).
-    3. Narrate broadly.
-    </instructions>
     """)
 
-    tier = ModelTier.SMART
+    # Luta contra chefe é CRITICAL: SMART sempre que o prazo permitir
+    boss_fight = any(enemy_importance(e["name"], e.get("type")) == Importance.CRITICAL for e in active_enemies)
+    tier = choose_tier("combat", Importance.CRITICAL if boss_fight else Importance.HIGH, budget=budget)
     llm = get_llm(temperature=0.2, tier=tier)
     
-    result = execute_engine(llm, system_msg, messages, state, node_name="Combate")
+    result = execute_engine(llm, system_msg, messages, state, node_name="Combate", budget=budget)
     
     # IMPORTANTE: Se spawnam inimigos, precisamos garantir que o state de retorno tenha eles
     if is_combat_start and enemies:
@@ -3,14 +3,28 @@ agents/librarian.py
 Utilitário de consistência. Verifica se entidades já existem antes de criar novas.
 """
 from typing import List, Optional
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import HumanMessage
 from pydantic import BaseModel, Field
 from llm_setup import get_llm, ModelTier
+from prompt_prefix import register_prefix
 
 class EntityMatch(BaseModel):
     match_found: bool = Field(description="True se o pedido se refere a algo que já existe na lista.")
     existing_id: Optional[str] = Field(description="O ID exato da lista que corresponde ao pedido. Null se não houver match.")
 
+# Instruções fixas (prefixo estável para o cache do provider); tipo e IDs existentes vêm depois
+LIBRARIAN_PROMPT = register_prefix("librarian", """
+    Você é um Bibliotecário de Banco de Dados de um RPG.
+    Identifique se o pedido do usuário se refere a uma entidade que JÁ EXISTE no banco.
+
+    REGRAS DE MATCH:
+    1. Ignore diferenças de títulos (Ex: "Varg" == "npc_varg_acougueiro").
+    2. Ignore sinônimos óbvios (Ex: "Espada de Fogo" == "item_lamina_chamas").
+    3. Se houver ambiguidade ou certeza baixa, retorne match_found=False.
+    4. Se for algo GENÉRICO (ex: "Um goblin") e houver vários, retorne False (crie um novo).
+    5. Apenas nomes PRÓPRIOS ou itens ÚNICOS devem dar match.
+    """)
+
 def find_existing_entity(user_query: str, entity_type: str, existing_ids: List[str]) -> Optional[str]:
     """
     Usa IA para verificar se 'Varg' é o mesmo que 'Varg, o Açougueiro'.
@@ -35,26 +49,16 @@ def find_existing_entity(user_query: str, entity_type: str, existing_ids: List[s
     
     ids_str = ", ".join(existing_ids[:200]) # Limite de segurança para context window
     
-    system_msg = SystemMessage(content=f"""
-    Você é um Bibliotecário de Banco de Dados de um RPG.
-    Identifique se o pedido do usuário se refere a uma entidade que JÁ EXISTE no banco.
-    
+    system_msg = LIBRARIAN_PROMPT.system(f"""
     TIPO DE ENTIDADE: {entity_type}
     BANCO DE DADOS (IDs existentes):
     [{ids_str}]
-    
-    REGRAS DE MATCH:
-    1. Ignore diferenças de títulos (Ex: "Varg" == "npc_varg_acougueiro").
-    2. Ignore sinônimos óbvios (Ex: "Espada de Fogo" == "item_lamina_chamas").
-    3. Se houver ambiguidade ou certeza baixa, retorne match_found=False.
-    4. Se for algo GENÉRICO (ex: "Um goblin") e houver vários, retorne False (crie um novo).
-    5. Apenas nomes PRÓPRIOS ou itens ÚNICOS devem dar match.
     """)
     
     human_msg = HumanMessage(content=f"Query: {user_query}")
     
     try:
-        matcher = llm.with_structured_output(EntityMatch)
+        matcher = llm.with_structured_output(EntityMatch).cached("librarian", ttl=3600)
         result = matcher.invoke([system_msg, human_msg])
         
         if result.match_found and result.existing_id in existing_ids:
@@ -6,11 +6,14 @@ Versão Corrigida: Prompt de Venda melhorado e tratamento de erro reforçado.
 import random
 import unicodedata
 from typing import List, Optional
-from langchain_core.messages import SystemMessage, AIMessage, HumanMessage
+from langchain_core.messages import AIMessage, HumanMessage
 from pydantic import BaseModel, Field
 
 from state import GameState
-from llm_setup import get_llm, ModelTier
+from llm_setup import get_llm
+from prompt_prefix import register_prefix
+from tier_policy import Importance, choose_tier
+from turn_budget import TurnBudget
 from gamedata import save_custom_artifact, ARTIFACTS_DB
 
 # --- SCHEMAS DE DADOS (IA) ---
@@ -33,6 +36,33 @@ class TransactionResult(BaseModel):
     gold_cost: int = Field(default=0, description="Ouro gasto pelo jogador (negativo se o jogador GANHOU ouro).")
     new_item: Optional[ItemGeneration] = Field(None, description="O novo item criado. DEIXE NULL SE FOR VENDA.")
 
+class LootSchema(BaseModel):
+    items: List[ItemGeneration]
+    gold: int
+    narrative: str
+
+# --- PROMPTS (fixos: prefixo estável para o cache do provider; o pedido vai na HumanMessage) ---
+TRADE_PROMPT = register_prefix("loot_trade", """
+    Você é o Motor de Comércio e Crafting de um RPG.
+
+    TAREFA: Decida a transação baseada no pedido e inventário.
+
+    MODOS:
+    1. CRAFT/UPGRADE/COMPRA:
+       - Gera um 'new_item'.
+       - Cobra 'gold_cost' (positivo).
+       - Remove itens usados em 'items_to_remove'.
+
+    2. VENDA (Jogador vendendo item):
+       - Remove o item em 'items_to_remove'.
+       - 'gold_cost' deve ser NEGATIVO (ex: -50 significa que o jogador GANHA 50).
+       - 'new_item' DEVE SER NULL (None).
+
+    Se faltar recurso ou item, success=False.
+    """)
+
+TREASURE_PROMPT = register_prefix("loot_treasure", "Você é um Gerador de Loot de RPG.")
+
 # --- LÓGICA DO NÓ ---
 
 def loot_node(state: GameState):
@@ -46,7 +76,8 @@ def loot_node(state: GameState):
         if isinstance(last_msg, HumanMessage):
             last_user_msg = last_msg.content
     
-    llm = get_llm(temperature=0.4, tier=ModelTier.SMART)
+    budget = TurnBudget(state, "loot")
+    llm = get_llm(temperature=0.4, tier=choose_tier("loot", Importance.HIGH, budget=budget))
 
     # =========================================================
     # MODO 1: CRAFTING / SHOP
@@ -55,25 +86,6 @@ def loot_node(state: GameState):
         inventory_list = ", ".join(player["inventory"])
         gold_available = player["gold"]
         
-        sys_prompt = """
-        Você é o Motor de Comércio e Crafting de um RPG.
-        
-        TAREFA: Decida a transação baseada no pedido e inventário.
-        
-        MODOS:
-        1. CRAFT/UPGRADE/COMPRA: 
-           - Gera um 'new_item'.
-           - Cobra 'gold_cost' (positivo).
-           - Remove itens usados em 'items_to_remove'.
-           
-        2. VENDA (Jogador vendendo item):
-           - Remove o item em 'items_to_remove'.
-           - 'gold_cost' deve ser NEGATIVO (ex: -50 significa que o jogador GANHA 50).
-           - 'new_item' DEVE SER NULL (None).
-        
-        Se faltar recurso ou item, success=False.
-        """
-
         user_prompt = f"""
         INVENTÁRIO: [{inventory_list}]
         OURO: {gold_available}
@@ -83,12 +95,13 @@ def loot_node(state: GameState):
         try:
             trans_engine = llm.with_structured_output(TransactionResult)
             result = trans_engine.invoke([
-                SystemMessage(content=sys_prompt),
+                TRADE_PROMPT.system(),
                 HumanMessage(content=user_prompt)
             ])
             
             if not result.success:
                 return {
+                    **budget.updates(),
                     "messages": [AIMessage(content=f"🚫 {result.message}")],
                     "loot_source": None
                 }
@@ -118,6 +131,7 @@ def loot_node(state: GameState):
                 msg_final = f"{result.message}\n\n[SISTEMA] Ouro: {player['gold']} (Variação: {result.gold_cost * -1})"
 
             return {
+                **budget.updates(),
                 "player": player,
                 "messages": [AIMessage(content=msg_final)],
                 "loot_source": None
@@ -125,25 +139,19 @@ def loot_node(state: GameState):
 
         except Exception as e:
             print(f"Erro Crafting Detail: {e}")
-            return {"messages": [AIMessage(content="O mercador franze a testa. (Transação falhou)")]}
+            return {**budget.updates(), "messages": [AIMessage(content="O mercador franze a testa. (Transação falhou)")]}
 
     # =========================================================
     # MODO 2: TREASURE
     # =========================================================
     else: 
-        class LootSchema(BaseModel):
-            items: List[ItemGeneration]
-            gold: int
-            narrative: str
-
-        sys_prompt = "Você é um Gerador de Loot de RPG."
         danger_lvl = state.get('world',{}).get('danger_level', 1)
         user_prompt = f"Gere loot para perigo nível {danger_lvl}. Máx 2 itens."
 
         try:
             loot_llm = llm.with_structured_output(LootSchema)
             res = loot_llm.invoke([
-                SystemMessage(content=sys_prompt),
+                TREASURE_PROMPT.system(),
                 HumanMessage(content=user_prompt)
             ])
             
@@ -158,9 +166,10 @@ def loot_node(state: GameState):
             
             msg = f"{res.narrative}\n[+ {', '.join(added_names)} | +{res.gold} Ouro]"
             return {
+                **budget.updates(),
                 "player": player,
                 "messages": [AIMessage(content=msg)],
                 "loot_source": None
             }
         except Exception as e:
-            return {"messages": [AIMessage(content="Você vasculha, mas não encontra nada.")]}
\ No newline at end of file
+            return {**budget.updates(), "messages": [AIMessage(content="Você vasculha, mas não encontra nada.")]}
\ No newline at end of file
@@ -4,12 +4,16 @@ Gerador de NPCs com Persistência, Memória, RAG e Filtro de Ignorância.
 Contém tanto a fábrica de NPCs (generate_new_npc) quanto o ator (npc_actor_node).
 """
 import json
-import os
 from typing import Dict, Any, Optional
 from pydantic import BaseModel, Field
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from state import GameState
-from llm_setup import ModelTier, get_llm
+from context_builder import Section, build_context
+from llm_setup import get_llm
+from prompt_prefix import register_prefix
+from tier_policy import Importance, choose_tier, npc_importance
+from durable_io import dumps_json, path_lock, read_bytes, write_file
+from turn_budget import RAG_MIN_BUDGET, TurnBudget
 
 # Fallback para RAG
 try:
@@ -47,15 +51,29 @@ class NPCResponse(BaseModel):
     memory_update: str
     relationship_change: int = 0
 
+# --- PROMPTS (prefixos estáveis para o cache do provider; dados do NPC vêm depois) ---
+DESIGNER_PROMPT = register_prefix("npc_designer", """
+    <role>RPG Character Designer</role>
+    <rules>Include all 6 attributes and a detailed persona.</rules>
+    """)
+
+ACTOR_PROMPT = register_prefix("npc_actor", """
+    <REGRAS DE ATUAÇÃO - CRÍTICO>
+    1. NÃO SEJA UMA WIKIPÉDIA. Você é uma pessoa limitada pela sua ocupação e local.
+    2. FILTRO DE CONHECIMENTO: Ignore fatos do Contexto Externo que seu personagem não saberia (ex: um soldado não sabe magia antiga). Se não souber, invente rumores ou seja cínico.
+    3. Mantenha a persona (gírias, erros, arrogância) o tempo todo.
+    4. Resposta curta e direta.
+    </REGRAS DE ATUAÇÃO>
+    """)
+
 # --- PERSISTÊNCIA ---
 def load_npc_db():
-    if not os.path.exists(NPC_DB_FILE): return {}
-    try:
-        with open(NPC_DB_FILE, 'r', encoding='utf-8') as f: return json.load(f)
+    raw = read_bytes(NPC_DB_FILE)
+    if raw is None: return {}
+    try: return json.loads(raw)
     except: return {}
 
 def save_npc_template(data):
-    db = load_npc_db()
     key = data.get("id", f"npc_{data['name'].lower().replace(' ', '_')}")
     if "id" not in data: data["id"] = key
     
@@ -63,14 +81,10 @@ def save_npc_template(data):
     if "attributes" not in data:
         data["attributes"] = {"str": 10, "dex": 10, "con": 10, "int": 10, "wis": 10, "cha": 10}
     
-    db[key] = data
-    if not os.path.exists("data"): os.makedirs("data")
-    with open(NPC_DB_FILE, 'w', encoding='utf-8') as f: json.dump(db, f, indent=4, ensure_ascii=False)
-
-def _infer_tier_from_name(name: str) -> ModelTier:
-    lowered = name.lower()
-    if any(m in lowered for m in ["king", "queen", "boss", "lord", "archmage"]): return ModelTier.SMART
-    return ModelTier.FAST
+    with path_lock(NPC_DB_FILE):
+        db = load_npc_db()
+        db[key] = data
+        write_file(NPC_DB_FILE, dumps_json(db, indent=4), coalesce=True)
 
 # --- FÁBRICA DE NPCs (A FUNÇÃO QUE FALTAVA) ---
 def generate_new_npc(name, context=""):
@@ -95,15 +109,14 @@ def generate_new_npc(name, context=""):
     print(f"🎭 [NPC] Criando: {name}...")
     lore_info = query_rag(f"{name} {context}", index_name="lore")
     
-    llm = get_llm(temperature=0.7, tier=_infer_tier_from_name(name))
+    llm = get_llm(temperature=0.7, tier=choose_tier("npc_designer", npc_importance(name)))
     
     try:
         designer = llm.with_structured_output(NPCSchema)
         res = designer.invoke([
-            SystemMessage(content=f"""
-            <role>RPG Character Designer</role>
+            DESIGNER_PROMPT.system(f"""
             <lore>{lore_info}</lore>
-            <task>Create NPC '{name}'. Include all 6 attributes and a detailed persona.</task>
+            <task>Create NPC '{name}'.</task>
             """), 
             HumanMessage(content=f"Context: {context}")
         ])
@@ -140,11 +153,15 @@ def npc_actor_node(state: GameState):
 
     # Contexto RAG (Filtrado pelo Prompt)
     last_msg = messages[-1].content if messages else ""
-    lore = query_rag(last_msg, index_name="lore") if RAG_AVAILABLE else ""
+    budget = TurnBudget(state, "npc_actor")
+    if budget.exhausted():
+        return {"messages": [AIMessage(content=f"*{npc_data.get('name', npc_name)} pondera em silêncio antes de responder.*")], **budget.updates()}
+    lore = query_rag(last_msg, index_name="lore") if RAG_AVAILABLE and budget.allow(RAG_MIN_BUDGET, "no_rag") else ""
 
-    llm = get_llm(temperature=0.8, tier=ModelTier.SMART)
+    llm = get_llm(temperature=0.8, tier=choose_tier("npc_actor", Importance.HIGH, budget=budget))
     
-    system_msg = SystemMessage(content=f"""
+    def prompt(memory: str, lore: str) -> str:
+        return ACTOR_PROMPT.render(f"""
     <ROLE>
     Você é {npc_data.get('name')}.
     Ocupação: {npc_data.get('role')}.
@@ -153,23 +170,24 @@ def npc_actor_node(state: GameState):
     </ROLE>
 
     <MEMORIA>
-    {npc_data.get('memory', [])[-3:]}
+    {memory}
     </MEMORIA>
 
     <CONTEXTO_EXTERNO>
     {lore}
     </CONTEXTO_EXTERNO>
-
-    <REGRAS DE ATUAÇÃO - CRÍTICO>
-    1. NÃO SEJA UMA WIKIPÉDIA. Você é uma pessoa limitada pela sua ocupação e local.
-    2. FILTRO DE CONHECIMENTO: Ignore fatos do Contexto Externo que seu personagem não saberia (ex: um soldado não sabe magia antiga). Se não souber, invente rumores ou seja cínico.
-    3. Mantenha a persona (gírias, erros, arrogância) o tempo todo.
-    4. Resposta curta e direta.
     """)
 
+    # Orçamento de tokens: memória do NPC > histórico recente > lore
+    ctx = build_context("npc_actor", messages, fixed=prompt("", ""), sections={
+        "memory": Section(str(npc_data.get('memory', [])[-3:]), priority=1),
+        "lore": Section(lore, priority=3, chunks=True),
+    })
+    system_msg = SystemMessage(content=prompt(ctx.text("memory"), ctx.text("lore")))
+
     try:
         actor = llm.with_structured_output(NPCResponse)
-        res = actor.invoke([system_msg] + messages[-5:])
+        res = actor.invoke([system_msg] + ctx.history)
         
         # Atualiza memória e relação
         npc_data['relationship'] = max(0, min(10, npc_data.get('relationship', 5) + res.relationship_change))
@@ -181,8 +199,9 @@ def npc_actor_node(state: GameState):
 
         return {
             "messages": [AIMessage(content=f"**{npc_data['name']}:** \"{res.dialogue}\"\n*({res.action_description})*")],
-            "npcs": new_npcs
+            "npcs": new_npcs,
+            **budget.updates()
         }
     except Exception as e:
         print(f"Erro NPC Actor: {e}")
-        return {"messages": [AIMessage(content="...")]}
\ No newline at end of file
+        return {"messages": [AIMessage(content="...")], **budget.updates()}
\ No newline at end of file
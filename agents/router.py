@@ -9,7 +9,10 @@ from langchain_core.messages import AIMessage, SystemMessage, HumanMessage
 from langgraph.graph import END
 from pydantic import BaseModel, Field
 
+from context_builder import build_context
 from llm_setup import ModelTier, get_llm
+from prompt_prefix import register_prefix
+from turn_budget import TurnBudget
 from state import GameState
 
 class RouteType(str, Enum):
@@ -26,6 +29,17 @@ class RouterDecision(BaseModel):
     reasoning: str
     confidence: float
 
+# Parte fixa do prompt (prefixo estável para o cache do provider); o local vem depois
+ROUTER_PROMPT = register_prefix("router", """
+    Roteador de RPG. Classifique a intenção da ÚLTIMA mensagem do jogador.
+
+    REGRAS:
+    - COMBAT: Jogador ataca, saca armas ou reage a uma ameaça narrada. IMPORTANTE: Identifique o 'target' (inimigo).
+    - NPC: Conversa social, diplomacia.
+    - LOOT: "Vasculhar corpo", "Pegar item", "Abrir baú" (TREASURE) ou "Comprar/Vender/Criar" (SHOP/CRAFT).
+    - STORY: Movimentação, exploração, observar cenário.
+    """)
+
 def dm_router_node(state: GameState):
     messages = state.get("messages", [])
     if not messages: return {"next": RouteType.STORY.value}
@@ -35,26 +49,22 @@ def dm_router_node(state: GameState):
     if isinstance(last_msg, AIMessage) and not getattr(last_msg, "tool_calls", None):
         return {"next": END}
 
+    # Sem tempo para classificar: segue como história (o storyteller também degrada)
+    budget = TurnBudget(state, "dm_router")
+    if budget.exhausted():
+        return {"next": RouteType.STORY.value, **budget.updates()}
+
     world = state.get("world", {})
     loc = world.get("current_location", "Desconhecido")
     
-    system_instruction = f"""
-    Roteador de RPG. Classifique a intenção da ÚLTIMA mensagem do jogador.
-    
-    Local Atual: {loc}
-    
-    REGRAS:
-    - COMBAT: Jogador ataca, saca armas ou reage a uma ameaça narrada. IMPORTANTE: Identifique o 'target' (inimigo).
-    - NPC: Conversa social, diplomacia.
-    - LOOT: "Vasculhar corpo", "Pegar item", "Abrir baú" (TREASURE) ou "Comprar/Vender/Criar" (SHOP/CRAFT).
-    - STORY: Movimentação, exploração, observar cenário.
-    """
+    system_instruction = ROUTER_PROMPT.render(f"Local Atual: {loc}")
 
     llm = get_llm(temperature=0.0, tier=ModelTier.FAST)
 
     try:
-        router_llm = llm.with_structured_output(RouterDecision)
-        decision = router_llm.invoke([SystemMessage(content=system_instruction)] + messages[-3:])
+        router_llm = llm.with_structured_output(RouterDecision).hedged("router").cached("router", ttl=3600)
+        ctx = build_context("router", messages, fixed=system_instruction)
+        decision = router_llm.invoke([SystemMessage(content=system_instruction)] + ctx.history)
     except Exception as e:
         print(f"⚠️ Router Error: {e}")
         return {"next": RouteType.STORY.value}
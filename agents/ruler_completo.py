@@ -4,9 +4,10 @@ agents/ruler_completo.py
 Define as regras e interpreta intenções complexas usando o RAG e o Banco de Habilidades.
 """
 from typing import Optional, Dict
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import HumanMessage
 from pydantic import BaseModel, Field
 from llm_setup import get_llm, ModelTier
+from prompt_prefix import register_prefix
 
 # --- INTEGRAÇÕES ---
 try:
@@ -28,6 +29,20 @@ class Ruling(BaseModel):
     mechanical_effect: str = Field(description="O efeito técnico. Ex: 'Dano Cortante', 'Condição Caído', 'Gasta 5 HP'.")
     flavor_text: str = Field(description="Explicação curta da regra aplicada.")
 
+# Papel e instruções fixos (prefixo estável para o cache do provider); jogador e biblioteca vêm depois
+RULER_PROMPT = register_prefix("ruler", """
+    Você é o JUIZ DE REGRAS (Game Master) de um RPG Dark Fantasy.
+    Sua função é traduzir a narração do jogador em MECÂNICA DE DADOS.
+
+    <INSTRUÇÕES>
+    1. Se o jogador usou uma Habilidade Oficial (listada na BIBLIOTECA DE REGRAS abaixo), USE EXATAMENTE os dados dela.
+       - Ex: Se "Juramento de Sangue" diz "Gasta 5 HP", o efeito deve ser "Gasta 5 HP, Ganha Buff".
+    2. Se for uma manobra física (agarrar, empurrar), use regras de D&D 5e (Atletismo vs Acrobacia/Força).
+    3. Se for algo impossível, retorne is_allowed=False.
+    4. Em 'dice_formula', retorne APENAS a string de rolagem (ex: '1d20+5'). Se for auto-sucesso ou custo, use '0'.
+    </INSTRUÇÕES>
+    """)
+
 def _find_ability_rule(intent: str) -> str:
     """Procura se a intenção cita alguma habilidade cadastrada."""
     intent_lower = intent.lower()
@@ -62,10 +77,7 @@ def resolve_action(player: dict, intent: str) -> dict:
         rag_context = ""
 
     # Monta o Prompt
-    system_msg = SystemMessage(content=f"""
-    Você é o JUIZ DE REGRAS (Game Master) de um RPG Dark Fantasy.
-    Sua função é traduzir a narração do jogador em MECÂNICA DE DADOS.
-
+    system_msg = RULER_PROMPT.system(f"""
     <CONTEXTO DO JOGADOR>
     Nome: {player.get('name')}
     Classe: {player.get('class_name')}
@@ -76,13 +88,6 @@ def resolve_action(player: dict, intent: str) -> dict:
     {ability_context}
     {rag_context}
     </BIBLIOTECA>
-
-    <INSTRUÇÕES>
-    1. Se o jogador usou uma Habilidade Oficial (listada acima), USE EXATAMENTE os dados dela.
-       - Ex: Se "Juramento de Sangue" diz "Gasta 5 HP", o efeito deve ser "Gasta 5 HP, Ganha Buff".
-    2. Se for uma manobra física (agarrar, empurrar), use regras de D&D 5e (Atletismo vs Acrobacia/Força).
-    3. Se for algo impossível, retorne is_allowed=False.
-    4. Em 'dice_formula', retorne APENAS a string de rolagem (ex: '1d20+5'). Se for auto-sucesso ou custo, use '0'.
     """)
 
     # 2. Chamada da IA
@@ -90,7 +95,7 @@ def resolve_action(player: dict, intent: str) -> dict:
     
     try:
         # Structured Output para garantir o JSON
-        judge = llm.with_structured_output(Ruling)
+        judge = llm.with_structured_output(Ruling).cached("ruler")
         res = judge.invoke([system_msg, HumanMessage(content=intent)])
         
         print(f"⚖️ [RULER] Decisão: {res.dice_formula} | Efeito: {res.mechanical_effect}")
@@ -4,9 +4,13 @@ from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from pydantic import BaseModel, Field
 
 from agents.npc import generate_new_npc
+from context_builder import Section, build_context
 from llm_setup import get_llm
+from prompt_prefix import register_prefix
 from rag import query_rag
 from state import GameState
+from tier_policy import choose_tier
+from turn_budget import CANNED_CONTINUATION, RAG_MIN_BUDGET, TurnBudget
 
 class StoryUpdate(BaseModel):
     narrative: str = Field(description="O texto narrativo da resposta.")
@@ -26,9 +30,26 @@ def _with_new_npc(npcs: Dict[str, Dict], new_name: str, loc: str, narrative_text
     }
     return new_npcs
 
+# Parte fixa do prompt (prefixo estável para o cache do provider); cena, memória e lore vêm depois
+STORYTELLER_PROMPT = register_prefix("storyteller", """
+    <PERSONA>
+    Você é o Narrador (Mestre) de um RPG.
+    </PERSONA>
+
+    <INSTRUÇÕES>
+    - Responda em 2 a 3 parágrafos.
+    - Termine com opções ou pergunta para ação.
+    - Se introduzir NPC novo, adicione em 'introduced_npcs'.
+    </INSTRUÇÕES>
+    """)
+
 def storyteller_node(state: GameState):
     messages = state.get("messages", [])
     if not messages: return {"messages": [AIMessage(content="Comece a história.")]}
+
+    budget = TurnBudget(state, "storyteller")
+    if budget.exhausted():
+        return {"messages": [AIMessage(content=CANNED_CONTINUATION)], **budget.updates()}
     
     last_user_input = messages[-1].content if isinstance(messages[-1], HumanMessage) else ""
     world = dict(state.get("world", {}))
@@ -39,47 +60,49 @@ def storyteller_node(state: GameState):
     game_id = state.get("game_id")
     narrative_summary = state.get("narrative_summary", "")
     
-    try:
-        # Busca Lore Global + Memória da Sessão
-        lore_context = query_rag(f"{loc} {last_user_input}", index_name="lore", game_id=game_id)
-    except Exception:
-        lore_context = ""
-
-    if not lore_context: lore_context = "Dark Fantasy Genérica."
+    lore_context = ""
+    if budget.allow(RAG_MIN_BUDGET, "no_rag"):
+        try:
+            # Busca Lore Global + Memória da Sessão
+            lore_context = query_rag(f"{loc} {last_user_input}", index_name="lore", game_id=game_id)
+        except Exception:
+            lore_context = ""
 
     campaign_plan = state.get("campaign_plan") or {}
     beats = [dict(beat) for beat in campaign_plan.get("beats", [])]
     current_step = campaign_plan.get("current_step", 0)
     active_step = beats[current_step].get("description") if current_step < len(beats) else "Clímax ou Ação Livre."
 
-    llm = get_llm(temperature=0.7)
+    llm = get_llm(temperature=0.7, tier=choose_tier("storyteller", budget=budget))  # Primeira cena: SMART
     
     # PROMPT ATUALIZADO
-    sys = SystemMessage(content=f"""
-    <PERSONA>
-    Você é o Narrador (Mestre) de um RPG.
+    def prompt(summary: str, lore: str) -> str:
+        return STORYTELLER_PROMPT.render(f"""
+    <CENA>
     Local Atual: {loc}.
     NPCs na cena: {existing_npcs}.
     Objetivo Atual: {active_step}
-    </PERSONA>
+    </CENA>
 
     <MEMORIA_RECENTE>
-    Resumo dos fatos anteriores: {narrative_summary}
+    Resumo dos fatos anteriores: {summary}
     </MEMORIA_RECENTE>
 
     <LORE_E_FATOS_PASSADOS>
-    {lore_context}
+    {lore}
     </LORE_E_FATOS_PASSADOS>
-
-    <INSTRUÇÕES>
-    - Responda em 2 a 3 parágrafos.
-    - Termine com opções ou pergunta para ação.
-    - Se introduzir NPC novo, adicione em 'introduced_npcs'.
     """)
 
+    # Orçamento de tokens: resumo > histórico recente > lore (chunks por relevância)
+    ctx = build_context("storyteller", messages, fixed=prompt("", ""), sections={
+        "summary": Section(narrative_summary, priority=1),
+        "lore": Section(lore_context, priority=3, chunks=True),
+    })
+    sys = SystemMessage(content=prompt(ctx.text("summary"), ctx.text("lore", "Dark Fantasy Genérica.")))
+
     try:
-        story_engine = llm.with_structured_output(StoryUpdate).with_retry(stop_after_attempt=3)
-        update = story_engine.invoke([sys] + messages[-6:]) # Contexto reduzido
+        story_engine = llm.with_structured_output(StoryUpdate).with_retry(stop_after_attempt=budget.retry_attempts(3)).hedged("storyteller")
+        update = story_engine.invoke([sys] + ctx.history)
 
         narrative_text = update.narrative
         
@@ -91,8 +114,10 @@ def storyteller_node(state: GameState):
 
         npcs = state.get("npcs", {})
         new_npcs = npcs
-        for new_name in update.introduced_npcs:
-            new_npcs = _with_new_npc(new_npcs, new_name, loc, narrative_text)
+        # Ficha de NPC é outra chamada de LLM: sem tempo, o NPC fica só na narrativa
+        if update.introduced_npcs and budget.allow(RAG_MIN_BUDGET, "skip_npc_sheets"):
+            for new_name in update.introduced_npcs:
+                new_npcs = _with_new_npc(new_npcs, new_name, loc, narrative_text)
 
         return {
             "messages": [AIMessage(content=narrative_text)],
@@ -100,8 +125,9 @@ def storyteller_node(state: GameState):
             "world": world,
             "campaign_plan": campaign_plan,
             "needs_replan": needs_replan,
+            **budget.updates(),
         }
 
     except Exception as e:
         print(f"[STORYTELLER ERROR] {e}")
-        return {"messages": [AIMessage(content="O destino é incerto... (Erro AI).")]}
\ No newline at end of file
+        return {"messages": [AIMessage(content="O destino é incerto... (Erro AI).")], **budget.updates()}
\ No newline at end of file
@@ -7,10 +7,14 @@ import sys
 import os
 import uvicorn
 import uuid # <--- Necessário para gerar IDs de sessão
-from fastapi import FastAPI, HTTPException
+import json
+import asyncio
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Any, Callable, Dict, List, Optional
 from langchain_core.messages import HumanMessage, SystemMessage
 
 # Adiciona raiz ao path
@@ -18,9 +22,21 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Imports do seu motor
 from main import app as game_graph
-from persistence import save_game_state, load_game_state, _serialize_messages
+from persistence import save_game_state, load_game_state, get_save_path, _serialize_messages, latest_game_id, query_games
 from character_creator import create_player_character
-from gamedata import CLASSES, load_json_data
+from gamedata import CLASSES, ORIGINS
+from data_bundle import etag_matches, get_bundle
+from jobs import ProgressFn, job_manager
+from admission import PRIORITY_BACKGROUND, PRIORITY_NEW_GAME, PRIORITY_TURN, Overloaded, admission
+from metrics import metrics
+from turn_budget import start_turn, use_turn
+from cancellation import CancelScope, TurnCancelled, check_cancelled, use_scope
+from agents.bestiary import generate_new_enemy
+from archive_queue import discard_pending_archive, merge_pending_archive, peek_pending_archive, submit_archive
+from snapshots import load_history, load_snapshot, record_snapshot, truncate_history
+from rag import rollback_session_memory
+from state_sync import diff_since, state_version
+from idempotency import IdempotencyConflict, fingerprint, idempotency_store
 
 # --- CONFIGURAÇÃO DA API ---
 app = FastAPI(
@@ -37,6 +53,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Prazo de admissão para jobs (não há cliente HTTP esperando a resposta)
+JOB_ADMISSION_DEADLINE = float(os.getenv("JOB_ADMISSION_DEADLINE_SECONDS", "300"))
+# Intervalo de checagem de desconexão do cliente durante o turno
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
+
 # --- MODELOS DE DADOS (DTOs) ---
 class CreateCharacterRequest(BaseModel):
     name: str
@@ -49,6 +70,7 @@ class CreateCharacterRequest(BaseModel):
 class ActionRequest(BaseModel):
     input_text: str
     game_id: Optional[str] = None # Opcional: permite especificar qual save carregar
+    since_version: Optional[str] = None # Opcional: versão local do cliente -> resposta traz o patch
 
 class GameResponse(BaseModel):
     game_id: str # <--- Novo: Frontend precisa saber o ID
@@ -59,6 +81,9 @@ class GameResponse(BaseModel):
     current_location: str
     narrative_summary: str # <--- Novo: Frontend pode mostrar o resumo
     last_turn_log: List[Dict[str, Any]]
+    version: Optional[str] = None # Versão do estado após o turno (ver state_sync)
+    patch: Optional[List[Dict[str, Any]]] = None # JSON-Patch desde since_version (se pedido)
+    degradations: List[str] = [] # Atalhos aplicados para caber no prazo do turno (turn_budget)
 
 # --- HELPER: FORMATA RESPOSTA ---
 def format_response(state: dict) -> GameResponse:
@@ -91,7 +116,8 @@ def format_response(state: dict) -> GameResponse:
         inventory=state["player"]["inventory"],
         current_location=state["world"]["current_location"],
         narrative_summary=state.get("narrative_summary", ""),
-        last_turn_log=_serialize_messages(state["messages"][-5:]) 
+        last_turn_log=_serialize_messages(state["messages"][-5:]),
+        degradations=state.get("degradations") or []
     )
 
 # --- ENDPOINTS ---
@@ -100,39 +126,90 @@ def format_response(state: dict) -> GameResponse:
 def health_check():
     return {"status": "online", "engine": "RPG IA v9.0 Hybrid Memory"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Métricas do processo no formato do Prometheus."""
+    return metrics.render()
+
 @app.get("/data/options")
 def get_creation_options():
-    origins = load_json_data("origins.json")
     return {
-        "races": [r["name"] for r in origins.get("races", [])],
+        "races": [r["name"] for r in ORIGINS.get("races", [])],
         "classes": list(CLASSES.keys()),
-        "regions": [r["name"] for r in origins.get("regions", [])]
+        "regions": [r["name"] for r in ORIGINS.get("regions", [])]
+    }
+
+@app.get("/data/bundle")
+def get_data_bundle(request: Request):
+    """Classes, habilidades, origens e artefatos num pacote versionado (ETag + gzip)."""
+    bundle = get_bundle()
+    headers = {
+        "ETag": bundle.etag,
+        "Cache-Control": "public, no-cache",  # Sempre revalida; a revalidação custa um 304
+        "Vary": "Accept-Encoding",
     }
+    if etag_matches(request.headers.get("if-none-match"), bundle.etag):
+        return Response(status_code=304, headers=headers)
+
+    if "gzip" in request.headers.get("accept-encoding", "").lower():
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=bundle.gzipped, media_type="application/json", headers=headers)
+    return Response(content=bundle.raw, media_type="application/json", headers=headers)
+
+@app.get("/games")
+def list_games(
+    player: Optional[str] = None,
+    class_name: Optional[str] = None,
+    min_level: Optional[int] = None,
+    max_level: Optional[int] = None,
+    location: Optional[str] = None,
+    updated_since: Optional[float] = Query(None, description="Epoch em segundos"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """Lista os jogos salvos (resumos leves vindos do índice, sem abrir os saves)."""
+    return query_games(
+        player=player, class_name=class_name, min_level=min_level, max_level=max_level,
+        location=location, updated_since=updated_since, offset=offset, limit=limit,
+    )
 
 @app.get("/game/state")
 def get_current_state(game_id: Optional[str] = None):
     """
     Carrega o jogo. Se game_id for passado, carrega aquele especifico.
-    Caso contrario, carrega o ultimo modificado.
+    Caso contrario, carrega o ultimo salvo (segundo o índice de saves).
     """
-    # A lógica de carregar arquivo especifico deve ser implementada no persistence futuramente
-    # Por enquanto, load_game_state carrega o mais recente se não passarmos nada
-    # Se você implementou o load_game_state(specific_file), usaria aqui
-    
-    file_to_load = None
-    if game_id:
-        file_to_load = f"saves/{game_id}.json"
-        
-    state = load_game_state(file_to_load)
+    game_id = game_id or latest_game_id()
+    if not game_id:
+        raise HTTPException(status_code=404, detail="Nenhum jogo salvo encontrado.")
+
+    state = load_game_state(get_save_path(game_id))
     
     if not state:
         raise HTTPException(status_code=404, detail="Nenhum jogo salvo encontrado.")
+    # Mostra o resumo já pronto sem esperar o arquivista nem consumir (o próximo turno mescla)
+    peek_pending_archive(state)
     return format_response(state)
 
-@app.post("/game/new", response_model=GameResponse)
+@app.post("/game/new", status_code=202)
 def new_game(req: CreateCharacterRequest):
-    """Cria um novo personagem e inicia a campanha com ID único."""
+    """
+    Cria um novo personagem e inicia a campanha com ID único.
+    Roda como job: acompanhe em GET /jobs/{job_id} (ou /jobs/{job_id}/events);
+    o resultado final é o GameResponse do turno de abertura.
+    """
+    def run(report: ProgressFn):
+        # Job não tem timeout de proxy: espera mais, mas cede a vez aos turnos em andamento
+        report(0.0, "Aguardando vaga")
+        with admission.admit(PRIORITY_NEW_GAME, deadline=JOB_ADMISSION_DEADLINE):
+            return _create_game(req, report).model_dump()
+
+    job = job_manager.submit("new_game", run)
+    return _job_accepted(job)
+
+def _create_game(req: CreateCharacterRequest, report: ProgressFn) -> GameResponse:
     print(f"Criando personagem: {req.name}")
+    report(0.05, "Criando personagem")
     
     char_input = {
         "name": req.name,
@@ -143,6 +220,7 @@ def new_game(req: CreateCharacterRequest):
         "level": req.level
     }
     final_char = create_player_character(char_input)
+    report(0.4, "Personagem criado. Gerando cena de abertura")
     
     # Gera ID único
     new_game_id = str(uuid.uuid4())
@@ -196,43 +274,211 @@ def new_game(req: CreateCharacterRequest):
 
     # 3. Roda o Grafo
     try:
-        final_state = game_graph.invoke(initial_state)
+        with use_turn(start_turn(initial_state)):
+            final_state = game_graph.invoke(initial_state)
+        report(0.9, "Salvando jogo")
+        submit_archive(final_state)
         save_game_state(final_state)
-        return format_response(final_state)
+        record_snapshot(final_state)
+        response = format_response(final_state)
+        response.version = state_version(new_game_id)
+        return response
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail=str(e))
 
+# --- JOBS (operações longas) ---
+
+class BulkBestiaryRequest(BaseModel):
+    names: List[str]
+    context: Optional[str] = ""
+
+def _job_accepted(job) -> Dict[str, Any]:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+    }
+
+@app.post("/bestiary/bulk", status_code=202)
+def bulk_generate_enemies(req: BulkBestiaryRequest):
+    """Gera (ou reaproveita do bestiário) vários inimigos em background."""
+    def run(report: ProgressFn):
+        results = {}
+        for i, name in enumerate(req.names):
+            report(i / len(req.names), f"Gerando {name}")
+            try:
+                # Um slot por inimigo: o lote não segura vagas enquanto há turnos esperando
+                with admission.admit(PRIORITY_BACKGROUND, deadline=JOB_ADMISSION_DEADLINE):
+                    results[name] = {"id": generate_new_enemy(name, req.context or "").get("id")}
+            except Exception as e:  # noqa: BLE001 - um inimigo com falha não cancela o lote
+                results[name] = {"error": str(e)}
+        return results
+
+    if not req.names:
+        raise HTTPException(status_code=422, detail="Informe ao menos um nome.")
+    return _job_accepted(job_manager.submit("bestiary_bulk", run))
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado (ou expirado).")
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/events")
+def stream_job(job_id: str):
+    """Server-Sent Events: um evento 'progress' por mudança e 'done' no final."""
+    if not job_manager.get(job_id):
+        raise HTTPException(status_code=404, detail="Job não encontrado (ou expirado).")
+
+    def events():
+        for snapshot in job_manager.watch(job_id):
+            if snapshot is None:
+                yield ": keep-alive\n\n"
+                continue
+            event = "done" if snapshot["status"] in ("succeeded", "failed") else "progress"
+            yield f"event: {event}\ndata: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.post("/game/action", response_model=GameResponse)
-def game_action(req: ActionRequest):
-    """Envia uma ação do jogador."""
-    
-    # Tenta carregar pelo ID se fornecido, ou o ultimo
-    file_to_load = None
-    if req.game_id:
-        file_to_load = f"saves/{req.game_id}.json"
+async def game_action(
+    req: ActionRequest,
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    """
+    Envia uma ação do jogador.
+    Com Idempotency-Key, retries da mesma ação não rodam o grafo de novo.
+    Sem a chave, o turno é cancelado se o cliente desconectar no meio.
+    """
+    if not idempotency_key:
+        return await _run_cancellable(request, lambda scope: _admitted_action(req, scope))
+
+    # Escopo por jogo: a mesma chave em jogos diferentes não colide.
+    # Turnos com chave não são cancelados na desconexão: o retry vai se anexar a eles.
+    key = f"{req.game_id or ''}:{idempotency_key}"
+    try:
+        result, replayed = await run_in_threadpool(
+            idempotency_store.run,
+            key, lambda: _admitted_action(req), fingerprint(req.game_id, req.input_text, req.since_version)
+        )
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
 
-    state = load_game_state(file_to_load)
+async def _run_cancellable(request: Request, fn: Callable[[CancelScope], Any]) -> Any:
+    """Roda `fn(scope)` numa thread e cancela o escopo se o cliente desconectar."""
+    scope = CancelScope("turn")
+    task = asyncio.ensure_future(run_in_threadpool(fn, scope))
+    while not task.done():
+        await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+        if not task.done() and await request.is_disconnected():
+            scope.cancel("cliente desconectou")
+            break
+    try:
+        return await task
+    except TurnCancelled:
+        # 499 (Client Closed Request): ninguém vai ler, mas fica registrado nos logs de acesso
+        raise HTTPException(status_code=499, detail="Turno cancelado: cliente desconectou.")
+
+def _admitted_action(req: ActionRequest, scope: Optional[CancelScope] = None) -> GameResponse:
+    """Roda o turno dentro do controle de admissão (503 rápido em sobrecarga)."""
+    try:
+        with admission.admit(PRIORITY_TURN), use_scope(scope or CancelScope("turn")):
+            return _run_action(req)
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except TurnCancelled:
+        # Turno parcial descartado: nada foi salvo (save/snapshot/arquivista vêm depois do check)
+        metrics.inc("turns_cancelled_total")
+        raise
+
+def _run_action(req: ActionRequest) -> GameResponse:
+    # Tenta carregar pelo ID se fornecido, ou o ultimo salvo
+    game_id = req.game_id or latest_game_id()
+    state = load_game_state(get_save_path(game_id)) if game_id else None
     
     if not state:
         raise HTTPException(status_code=404, detail="Jogo não encontrado.")
 
+    # Arquivamento diferido: o resumo do turno anterior entra antes deste turno
+    merge_pending_archive(state)
+
     # Adiciona Input
     user_msg = HumanMessage(content=req.input_text)
     state["messages"].append(user_msg)
-    
-    if len(state["messages"]) > 20:
-        state["messages"] = state["messages"][-20:]
+    # O recorte do histórico é feito pelo reducer de GameState.messages (state.bounded_messages)
 
     # Executa Engine
     try:
-        new_state = game_graph.invoke(state)
+        with use_turn(start_turn(state)):
+            new_state = game_graph.invoke(state)
+        # Cancelado durante a última chamada: descarta antes de qualquer efeito persistente
+        check_cancelled()
+        submit_archive(new_state)
         save_game_state(new_state)
-        return format_response(new_state)
+        record_snapshot(new_state)
+        response = format_response(new_state)
+        if req.since_version:
+            delta = diff_since(new_state, req.since_version)
+            # Versão desconhecida: patch None sinaliza que o cliente deve buscar o estado completo
+            response.patch = delta["patch"]
+            response.version = delta["version"]
+        else:
+            response.version = state_version(new_state["game_id"])
+        return response
     
     except Exception as e:
         print(f"Erro na API: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/game/{game_id}/state")
+def get_state_delta(game_id: str, since: Optional[str] = None):
+    """
+    Estado do jogo para clientes com cópia local.
+    Com `since` conhecido devolve só o JSON-Patch; senão o estado completo em "full".
+    """
+    state = load_game_state(get_save_path(game_id))
+    if not state:
+        raise HTTPException(status_code=404, detail="Jogo não encontrado.")
+    return diff_since(state, since)
+
+@app.get("/game/{game_id}/history")
+def get_game_history(game_id: str):
+    """Lista os turnos disponíveis para rewind (snapshots por turno)."""
+    history = load_history(game_id)
+    if not history:
+        raise HTTPException(status_code=404, detail="Nenhum histórico para este jogo.")
+    return {
+        "game_id": game_id,
+        "turns": [
+            {"turn": e["turn"], "created_at": e["created_at"], "location": e.get("location"), "hp": e.get("hp")}
+            for e in history
+        ]
+    }
+
+@app.post("/game/{game_id}/rewind", response_model=GameResponse)
+def rewind_game(game_id: str, turn: int):
+    """Volta o jogo (save + memória da sessão) para o fim do turno informado."""
+    # Um arquivamento pendente poderia gravar fatos da linha do tempo descartada
+    discard_pending_archive(game_id)
+
+    state = load_snapshot(game_id, turn)
+    if not state:
+        raise HTTPException(status_code=404, detail=f"Turno {turn} não está no histórico.")
+
+    rollback_session_memory(game_id, turn)
+    truncate_history(game_id, turn)
+    save_game_state(state)
+    response = format_response(state)
+    response.version = state_version(game_id, turn)
+    return response
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
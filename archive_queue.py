@@ -0,0 +1,170 @@
+"""
+archive_queue.py
+Arquivamento Diferido (fora do caminho crítico do turno).
+Cada game_id tem uma fila FIFO própria: os jobs de um mesmo jogo rodam em ordem,
+um de cada vez, e o resumo produzido é mesclado no estado antes do próximo turno.
+Resultado que ninguém mescla (jogo abandonado) expira após ARCHIVIST_RESULT_TTL; o
+cursor salvo do arquivista não avançou, então a política refaz o resumo se o jogo voltar.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional, Set
+
+from agents.archivist import archive_now, archive_tracking, archive_trigger
+from turn_budget import use_turn
+
+# --- CONFIGURAÇÃO ---
+# ARCHIVIST_MODE=deferred tira o arquivista do grafo e usa a fila em background.
+DEFERRED_ARCHIVAL = os.getenv("ARCHIVIST_MODE", "inline").lower() == "deferred"
+ARCHIVIST_WORKERS = int(os.getenv("ARCHIVIST_WORKERS", "2"))
+MERGE_TIMEOUT = float(os.getenv("ARCHIVIST_MERGE_TIMEOUT", "30"))
+RESULT_TTL = float(os.getenv("ARCHIVIST_RESULT_TTL", "3600"))  # Segundos até descartar resultado não mesclado
+
+# Campos que o arquivista lê. O snapshot copia só isso para não segurar o estado inteiro.
+_SNAPSHOT_KEYS = ("game_id", "narrative_summary", "archivist_last_run", "archivist_last_message", "world")
+
+
+def _snapshot(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Cópia rasa e isolada do que o arquivista precisa (o turno seguinte pode mutar o estado)."""
+    snap = {k: state.get(k) for k in _SNAPSHOT_KEYS}
+    snap["world"] = dict(state.get("world") or {})
+    snap["messages"] = list(state.get("messages", []))
+    return snap
+
+
+class ArchiveQueue:
+    """Fila de arquivamento por game_id com garantia de ordem e merge explícito."""
+
+    def __init__(self, archive_fn: Callable[[Dict[str, Any]], Dict[str, Any]], max_workers: int = 2,
+                 result_ttl: float = RESULT_TTL):
+        self._archive_fn = archive_fn
+        self._result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="archivist")
+        self._cond = threading.Condition()
+        self._queues: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._running: Set[str] = set()
+        self._results: Dict[str, Dict[str, Any]] = {}  # Updates prontos aguardando merge
+        self._stored_at: Dict[str, float] = {}  # Quando cada resultado foi gravado (monotonic)
+
+    def submit(self, state: Dict[str, Any]) -> bool:
+        """Enfileira o arquivamento do turno. Retorna False se o estado não tiver game_id."""
+        game_id = state.get("game_id")
+        if not game_id: return False
+
+        snapshot = _snapshot(state)
+        with self._cond:
+            self._evict_expired()
+            self._queues.setdefault(game_id, deque()).append(snapshot)
+            # Só um worker por jogo: é isso que garante a ordem dos resumos
+            if game_id not in self._running:
+                self._running.add(game_id)
+                self._executor.submit(self._drain, game_id)
+        return True
+
+    def _drain(self, game_id: str):
+        while True:
+            with self._cond:
+                queue = self._queues.get(game_id)
+                if not queue:
+                    self._queues.pop(game_id, None)
+                    self._running.discard(game_id)
+                    self._cond.notify_all()
+                    return
+                snapshot = queue.popleft()
+                # Encadeia com o resultado anterior ainda não mesclado (resumo incremental)
+                snapshot.update(self._results.get(game_id, {}))
+
+            try:
+                # O jogo do snapshot vira o turno atual: as chamadas do arquivista são cobradas dele
+                with use_turn(snapshot):
+                    updates = self._archive_fn(snapshot) or {}
+            except Exception as e:  # noqa: BLE001 - o worker nunca pode morrer
+                print(f"⚠️ [ARCHIVE QUEUE] Falha ao arquivar '{game_id}': {e}")
+                updates = {}
+
+            if updates:
+                with self._cond:
+                    self._results.setdefault(game_id, {}).update(updates)
+                    self._stored_at[game_id] = time.monotonic()
+                    self._evict_expired()
+
+    def _evict_expired(self):
+        """Descarta resultados que ninguém mesclou dentro do TTL (chamar com o lock)."""
+        cutoff = time.monotonic() - self._result_ttl
+        for game_id in [g for g, at in self._stored_at.items() if at < cutoff and g not in self._running]:
+            self._results.pop(game_id, None)
+            self._stored_at.pop(game_id, None)
+
+    def is_pending(self, game_id: str) -> bool:
+        with self._cond:
+            return game_id in self._running
+
+    def wait(self, game_id: str, timeout: Optional[float] = MERGE_TIMEOUT) -> bool:
+        """Bloqueia até a fila do jogo esvaziar. Retorna False em timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: game_id not in self._running, timeout=timeout)
+
+    def collect(self, game_id: str, timeout: Optional[float] = MERGE_TIMEOUT, consume: bool = True) -> Dict[str, Any]:
+        """Espera os jobs do jogo terminarem e devolve os updates acumulados."""
+        if not game_id: return {}
+        if not self.wait(game_id, timeout):
+            print(f"⚠️ [ARCHIVE QUEUE] Timeout aguardando arquivista de '{game_id}'. Seguindo sem merge.")
+        with self._cond:
+            if consume:
+                self._stored_at.pop(game_id, None)
+                return self._results.pop(game_id, {})
+            return dict(self._results.get(game_id, {}))
+
+    def peek(self, game_id: str) -> Dict[str, Any]:
+        """Updates já prontos do jogo, sem esperar jobs em andamento e sem consumir."""
+        if not game_id: return {}
+        with self._cond:
+            self._evict_expired()
+            return dict(self._results.get(game_id, {}))
+
+    def merge_into(self, state: Dict[str, Any], consume: bool = True) -> Dict[str, Any]:
+        """Aplica no estado (in-place) o resultado pendente do arquivista e o retorna."""
+        if state:
+            state.update(self.collect(state.get("game_id"), consume=consume))
+        return state
+
+
+# Instância global (mesmo padrão do grafo em main.py)
+archive_queue = ArchiveQueue(archive_now, max_workers=ARCHIVIST_WORKERS)
+
+
+def submit_archive(state: Dict[str, Any]) -> bool:
+    """
+    Atalho: aplica a política do arquivista e enfileira se ela disparar.
+    Os campos de acompanhamento da política são gravados no estado (in-place),
+    então chame antes de salvar o turno.
+    """
+    if not DEFERRED_ARCHIVAL or not state: return False
+    reason = archive_trigger(state)
+    if reason:
+        print(f"🗄️ [ARCHIVIST] Enfileirado por: {reason}")
+        archive_queue.submit(state)
+    state.update(archive_tracking(state))
+    return bool(reason)
+
+
+def merge_pending_archive(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Atalho: mescla o resumo pendente antes de processar o próximo turno do jogo."""
+    if not DEFERRED_ARCHIVAL or not state: return state
+    return archive_queue.merge_into(state)
+
+
+def peek_pending_archive(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Atalho para leitura: aplica o resumo já pronto sem bloquear nem consumir."""
+    if not DEFERRED_ARCHIVAL or not state: return state
+    state.update(archive_queue.peek(state.get("game_id")))
+    return state
+
+
+def discard_pending_archive(game_id: str):
+    """Espera o arquivamento em andamento do jogo e descarta o resultado (usado no rewind)."""
+    if DEFERRED_ARCHIVAL and game_id:
+        archive_queue.collect(game_id)
@@ -0,0 +1,71 @@
+"""
+cancellation.py
+Cancelamento Cooperativo de Turnos.
+A API abre um CancelScope por turno e o marca como cancelado quando o cliente
+desconecta. O escopo fica num contextvar, então qualquer código do turno
+(nós do grafo, wrapper de LLM em llm_setup) pode checar sem receber parâmetro:
+a próxima chamada de LLM levanta TurnCancelled em vez de ir ao provider, e a
+API descarta o turno parcial (sem save, snapshot ou arquivamento).
+"""
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from metrics import metrics
+
+metrics.describe("turns_cancelled_total", "Turnos descartados porque o cliente desconectou")
+metrics.describe("llm_calls_cancelled_total", "Chamadas de LLM evitadas por turno cancelado")
+metrics.describe("llm_calls_discarded_total", "Chamadas de LLM concluídas depois do cancelamento (resultado descartado)")
+
+
+class TurnCancelled(BaseException):
+    """
+    O turno foi cancelado (ex.: cliente desconectou).
+    Herda de BaseException (como asyncio.CancelledError) para atravessar os
+    `except Exception` dos nós e encerrar o grafo em vez de virar mensagem de erro.
+    """
+
+
+class CancelScope:
+    def __init__(self, name: str = "turn"):
+        self.name = name
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+
+    def cancel(self, reason: str = "cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+            print(f"🛑 [CANCEL] {self.name}: {reason}")
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self):
+        if self.cancelled:
+            raise TurnCancelled(f"{self.name} cancelado: {self.reason}")
+
+
+_current: ContextVar[Optional[CancelScope]] = ContextVar("cancel_scope", default=None)
+
+
+@contextmanager
+def use_scope(scope: CancelScope):
+    """Torna `scope` o escopo atual (também nas threads que copiam o contexto, como as do LangGraph)."""
+    token = _current.set(scope)
+    try:
+        yield scope
+    finally:
+        _current.reset(token)
+
+
+def current_scope() -> Optional[CancelScope]:
+    return _current.get()
+
+
+def check_cancelled():
+    """Levanta TurnCancelled se o turno atual foi cancelado. Sem escopo, não faz nada."""
+    scope = _current.get()
+    if scope is not None: scope.check()
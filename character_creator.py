@@ -4,10 +4,11 @@ Gera a ficha do personagem baseada em História, Nível e Região.
 Versão V6.0: Híbrida (IA para Criatividade + JSON para Regras Oficiais).
 """
 from typing import Dict, Any, List
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import HumanMessage
 from pydantic import BaseModel, Field
 
 from llm_setup import get_llm, ModelTier
+from prompt_prefix import register_prefix
 
 # --- IMPORTAÇÕES ESSENCIAIS ---
 try:
@@ -43,6 +44,16 @@ class BackstoryAnalysis(BaseModel):
     archetype_summary: str
     key_traits: List[str]
 
+# --- PROMPT (fixo: prefixo estável para o cache do provider; classe, nível e região vêm depois) ---
+STATS_PROMPT = register_prefix("character_stats", """
+    Você é um Motor de Regras para RPG.
+
+    TAREFA:
+    1. Gere atributos (str, dex...) coerentes com a classe e o NÍVEL informados.
+    2. Gere um inventário temático da REGIÃO informada.
+    3. Sugira 2 habilidades extras (flavor) que combinem com a classe.
+    """)
+
 # --- LÓGICA AUXILIAR ---
 
 def _get_mod(score: int) -> int:
@@ -99,16 +110,11 @@ def create_player_character(user_input: Dict[str, Any]) -> Dict[str, Any]:
     # 3. Geração de Stats via IA
     llm = get_llm(temperature=0.6, tier=ModelTier.SMART)
     
-    system_msg = SystemMessage(content=f"""
-    Você é um Motor de Regras para RPG.
-    
+    system_msg = STATS_PROMPT.system(f"""
     CONTEXTO DO MUNDO: {region_lore}
     CLASSE: {p_class} (Atributo Principal Sugerido: Consulte o arquétipo).
-    
-    TAREFA:
-    1. Gere atributos (str, dex...) coerentes com a classe e nível {level}.
-    2. Gere um inventário temático da região {region}.
-    3. Sugira 2 habilidades extras (flavor) que combinem com a classe.
+    NÍVEL: {level}
+    REGIÃO: {region}
     """)
 
     human_msg = HumanMessage(content=f"Personagem: {name}, {race} {p_class}. Conceito: {backstory}")
@@ -0,0 +1,181 @@
+"""
+context_builder.py
+Montagem de Contexto com Orçamento de Tokens por Nó.
+Em vez de cada agente fatiar o histórico com uma constante (messages[-3:],
+[-6:]...) e colar RAG de tamanho desconhecido no prompt, o nó declara as
+seções com prioridade e o builder preenche o orçamento (CONTEXT_BUDGET_<NÓ>):
+1. texto fixo do prompt (instruções) e a última mensagem do jogador: sempre;
+2. seções por prioridade (menor = mais importante); chunks de lore na ordem de
+   relevância do RAG, duplicados descartados, o último cortado se não couber;
+3. histórico do mais novo para o mais antigo, contíguo, até o teto do nó
+   (ou do mais antigo para o mais novo, oldest_first, para quem consome o
+   histórico em lotes e precisa saber até onde chegou, como o arquivista).
+O tamanho final vai para o log e para a métrica prompt_tokens{node}.
+Estimador local: ~CONTEXT_CHARS_PER_TOKEN caracteres por token (sem tokenizer).
+"""
+import math
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from metrics import metrics
+
+# --- CONFIGURAÇÃO ---
+CONTEXT_CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "3.6"))
+MESSAGE_OVERHEAD_TOKENS = 4  # Papel + delimitadores de cada mensagem
+
+# nó -> (orçamento de tokens, teto de mensagens do histórico)
+NODE_BUDGETS: Dict[str, Tuple[int, int]] = {
+    "router": (int(os.getenv("CONTEXT_BUDGET_ROUTER", "1200")), 4),
+    "combat_scan": (int(os.getenv("CONTEXT_BUDGET_COMBAT_SCAN", "1500")), 6),
+    "npc_actor": (int(os.getenv("CONTEXT_BUDGET_NPC_ACTOR", "2500")), 8),
+    "storyteller": (int(os.getenv("CONTEXT_BUDGET_STORYTELLER", "4000")), 10),
+    "archivist": (int(os.getenv("CONTEXT_BUDGET_ARCHIVIST", "8000")), 24),
+}
+DEFAULT_BUDGET = (int(os.getenv("CONTEXT_BUDGET_DEFAULT", "3000")), 8)
+CHUNK_SEPARATOR = "\n---\n"  # O mesmo que rag.query_rag usa entre chunks
+
+metrics.describe("prompt_tokens", "Tamanho estimado do prompt montado, por nó")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa rápida de tokens (caracteres / CONTEXT_CHARS_PER_TOKEN)."""
+    return math.ceil(len(text) / CONTEXT_CHARS_PER_TOKEN) if text else 0
+
+
+def message_tokens(message: BaseMessage) -> int:
+    return estimate_tokens(str(message.content)) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _trim(text: str, tokens: int) -> str:
+    """Corta `text` para caber em `tokens`, na última quebra de frase/palavra."""
+    limit = int(tokens * CONTEXT_CHARS_PER_TOKEN)
+    if len(text) <= limit: return text
+    cut = text[:limit]
+    boundary = max(cut.rfind(". "), cut.rfind("\n"))
+    if boundary < limit // 2: boundary = cut.rfind(" ")
+    return (cut[:boundary + 1] if boundary > 0 else cut).rstrip() + " […]"
+
+
+class Section:
+    """Trecho dinâmico do prompt. `chunks=True` divide pelo separador do RAG e ranqueia por ordem."""
+
+    def __init__(self, text: str, priority: int = 2, chunks: bool = False, trim: bool = True,
+                 max_tokens: Optional[int] = None):
+        self.text = text or ""
+        self.priority = priority
+        self.chunks = chunks
+        self.trim = trim
+        self.max_tokens = max_tokens  # Teto da seção: alta prioridade sem engolir o orçamento todo
+
+    def parts(self) -> List[str]:
+        if not self.chunks: return [self.text] if self.text.strip() else []
+        seen, parts = set(), []
+        for chunk in self.text.split(CHUNK_SEPARATOR):
+            key = chunk.strip()
+            if key and key not in seen:
+                seen.add(key)
+                parts.append(key)
+        return parts
+
+
+class BuiltContext:
+    def __init__(self, node: str, budget: int):
+        self.node = node
+        self.budget = budget
+        self.sections: Dict[str, List[str]] = {}
+        self.history: List[BaseMessage] = []
+        self.tokens = 0
+        self.dropped: Dict[str, int] = {}
+
+    def text(self, name: str, default: str = "") -> str:
+        parts = self.sections.get(name)
+        return CHUNK_SEPARATOR.join(parts) if parts else default
+
+    def log(self):
+        dropped = ", ".join(f"{k} -{v}" for k, v in self.dropped.items() if v)
+        print(f"📐 [CONTEXT] {self.node}: ~{self.tokens}/{self.budget} tokens, {len(self.history)} msgs" + (f" (cortado: {dropped})" if dropped else ""))
+        metrics.observe("prompt_tokens", self.tokens, buckets=(250, 500, 1000, 2000, 4000, 8000, 16000), node=self.node)
+
+
+def _history_window(messages: Sequence[BaseMessage], available: int, max_messages: int,
+                    oldest_first: bool = False) -> Tuple[List[BaseMessage], int]:
+    """
+    Janela contígua que cabe em `available`: a mais recente ou, com `oldest_first`,
+    a mais antiga (sem cortar no meio de uma troca de ferramentas).
+    """
+    window: List[BaseMessage] = []
+    used = 0
+    for msg in (messages if oldest_first else reversed(messages)):
+        if len(window) >= max_messages: break
+        cost = message_tokens(msg)
+        if used + cost > available: break
+        if oldest_first: window.append(msg)
+        else: window.insert(0, msg)
+        used += cost
+    # ToolMessage sem a chamada que a originou (ou chamada sem o resultado) é rejeitada pelo provider
+    while window and isinstance(window[0], ToolMessage):
+        used -= message_tokens(window.pop(0))
+    while oldest_first and window and isinstance(window[-1], AIMessage) and window[-1].tool_calls:
+        used -= message_tokens(window.pop())
+    return window, used
+
+
+def build_context(node: str, messages: Sequence[BaseMessage] = (), fixed: str = "",
+                  sections: Optional[Dict[str, Section]] = None, history_priority: int = 2,
+                  budget: Optional[int] = None, max_messages: Optional[int] = None,
+                  oldest_first: bool = False) -> BuiltContext:
+    """
+    Monta o contexto do nó dentro do orçamento. `fixed` é o texto das instruções
+    (sempre entra); o histórico compete com as seções pela prioridade `history_priority`.
+    Com `oldest_first` o histórico é um lote a partir da mensagem mais antiga (sem
+    fixar a última fala do jogador); quem chama avança o cursor até built.history[-1].
+    """
+    node_budget, node_max = NODE_BUDGETS.get(node, DEFAULT_BUDGET)
+    budget = node_budget if budget is None else budget
+    max_messages = node_max if max_messages is None else max_messages
+    built = BuiltContext(node, budget)
+    sections = sections or {}
+
+    used = estimate_tokens(fixed) + MESSAGE_OVERHEAD_TOKENS
+    # Só a ponta que cabe na janela: de um LazyMessages, só essas mensagens viram BaseMessage
+    messages = list(messages[:max_messages] if oldest_first else messages[-max_messages:]) if max_messages > 0 else []
+    # A última fala do jogador é o pedido em si: nunca sai
+    pinned: List[BaseMessage] = []
+    if messages and isinstance(messages[-1], HumanMessage) and not oldest_first:
+        pinned = [messages.pop()]
+        used += message_tokens(pinned[0])
+
+    # Seções e histórico em ordem de prioridade (empate: ordem de declaração, histórico por último)
+    order = sorted(list(sections.items()) + [("__history__", None)],
+                   key=lambda item: (history_priority if item[1] is None else item[1].priority, item[1] is None))
+    for name, section in order:
+        available = max(0, budget - used)
+        if section is None:
+            window, cost = _history_window(messages, available, max_messages - len(pinned), oldest_first)
+            built.history = window
+            built.dropped["history"] = max(0, min(len(messages), max_messages - len(pinned)) - len(window))
+            used += cost
+            continue
+
+        kept, parts = [], section.parts()
+        if section.max_tokens is not None: available = min(available, section.max_tokens)
+        for part in parts:
+            cost = estimate_tokens(part)
+            if cost > available:
+                # Não coube inteiro: entra cortado (se valer a pena) e a seção termina aqui
+                if section.trim and available > 20: kept.append(_trim(part, available))
+                break
+            kept.append(part)
+            available -= cost
+        built.sections[name] = kept
+        built.dropped[name] = len(parts) - len(kept)
+        used += sum(estimate_tokens(p) for p in kept)
+
+    built.history = built.history + pinned
+    built.tokens = estimate_tokens(fixed) + MESSAGE_OVERHEAD_TOKENS \
+        + sum(estimate_tokens(p) for parts in built.sections.values() for p in parts) \
+        + sum(message_tokens(m) for m in built.history)
+    built.log()
+    return built
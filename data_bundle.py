@@ -0,0 +1,59 @@
+"""
+data_bundle.py
+Pacote de Dados Estáticos para o cliente (/data/bundle).
+Classes, habilidades, origens e artefatos num único JSON pré-serializado e
+pré-comprimido (gzip), identificado por hash de conteúdo (ETag). O pacote só é
+refeito quando gamedata.DATA_VERSION muda (reload_game_data ou save_custom_artifact).
+"""
+import gzip
+import hashlib
+import json
+import threading
+from typing import NamedTuple, Optional
+
+import gamedata
+
+
+class Bundle(NamedTuple):
+    etag: str
+    raw: bytes
+    gzipped: bytes
+
+
+_lock = threading.Lock()
+_cached: Optional[Bundle] = None
+_cached_version: Optional[int] = None
+
+
+def _build() -> Bundle:
+    payload = {
+        "classes": gamedata.CLASSES,
+        "abilities": gamedata.ABILITIES,
+        "origins": gamedata.ORIGINS,
+        "artifacts": gamedata.ARTIFACTS_DB,
+    }
+    # sort_keys: mesmo conteúdo -> mesmos bytes -> mesma ETag entre processos
+    raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    etag = '"' + hashlib.sha256(raw).hexdigest()[:32] + '"'
+    return Bundle(etag, raw, gzip.compress(raw, compresslevel=9, mtime=0))
+
+
+def get_bundle() -> Bundle:
+    """Pacote atual (reconstruído só se os dados mudaram desde o último build)."""
+    global _cached, _cached_version
+    version = gamedata.DATA_VERSION
+    if _cached is not None and _cached_version == version:
+        return _cached
+    with _lock:
+        if _cached is None or _cached_version != gamedata.DATA_VERSION:
+            _cached_version = gamedata.DATA_VERSION
+            _cached = _build()
+            print(f"📦 [DATA BUNDLE] Pacote gerado: {len(_cached.raw)} B ({len(_cached.gzipped)} B gzip)")
+        return _cached
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Compara o header If-None-Match (lista, '*' ou W/) com a ETag atual."""
+    if not if_none_match: return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
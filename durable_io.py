@@ -0,0 +1,218 @@
+"""
+durable_io.py
+Camada de Escrita Durável compartilhada por saves e bancos JSON (data/).
+- atomic_write: grava em arquivo temporário no mesmo diretório e faz os.replace,
+  então um crash no meio da escrita nunca deixa o arquivo alvo truncado.
+- fsync opcional (arquivo + diretório) controlado por DURABLE_FSYNC.
+- Group commit: rajadas de escritas no mesmo arquivo são coalescidas em uma
+  única gravação (um fsync) pela thread de flush; leituras enxergam o pendente.
+"""
+import atexit
+import json
+import os
+import stat
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+# --- CONFIGURAÇÃO ---
+DURABLE_FSYNC = os.getenv("DURABLE_FSYNC", "1") != "0"
+GROUP_COMMIT_WINDOW = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "50")) / 1000.0
+
+# os.umask só lê trocando o valor: lido uma vez no import, não a cada escrita (corrida entre threads)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _fsync_dir(directory: str):
+    """Persiste a entrada de diretório do rename (no Windows não é suportado)."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _target_mode(path: str) -> int:
+    """Modo do arquivo existente ou, para um novo, 0666 menos a umask."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+def atomic_write(path: str, data: bytes, fsync: Optional[bool] = None):
+    """Grava `data` em `path` de forma atômica (temp + rename)."""
+    fsync = DURABLE_FSYNC if fsync is None else fsync
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            if fsync: os.fsync(f.fileno())
+        # mkstemp cria com 0600: o arquivo final fica com o modo que open(..., "w") daria
+        os.chmod(tmp_path, _target_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        # Falhou antes do rename: o alvo continua intacto, só limpamos o temporário
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    if fsync: _fsync_dir(directory)
+
+
+def dumps_json(obj: Any, indent: Optional[int] = None) -> bytes:
+    return json.dumps(obj, indent=indent, ensure_ascii=False).encode("utf-8")
+
+
+class GroupCommitQueue:
+    """Coalesce escritas no mesmo arquivo: só a versão mais recente vai para o disco."""
+
+    def __init__(self, window: float = GROUP_COMMIT_WINDOW, fsync: Optional[bool] = None):
+        self.window = window
+        self.fsync = fsync
+        self._cond = threading.Condition()
+        self._pending: Dict[str, bytes] = {}
+        self._inflight: Dict[str, bytes] = {}
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"submitted": 0, "written": 0, "errors": 0}
+
+    def submit(self, path: str, data: bytes):
+        path = os.path.abspath(path)
+        with self._cond:
+            self._pending[path] = data
+            self.stats["submitted"] += 1
+            if not self._thread or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def read_pending(self, path: str) -> Optional[bytes]:
+        """Conteúdo ainda não gravado (garante read-your-writes para quem lê via read_bytes)."""
+        path = os.path.abspath(path)
+        with self._cond:
+            if path in self._pending: return self._pending[path]
+            return self._inflight.get(path)
+
+    def flush(self, path: Optional[str] = None, timeout: Optional[float] = 10.0) -> bool:
+        """Bloqueia até o arquivo (ou todos, se path=None) estar no disco."""
+        target = os.path.abspath(path) if path else None
+
+        def done():
+            if target: return target not in self._pending and target not in self._inflight
+            return not self._pending and not self._inflight
+
+        with self._cond:
+            self._cond.notify_all()
+            return self._cond.wait_for(done, timeout=timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._cond.wait_for(lambda: self._pending, timeout=5.0):
+                    self._thread = None
+                    return
+            # Janela de coalescência: escritas que chegarem agora substituem as anteriores
+            time.sleep(self.window)
+            with self._cond:
+                batch, self._pending = self._pending, {}
+                self._inflight.update(batch)
+
+            for path, data in batch.items():
+                try:
+                    atomic_write(path, data, fsync=self.fsync)
+                    self.stats["written"] += 1
+                except Exception as e:  # noqa: BLE001 - a thread de flush não pode morrer
+                    self.stats["errors"] += 1
+                    print(f"❌ [DURABLE IO] Falha ao gravar '{path}': {e}")
+                with self._cond:
+                    if self._inflight.get(path) is data: self._inflight.pop(path)
+                    self._cond.notify_all()
+
+
+# Instância global + flush no encerramento do processo
+group_commit = GroupCommitQueue()
+atexit.register(group_commit.flush)
+
+_PATH_LOCKS: Dict[str, threading.RLock] = {}
+_PATH_LOCKS_GUARD = threading.Lock()
+
+
+@contextmanager
+def path_lock(path: str):
+    """Serializa read-modify-write de um mesmo arquivo entre threads."""
+    key = os.path.abspath(path)
+    with _PATH_LOCKS_GUARD:
+        lock = _PATH_LOCKS.setdefault(key, threading.RLock())
+    with lock:
+        yield
+
+
+def write_file(path: str, data: bytes, coalesce: bool = False, fsync: Optional[bool] = None):
+    """Ponto único de escrita: atômica e síncrona, ou via group commit (coalesce=True)."""
+    if coalesce:
+        group_commit.submit(path, data)
+    else:
+        atomic_write(path, data, fsync=fsync)
+
+
+def read_bytes(path: str) -> Optional[bytes]:
+    """Lê o arquivo considerando escritas ainda na fila do group commit. None se não existir."""
+    pending = group_commit.read_pending(path)
+    if pending is not None: return pending
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+# --- BENCHMARK (python durable_io.py) ---
+
+def _benchmark(writes: int = 200, interval: float = 0.002):
+    """
+    Pedidos chegam espaçados por `interval` (várias sessões salvando), não num laço
+    apertado. Mede o tempo que o chamador fica bloqueado por pedido, quantas gravações
+    chegam ao disco e o tempo até tudo estar durável (inclui o flush do group commit).
+    """
+    payload = dumps_json({f"item_{i}": {"name": f"Item {i}", "value_gold": i} for i in range(200)}, indent=2)
+    scenarios = (("mesmo arquivo", lambda i: "bench.json"), ("arquivos distintos", lambda i: f"bench_{i}.json"))
+
+    def run(tmp, name_of, write, done=lambda: None):
+        blocked = 0.0
+        start = time.perf_counter()
+        for i in range(writes):
+            t0 = time.perf_counter()
+            write(os.path.join(tmp, name_of(i)))
+            blocked += time.perf_counter() - t0
+            time.sleep(interval)
+        done()
+        return blocked / writes * 1000, time.perf_counter() - start
+
+    print(f"📝 {writes} pedidos de {len(payload)} B, um a cada {interval * 1000:.0f} ms, com fsync")
+    for scenario, name_of in scenarios:
+        print(f"   [{scenario}]")
+        with tempfile.TemporaryDirectory() as tmp:
+            per_call, total = run(tmp, name_of, lambda path: atomic_write(path, payload, fsync=True))
+            print(f"   {'atômica + fsync':<22} {per_call:>7.3f} ms/pedido  {writes:>4} gravações  {total:>6.2f} s até durável")
+        with tempfile.TemporaryDirectory() as tmp:
+            queue = GroupCommitQueue(fsync=True)
+            per_call, total = run(tmp, name_of, lambda path: queue.submit(path, payload), lambda: queue.flush(timeout=60))
+            print(f"   {'group commit + fsync':<22} {per_call:>7.3f} ms/pedido  {queue.stats['written']:>4} gravações  {total:>6.2f} s até durável")
+
+
+if __name__ == "__main__":
+    _benchmark()
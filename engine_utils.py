@@ -1,66 +1,229 @@
 """
 engine_utils.py
 Gerencia o ciclo de execução da LLM e Ferramentas (Roll, UpdateHP, Transaction).
+- Registro de ferramentas: cada ferramenta é um handler registrado com
+  @register_tool(nome, descrição, parâmetros). O schema enviado à LLM
+  (TOOLS_SCHEMA) é regenerado a cada registro (ferramenta de plugin também
+  chega ao bind_tools), e o loop despacha pelo nome.
+- Índice de entidades (EntityIndex): montado uma vez por execução do engine,
+  mapeia id/nome/apelido -> entidade (player, aliados, inimigos). O alvo é
+  resolvido primeiro por chave exata (O(1)) e só depois por aproximação
+  (palavras inteiras, então "Goblin 1" não acerta o "Goblin 10"; erro de
+  digitação por similaridade).
 """
-from typing import Dict, Any, List
+import difflib
+import re
+from typing import Dict, Any, Callable, List, Optional, Tuple
 from langchain_core.messages import AIMessage, ToolMessage, SystemMessage, BaseMessage
 from langchain_core.runnables import Runnable
 from dice_system import roll_formula
 from gamedata import ARTIFACTS_DB
+from metrics import metrics
+from turn_budget import CANNED_CONTINUATION, TOOL_STEP_ESTIMATE, TurnBudget
+
+# --- CONFIGURAÇÃO ---
+FUZZY_TARGET_CUTOFF = 0.8  # Similaridade mínima (difflib) para aceitar alvo com erro de digitação
+PLAYER_ALIASES = ("player", "hero", "jogador", "herói", "heroi")
+
+metrics.describe("engine_tool_calls_total", "Chamadas de ferramenta no loop do engine, por ferramenta e resultado")
+metrics.describe("engine_target_resolutions_total", "Resoluções de alvo do update_hp, por modo (exact, fuzzy, miss)")
+
+
+# --- ÍNDICE DE ENTIDADES ---
+def _normalize(text: Any) -> str:
+    return " ".join(re.findall(r"\w+", str(text or "").lower()))
+
+
+class EntityIndex:
+    """
+    id/nome/apelido -> (tipo, entidade) do turno. As entidades são as cópias do
+    engine: alterar o dict devolvido altera o estado que o engine retorna.
+    Nomes repetidos guardam todas as entidades; vence a primeira ainda viva.
+    """
+
+    def __init__(self, player: Dict[str, Any], party: List[Dict[str, Any]], enemies: List[Dict[str, Any]]):
+        self._keys: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+        self._add("player", player, list(PLAYER_ALIASES) + [player.get("name")])
+        for ally in party:
+            self._add("ally", ally, [ally.get("id"), ally.get("name")] + list(ally.get("aliases") or []))
+        for enemy in enemies:
+            self._add("enemy", enemy, [enemy.get("id"), enemy.get("name")] + list(enemy.get("aliases") or []))
+        # Chaves mais longas primeiro: "goblin chefe" ganha de "goblin" na busca por palavras
+        self._by_length = sorted(self._keys, key=lambda k: -len(k.split()))
+
+    def _add(self, kind: str, entity: Dict[str, Any], keys: List[Any]):
+        for key in {_normalize(k) for k in keys if k}:
+            if key: self._keys.setdefault(key, []).append((kind, entity))
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @staticmethod
+    def _pick(entries: List[Tuple[str, Dict[str, Any]]]) -> Tuple[str, Dict[str, Any]]:
+        return next((e for e in entries if e[1].get("hp", 1) > 0), entries[0])
+
+    def resolve(self, target: Any) -> Tuple[Optional[str], Optional[Dict[str, Any]], str]:
+        """(tipo, entidade, modo). Modo: exact, fuzzy ou miss (entidade None)."""
+        key = _normalize(target)
+        if not key: return None, None, "miss"
+        if key in self._keys: return (*self._pick(self._keys[key]), "exact")
+
+        # Chave inteira dentro do alvo, em palavras completas ("ataco o goblin 1")
+        padded = f" {key} "
+        for candidate in self._by_length:
+            if f" {candidate} " in padded: return (*self._pick(self._keys[candidate]), "fuzzy")
+
+        # Erro de digitação, mas com os mesmos números: "Goblin 11" não vira "Goblin 1"
+        numbers = re.findall(r"\d+", key)
+        for close in difflib.get_close_matches(key, self._keys, n=3, cutoff=FUZZY_TARGET_CUTOFF):
+            if re.findall(r"\d+", close) == numbers: return (*self._pick(self._keys[close]), "fuzzy")
+        return None, None, "miss"
+
+
+class EngineContext:
+    """Estado mutável de uma execução do engine, visto pelos handlers das ferramentas."""
+
+    def __init__(self, state: Dict[str, Any], node_name: str):
+        self.node_name = node_name
+        # Cópias seguras do estado
+        self.player = state.get("player", {}).copy()
+        self.enemies = [e.copy() for e in state.get("enemies", [])]
+        self.party = [p.copy() for p in state.get("party", [])]
+        self.entities = EntityIndex(self.player, self.party, self.enemies)
+
+
+# --- REGISTRO DE FERRAMENTAS ---
+class Tool:
+    def __init__(self, name: str, description: str, parameters: Dict[str, Any],
+                 handler: Callable[[Dict[str, Any], EngineContext], str]):
+        self.name = name
+        self.description = description
+        self.parameters = parameters
+        self.handler = handler
+
+    def schema(self) -> Dict[str, Any]:
+        return {"name": self.name, "description": self.description, "parameters": self.parameters}
+
+
+TOOL_REGISTRY: Dict[str, Tool] = {}
+# Ferramentas (Schema) enviadas ao bind_tools. Regenerado a cada registro, sempre no mesmo
+# objeto: entre registros o llm_setup reaproveita o runnable com bind_tools pela lista.
+TOOLS_SCHEMA: List[Dict[str, Any]] = []
+
+
+def register_tool(name: str, description: str, parameters: Dict[str, Any]):
+    """Decorator: registra handler(args, ctx) -> texto do resultado como ferramenta `name`."""
+    def decorator(handler):
+        TOOL_REGISTRY[name] = Tool(name, description, parameters, handler)
+        TOOLS_SCHEMA[:] = tool_schemas()
+        return handler
+    return decorator
+
+
+def tool_schemas() -> List[Dict[str, Any]]:
+    return [tool.schema() for tool in TOOL_REGISTRY.values()]
+
+
+@register_tool("roll_dice", "Rola dados. Ex: '1d20+5'.",
+               {"type": "object", "properties": {"formula": {"type": "string"}}, "required": ["formula"]})
+def _roll_dice(args: Dict[str, Any], ctx: EngineContext) -> str:
+    f = args.get("formula") or "1d20"
+    result = roll_formula(str(f))
+    print(f"   🎲 [{ctx.node_name}] {f} -> {result}")
+    return result
+
+
+@register_tool("update_hp", "Dano/Cura em Player/NPCs.", {
+    "type": "object",
+    "properties": {"target": {"type": "string"}, "amount": {"type": "integer"}},
+    "required": ["target", "amount"]
+})
+def _update_hp(args: Dict[str, Any], ctx: EngineContext) -> str:
+    tgt = str(args.get("target", ""))
+    amt = int(args.get("amount", 0))
+    kind, entity, mode = ctx.entities.resolve(tgt)
+    metrics.inc("engine_target_resolutions_total", mode=mode)
+    if entity is None: return f"Target '{tgt}' not found."
+
+    old = entity.get("hp", 0)
+    entity["hp"] = max(0, old + amt)
+    if kind == "player": return f"Player HP: {old}->{entity['hp']}"
+    if kind == "ally": return f"Ally {entity['name']} HP: {old}->{entity['hp']}"
+    if entity["hp"] <= 0: entity["status"] = "morto"
+    return f"Enemy {entity['name']} HP: {old}->{entity['hp']}"
+
+
+@register_tool("transaction", "Compra ou Venda de itens.", {
+    "type": "object",
+    "properties": {
+        "action": {"type": "string", "enum": ["buy", "sell"]},
+        "item_id": {"type": "string", "description": "ID exato do item"}
+    },
+    "required": ["action", "item_id"]
+})
+def _transaction(args: Dict[str, Any], ctx: EngineContext) -> str:
+    action = args.get("action")
+    iid = args.get("item_id")
+    item = ARTIFACTS_DB.get(iid)
+    player = ctx.player
+
+    if not item: return f"Item ID '{iid}' não encontrado no banco de dados."
+    price = item.get("value_gold", 0)
+    if action == "buy":
+        if player.get("gold", 0) >= price:
+            player["gold"] -= price
+            player["inventory"].append(iid)
+            print(f"   💰 Buy: {iid} (-{price}g)")
+            return f"Sucesso: Comprou {item['name']} por {price} ouro."
+        return f"Falha: Ouro insuficiente ({player.get('gold')} < {price})."
+    if action == "sell":
+        if iid in player.get("inventory", []):
+            player["inventory"].remove(iid)
+            player["gold"] += price
+            print(f"   💰 Sell: {iid} (+{price}g)")
+            return f"Sucesso: Vendeu {item['name']} por {price} ouro."
+        return "Falha: Você não possui este item."
+    return ""
+
+
+def run_tool(name: str, args: Dict[str, Any], ctx: EngineContext) -> str:
+    tool = TOOL_REGISTRY.get(name)
+    if tool is None:
+        metrics.inc("engine_tool_calls_total", tool=name, outcome="unknown")
+        return f"Ferramenta '{name}' não existe."
+    try:
+        result = tool.handler(args or {}, ctx)
+    except (TypeError, ValueError) as exc:  # Argumentos malformados da LLM (ex.: amount="muito")
+        metrics.inc("engine_tool_calls_total", tool=name, outcome="bad_args")
+        return f"Argumentos inválidos para {name}: {exc}"
+    metrics.inc("engine_tool_calls_total", tool=name, outcome="ok")
+    return result
+
 
 def execute_engine(
     llm: Runnable, 
     system_message: SystemMessage, 
     history: List[BaseMessage], 
     state: Dict[str, Any], 
-    node_name: str = "Engine"
+    node_name: str = "Engine",
+    budget: Optional[TurnBudget] = None
 ) -> Dict[str, Any]:
     
-    # 1. Ferramentas (Schema)
-    tools_schema = [
-        {
-            "name": "roll_dice",
-            "description": "Rola dados. Ex: '1d20+5'.",
-            "parameters": {"type": "object", "properties": {"formula": {"type": "string"}}, "required": ["formula"]}
-        },
-        {
-            "name": "update_hp",
-            "description": "Dano/Cura em Player/NPCs.",
-            "parameters": {
-                "type": "object", 
-                "properties": {"target": {"type": "string"}, "amount": {"type": "integer"}}, 
-                "required": ["target", "amount"]
-            }
-        },
-        {
-            "name": "transaction",
-            "description": "Compra ou Venda de itens.",
-            "parameters": {
-                "type": "object", 
-                "properties": {
-                    "action": {"type": "string", "enum": ["buy", "sell"]},
-                    "item_id": {"type": "string", "description": "ID exato do item"}
-                },
-                "required": ["action", "item_id"]
-            }
-        }
-    ]
-    
     if getattr(llm, "is_fallback", False): return {"messages": history + [AIMessage("Erro API.")]}
 
-    llm_with_tools = llm.bind_tools(tools_schema)
-    
-    # Cópias seguras do estado
-    current_player = state.get("player", {}).copy()
-    current_enemies = [e.copy() for e in state.get("enemies", [])]
-    current_party = [p.copy() for p in state.get("party", [])]
+    llm_with_tools = llm.bind_tools(TOOLS_SCHEMA)
     
+    ctx = EngineContext(state, node_name)
+
     current_messages = [system_message] + history
     
     steps = 0
-    max_steps = 8
+    max_steps = budget.max_steps(8) if budget else 8
     
     for _ in range(max_steps):
+        # O prazo pode estourar no meio do loop (chamadas mais lentas que a estimativa)
+        if budget and steps and not budget.allow(TOOL_STEP_ESTIMATE, "tool_loop_cut"):
+            break
         steps += 1
         try:
             ai_msg = llm_with_tools.invoke(current_messages)
@@ -75,97 +238,31 @@ def execute_engine(
             
         tool_outputs = []
         for tool in ai_msg.tool_calls:
-            t_id, t_name, t_args = tool["id"], tool["name"], tool["args"]
-            result = ""
-            
-            # --- TOOL: ROLL DICE ---
-            if t_name == "roll_dice":
-                f = t_args.get("formula") or "1d20"
-                result = roll_formula(str(f))
-                print(f"   🎲 [{node_name}] {f} -> {result}")
-
-            # --- TOOL: TRANSACTION (ECONOMIA) ---
-            elif t_name == "transaction":
-                action = t_args.get("action")
-                iid = t_args.get("item_id")
-                item = ARTIFACTS_DB.get(iid)
-                
-                if not item:
-                    result = f"Item ID '{iid}' não encontrado no banco de dados."
-                else:
-                    price = item.get("value_gold", 0)
-                    if action == "buy":
-                        if current_player.get("gold", 0) >= price:
-                            current_player["gold"] -= price
-                            current_player["inventory"].append(iid)
-                            result = f"Sucesso: Comprou {item['name']} por {price} ouro."
-                            print(f"   💰 Buy: {iid} (-{price}g)")
-                        else:
-                            result = f"Falha: Ouro insuficiente ({current_player.get('gold')} < {price})."
-                    elif action == "sell":
-                        if iid in current_player.get("inventory", []):
-                            current_player["inventory"].remove(iid)
-                            current_player["gold"] += price
-                            result = f"Sucesso: Vendeu {item['name']} por {price} ouro."
-                            print(f"   💰 Sell: {iid} (+{price}g)")
-                        else:
-                            result = "Falha: Você não possui este item."
-
-            # --- TOOL: UPDATE HP ---
-            elif t_name == "update_hp":
-                tgt = str(t_args.get("target", "")).lower()
-                amt = int(t_args.get("amount", 0))
-                found = False
-                
-                # Player
-                if tgt in ["player", "hero", current_player.get('name', '').lower()]:
-                    old = current_player.get('hp', 0)
-                    current_player['hp'] = max(0, old + amt)
-                    result = f"Player HP: {old}->{current_player['hp']}"
-                    found = True
-                
-                # Party
-                if not found:
-                    for ally in current_party:
-                        if ally['name'].lower() in tgt:
-                            old = ally.get('hp', 0)
-                            ally['hp'] = max(0, old + amt)
-                            result = f"Ally {ally['name']} HP: {old}->{ally['hp']}"
-                            found = True
-                            break
-                
-                # Enemies
-                if not found:
-                    for e in current_enemies:
-                        if e['name'].lower() in tgt or e.get('id', '').lower() in tgt:
-                            old = e.get('hp', 0)
-                            e['hp'] = max(0, old + amt)
-                            if e['hp'] <= 0: e['status'] = "morto"
-                            result = f"Enemy {e['name']} HP: {old}->{e['hp']}"
-                            found = True
-                            break
-                
-                if not found: result = f"Target '{tgt}' not found."
-
-            tool_outputs.append(ToolMessage(tool_call_id=t_id, content=result or "Done"))
+            result = run_tool(tool["name"], tool["args"], ctx)
+            tool_outputs.append(ToolMessage(tool_call_id=tool["id"], content=result or "Done"))
             
         current_messages.extend(tool_outputs)
 
     if isinstance(current_messages[-1], ToolMessage):
-        try:
-            final_narrative = llm.invoke(current_messages)
-            current_messages.append(final_narrative)
-        except: pass
+        if budget and budget.exhausted():
+            # Sem tempo para narrar: os resultados das ferramentas já estão aplicados
+            current_messages.append(AIMessage(content=CANNED_CONTINUATION))
+        else:
+            try:
+                final_narrative = llm.invoke(current_messages)
+                current_messages.append(final_narrative)
+            except Exception: pass
 
     # Filtra histórico original
     new_messages = current_messages[1 + len(history):]
     
     return {
         "messages": new_messages,
-        "player": current_player,
-        "enemies": current_enemies,
-        "party": current_party,
+        "player": ctx.player,
+        "enemies": ctx.enemies,
+        "party": ctx.party,
         "world": state.get("world", {}),
         "combat_target": state.get("combat_target"),
-        "next": state.get("next")
+        "next": state.get("next"),
+        **(budget.updates() if budget else {})
     }
\ No newline at end of file
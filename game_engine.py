@@ -14,6 +14,7 @@ from main import app
 from persistence import save_game_state, load_game_state
 from gamedata import CLASSES, load_json_data
 from character_creator import create_player_character
+from archive_queue import merge_pending_archive, submit_archive
 
 ORIGINS_DATA = load_json_data("origins.json")
 RACES = ORIGINS_DATA.get("races", [])
@@ -174,6 +175,7 @@ def run_game_loop():
             print(f"{Colors.CYAN}... Gerando cena inicial ...{Colors.ENDC}", end="\r")
             initial_res = app.invoke(state)
             state = initial_res
+            submit_archive(state)
             if state["messages"]:
                 print(f"\n{Colors.BLUE}📜 {state['messages'][-1].content}{Colors.ENDC}")
         else:
@@ -193,24 +195,28 @@ def run_game_loop():
             if not user_input: continue
             
             if user_input.lower() in ["sair", "exit", "quit", "salvar"]:
+                merge_pending_archive(state)
                 save_game_state(state)
                 print(f"{Colors.CYAN}Até a próxima aventura!{Colors.ENDC}")
                 break
             
             if user_input.lower() == "status":
+                merge_pending_archive(state)
                 print(f"\n{Colors.CYAN}--- FICHA DE {p['name'].upper()} ---")
                 print(f"Resumo da História: {state.get('narrative_summary')}")
                 print(f"Inventário: {p['inventory']}{Colors.ENDC}")
                 continue
 
+            merge_pending_archive(state)
             current_msgs = state.get("messages", [])
             current_msgs.append(HumanMessage(content=user_input))
-            state["messages"] = current_msgs[-15:]
+            state["messages"] = current_msgs  # Janela aplicada pelo reducer do grafo
 
             print(f"{Colors.CYAN}... Pensando ...{Colors.ENDC}", end="\r")
             
             result = app.invoke(state)
             state = result
+            submit_archive(state)
             
             last_msg = state["messages"][-1]
             content = last_msg.content
@@ -230,6 +236,7 @@ def run_game_loop():
 
         except KeyboardInterrupt:
             print("\nEncerrando...")
+            merge_pending_archive(state)
             save_game_state(state)
             break
         except Exception as e:
@@ -6,6 +6,8 @@ Gerencia o carregamento de regras, itens, bestiário e a persistência de criaç
 import json
 import os
 
+from durable_io import dumps_json, path_lock, read_bytes, write_file
+
 # --- CONFIGURAÇÃO DE CAMINHOS ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "data")
@@ -14,11 +16,13 @@ def load_json_data(filename: str) -> dict:
     """Carrega um arquivo JSON da pasta data. Retorna dict vazio se falhar."""
     file_path = os.path.join(DATA_DIR, filename)
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            # Tenta carregar. Se o arquivo estiver vazio, json.load falha.
-            content = f.read().strip()
-            if not content: return {}
-            return json.loads(content)
+        # read_bytes enxerga escritas ainda na fila do group commit
+        raw = read_bytes(file_path)
+        if raw is None: raise FileNotFoundError(file_path)
+        # Tenta carregar. Se o arquivo estiver vazio, json.load falha.
+        content = raw.decode("utf-8").strip()
+        if not content: return {}
+        return json.loads(content)
     except (FileNotFoundError, json.JSONDecodeError):
         # Se não existir ou estiver corrompido, retorna vazio para evitar crash
         if "custom" in filename:
@@ -36,32 +40,56 @@ def save_custom_artifact(item_id: str, item_data: dict):
     """
     file_path = os.path.join(DATA_DIR, "custom_artifacts.json")
     
-    # 1. Carrega dados atuais do disco
-    current_data = {}
-    if os.path.exists(file_path):
+    with path_lock(file_path):
+        # 1. Carrega dados atuais (disco ou escrita ainda pendente)
+        current_data = {}
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                content = f.read().strip()
-                if content: current_data = json.loads(content)
+            raw = read_bytes(file_path)
+            content = raw.decode("utf-8").strip() if raw else ""
+            if content: current_data = json.loads(content)
         except:
             current_data = {}
-    
-    # 2. Adiciona/Atualiza o novo item
-    current_data[item_id] = item_data
-    
-    # 3. Salva no disco
-    try:
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(current_data, f, indent=2, ensure_ascii=False)
-        print(f"💾 [SYSTEM] Item '{item_id}' salvo em custom_artifacts.json")
-    except Exception as e:
-        print(f"❌ Erro ao salvar artifact: {e}")
+        
+        # 2. Adiciona/Atualiza o novo item
+        current_data[item_id] = item_data
+        
+        # 3. Salva no disco (atômico; rajadas de itens viram uma única gravação)
+        try:
+            write_file(file_path, dumps_json(current_data, indent=2), coalesce=True)
+            print(f"💾 [SYSTEM] Item '{item_id}' salvo em custom_artifacts.json")
+        except Exception as e:
+            print(f"❌ Erro ao salvar artifact: {e}")
 
     # 4. Atualiza a memória global (Hot Reload)
     ARTIFACTS_DB[item_id] = item_data
     CUSTOM_ARTIFACTS[item_id] = item_data # <--- CORREÇÃO: Atualiza a lista de custom também
     if item_id not in ALL_ARTIFACT_IDS:
         ALL_ARTIFACT_IDS.append(item_id)
+    _bump_data_version()
+
+# --- VERSÃO DOS DADOS (invalida caches derivados, ex.: /data/bundle) ---
+DATA_VERSION = 0
+
+def _bump_data_version():
+    global DATA_VERSION
+    DATA_VERSION += 1
+
+def reload_game_data():
+    """
+    Relê os JSONs de data/ sem trocar os objetos globais: quem fez
+    `from gamedata import CLASSES` continua enxergando os dados novos.
+    """
+    for target, filename in [
+        (CLASSES, "classes.json"), (ABILITIES, "player_abilities.json"), (BESTIARY, "bestiary.json"),
+        (ORIGINS, "origins.json"), (BASE_ARTIFACTS, "artifacts.json"), (CUSTOM_ARTIFACTS, "custom_artifacts.json"),
+    ]:
+        target.clear()
+        target.update(load_json_data(filename))
+
+    ARTIFACTS_DB.clear()
+    ARTIFACTS_DB.update({**BASE_ARTIFACTS, **CUSTOM_ARTIFACTS})
+    ALL_ARTIFACT_IDS[:] = list(ARTIFACTS_DB.keys())
+    _bump_data_version()
 
 # --- CARREGAMENTO DE DADOS (Load on Startup) ---
 
@@ -69,6 +97,7 @@ def save_custom_artifact(item_id: str, item_data: dict):
 CLASSES = load_json_data("classes.json")
 ABILITIES = load_json_data("player_abilities.json")
 BESTIARY = load_json_data("bestiary.json")
+ORIGINS = load_json_data("origins.json")
 
 # 2. Sistema de Artefatos (Híbrido)
 BASE_ARTIFACTS = load_json_data("artifacts.json")         
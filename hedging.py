@@ -0,0 +1,182 @@
+"""
+hedging.py
+Timeouts por Nó e Requisições "Hedged" para os nós no caminho crítico.
+- Timeout: cada nó tem um prazo por chamada (LLM_TIMEOUT_<NÓ>, ex.: LLM_TIMEOUT_ROUTER);
+  estourou, a chamada levanta LLMTimeout (TimeoutError) e o nó cai no seu fallback.
+- Hedge: se a chamada não respondeu até o p95 de latência do nó, uma cópia é
+  disparada e vale a primeira que voltar. A perdedora é cancelada: não faz
+  mais retries no agendador nem o novo pedido por parse inválido, e o resultado
+  é descartado (a requisição HTTP já enviada não tem como ser abortada pelo SDK
+  síncrono). O hedge fica abaixo de qualquer retry: .with_retry(...).hedged(nó)
+  não tem RunnableRetry no meio (llm_setup.py), todo retry passa por should_stop.
+- Orçamento: cada chamada primária deposita HEDGE_BUDGET_RATIO de hedge e cada
+  hedge gasta 1, então o gasto extra fica em ~10% no longo prazo, nunca o dobro.
+- Quantil: a janela guarda a latência da chamada primária, mesmo quando o hedge
+  vence (registrada quando a primária termina) e o timeout quando ela estoura.
+  Guardar só a vencedora censurava o p95 para baixo e o hedge disparava cada vez
+  mais cedo; chamadas que falham não entram (erro rápido não é latência).
+Uso: get_llm(...).with_structured_output(S).hedged("router").invoke(...)
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+
+import llm_cache
+from cancellation import current_scope
+from metrics import metrics
+from provider_scheduler import RetryBudget
+
+# --- CONFIGURAÇÃO ---
+NODE_TIMEOUTS = {
+    "router": float(os.getenv("LLM_TIMEOUT_ROUTER", "8")),
+    "storyteller": float(os.getenv("LLM_TIMEOUT_STORYTELLER", "20")),
+}
+LLM_TIMEOUT_DEFAULT = float(os.getenv("LLM_TIMEOUT_DEFAULT", "30"))
+HEDGE_NODES = {n.strip() for n in os.getenv("LLM_HEDGE_NODES", "router,storyteller").split(",") if n.strip()}
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))  # Sem histórico suficiente, sem hedge
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.1"))
+HEDGE_BUDGET_MAX = float(os.getenv("HEDGE_BUDGET_MAX", "5"))
+HEDGE_WORKERS = int(os.getenv("HEDGE_WORKERS", "32"))
+_SCOPE_POLL_SECONDS = 0.25
+
+metrics.describe("llm_hedges_total", "Chamadas duplicadas (hedge) disparadas, por nó")
+metrics.describe("llm_hedge_wins_total", "Hedges que responderam antes da chamada original, por nó")
+metrics.describe("llm_hedge_budget_exhausted_total", "Hedges não disparados por falta de orçamento, por nó")
+metrics.describe("llm_timeouts_total", "Chamadas de LLM que estouraram o timeout do nó")
+metrics.describe("llm_node_latency_seconds", "Latência das chamadas de LLM por nó (vencedora, com hedge)")
+
+
+class LLMTimeout(TimeoutError):
+    """A chamada do nó não respondeu dentro do timeout configurado."""
+
+
+class LatencyTracker:
+    """Janela das últimas latências de um nó, para estimar o quantil do hedge."""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES: return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+_trackers: Dict[str, LatencyTracker] = {}
+_trackers_lock = threading.Lock()
+hedge_budget = RetryBudget(ratio=HEDGE_BUDGET_RATIO, maximum=HEDGE_BUDGET_MAX)
+_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+
+
+def tracker(node: str) -> LatencyTracker:
+    with _trackers_lock:
+        return _trackers.setdefault(node, LatencyTracker())
+
+
+def node_timeout(node: str) -> float:
+    return NODE_TIMEOUTS.get(node, LLM_TIMEOUT_DEFAULT)
+
+
+def hedged_call(node: str, attempt: Callable[[Callable[[], bool]], Any], timeout: Optional[float] = None,
+                hedge: Optional[bool] = None) -> Any:
+    """
+    Roda `attempt(should_stop)` com timeout e, se o nó estiver em HEDGE_NODES, com hedge.
+    `should_stop()` fica True para a tentativa perdedora (e para todas no timeout).
+    """
+    timeout = node_timeout(node) if timeout is None else timeout
+    hedge = (node in HEDGE_NODES) if hedge is None else hedge
+    hedge_delay = tracker(node).quantile(HEDGE_QUANTILE) if hedge else None
+
+    start = time.monotonic()
+    deadline = start + timeout
+    hedge_at = start + hedge_delay if hedge_delay is not None else None
+    stops = []
+    kinds = {}
+    recorded = threading.Event()
+
+    def record_primary(seconds: float):
+        # Uma amostra por chamada: a primária ao terminar ou o timeout, o que vier antes
+        with _trackers_lock:
+            if recorded.is_set(): return
+            recorded.set()
+        tracker(node).observe(min(seconds, timeout))
+
+    def on_primary_done(future):
+        if future.exception() is None: record_primary(time.monotonic() - start)
+
+    def launch(kind: str):
+        stop = threading.Event()
+        stops.append(stop)
+        # Copia o contexto: escopo de cancelamento e prazo do turno seguem para a thread
+        future = _executor.submit(contextvars.copy_context().run, attempt, stop.is_set)
+        kinds[future] = kind
+        return future
+
+    primary = launch("primary")
+    primary.add_done_callback(on_primary_done)
+    pending = {primary}
+    hedge_budget.deposit()
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            scope = current_scope()
+            if scope is not None: scope.check()
+            now = time.monotonic()
+            if now >= deadline:
+                metrics.inc("llm_timeouts_total", node=node)
+                record_primary(timeout)
+                raise LLMTimeout(f"{node}: sem resposta em {timeout:.1f}s")
+
+            wake = min(deadline, hedge_at or deadline, now + _SCOPE_POLL_SECONDS)
+            done, pending = wait(pending, timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    elapsed = time.monotonic() - start
+                    metrics.observe("llm_node_latency_seconds", elapsed, node=node)
+                    if kinds[future] == "hedge": metrics.inc("llm_hedge_wins_total", node=node)
+                    return future.result()
+                error = future.exception()
+
+            if hedge_at is not None and pending and time.monotonic() >= hedge_at:
+                hedge_at = None
+                if hedge_budget.withdraw():
+                    metrics.inc("llm_hedges_total", node=node)
+                    pending.add(launch("hedge"))
+                else:
+                    metrics.inc("llm_hedge_budget_exhausted_total", node=node)
+        raise error
+    finally:
+        for stop in stops: stop.set()  # Perdedora(s): para de tentar e descarta o resultado
+
+
+class HedgedLLM:
+    """Runnable com timeout e hedge por nó (criado por CancellableLLM.hedged)."""
+
+    def __init__(self, llm: Any, node: str, timeout: Optional[float] = None):
+        self._llm = llm
+        self.node = node
+        self.timeout = timeout
+        self.meta = llm.meta
+
+    def __getattr__(self, name):
+        return getattr(self._llm, name)
+
+    def invoke(self, input, config=None, **kwargs):
+        self._llm._before_call()
+        result = hedged_call(self.node, lambda should_stop: self._llm._provider_call(input, config, kwargs, should_stop), self.timeout)
+        self._llm._after_call()
+        return result
+
+    def cached(self, node: str, ttl: Optional[float] = None):
+        return llm_cache.wrap(self, self.meta, node, ttl)
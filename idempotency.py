@@ -0,0 +1,88 @@
+"""
+idempotency.py
+Chaves de Idempotência (header Idempotency-Key) para endpoints que rodam o grafo.
+- Chave concluída: a resposta guardada é reenviada (replay) sem nova chamada de LLM.
+- Chave em andamento: o retry espera e recebe o resultado da execução original.
+- Falhas não ficam guardadas: o próximo retry executa de novo.
+As chaves expiram após IDEMPOTENCY_TTL_SECONDS. O store é em memória (um processo).
+"""
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# --- CONFIGURAÇÃO ---
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600"))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", "300"))
+
+
+class IdempotencyConflict(Exception):
+    """Mesma chave reutilizada com outro corpo de requisição."""
+
+
+class _Entry:
+    def __init__(self, fingerprint: Optional[str]):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.response: Any = None
+        self.error: Optional[BaseException] = None
+        self.expires_at = float("inf")  # Só começa a expirar quando termina
+
+
+def fingerprint(*parts: Any) -> str:
+    """Hash do corpo da requisição, para detectar reuso indevido da chave."""
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _Entry] = {}
+        self.stats = {"executed": 0, "replayed": 0, "attached": 0}
+
+    def _purge(self, now: float):
+        expired = [k for k, e in self._entries.items() if e.expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+
+    def run(self, key: str, fn: Callable[[], Any], request_fingerprint: Optional[str] = None) -> Tuple[Any, bool]:
+        """
+        Executa `fn` uma única vez por chave.
+        Retorna (resposta, replayed); replayed=True quando veio de outra execução.
+        """
+        with self._lock:
+            self._purge(time.monotonic())
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._entries[key] = _Entry(request_fingerprint)
+            elif request_fingerprint and entry.fingerprint and entry.fingerprint != request_fingerprint:
+                raise IdempotencyConflict(f"Idempotency-Key '{key}' já usada com outra requisição.")
+            else:
+                self.stats["replayed" if entry.done.is_set() else "attached"] += 1
+
+        if not owner:
+            if not entry.done.wait(IDEMPOTENCY_WAIT_TIMEOUT):
+                raise TimeoutError(f"Execução original da chave '{key}' não terminou a tempo.")
+            if entry.error is not None: raise entry.error
+            return entry.response, True
+
+        self.stats["executed"] += 1
+        try:
+            entry.response = fn()
+        except BaseException as e:
+            entry.error = e
+            with self._lock:
+                # Falhou: libera a chave para um novo retry
+                if self._entries.get(key) is entry: del self._entries[key]
+            raise
+        finally:
+            entry.expires_at = time.monotonic() + self.ttl
+            entry.done.set()
+        return entry.response, False
+
+
+# Instância global
+idempotency_store = IdempotencyStore()
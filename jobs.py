@@ -0,0 +1,127 @@
+"""
+jobs.py
+Subsistema de Jobs para operações longas da API (criação de jogo, geração em lote...).
+O endpoint devolve o id do job na hora; o trabalho roda num pool limitado de
+workers e reporta progresso, consultado por GET /jobs/{id} ou pelo stream SSE.
+"""
+import contextvars
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, Optional
+
+# --- CONFIGURAÇÃO ---
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_TTL = float(os.getenv("JOB_TTL_SECONDS", "3600"))  # Quanto tempo um job concluído fica consultável
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+_FINISHED = (SUCCEEDED, FAILED)
+
+# Função de progresso recebida pelo job: report(fração 0..1, mensagem)
+ProgressFn = Callable[[float, str], None]
+
+
+class Job:
+    def __init__(self, kind: str):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = "Na fila"
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.seq = 0  # Incrementa a cada mudança (o SSE só envia quando muda)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": round(self.progress, 3),
+            "message": self.message,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class JobManager:
+    def __init__(self, max_workers: int = JOB_WORKERS, ttl: float = JOB_TTL):
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._cond = threading.Condition()
+        self._jobs: Dict[str, Job] = {}
+
+    def submit(self, kind: str, fn: Callable[[ProgressFn], Any]) -> Job:
+        """Enfileira `fn(report)`; o valor retornado vira job.result."""
+        job = Job(kind)
+        with self._cond:
+            self._purge()
+            self._jobs[job.id] = job
+        # Contexto novo por job: nada que um job marque (turno, escopo) fica na thread do worker
+        self._executor.submit(contextvars.copy_context().run, self._run, job, fn)
+        return job
+
+    def _update(self, job: Job, **fields):
+        with self._cond:
+            for key, value in fields.items():
+                setattr(job, key, value)
+            job.updated_at = time.time()
+            job.seq += 1
+            self._cond.notify_all()
+
+    def _run(self, job: Job, fn: Callable[[ProgressFn], Any]):
+        self._update(job, status=RUNNING, message="Iniciado")
+
+        def report(progress: float, message: str):
+            self._update(job, progress=max(0.0, min(progress, 1.0)), message=message)
+
+        try:
+            result = fn(report)
+        except Exception as e:  # noqa: BLE001 - o erro vai para o job, não derruba o worker
+            detail = getattr(e, "detail", None) or str(e)
+            print(f"❌ [JOBS] Job {job.kind} {job.id} falhou: {detail}")
+            self._update(job, status=FAILED, error=detail, message="Falhou")
+            return
+        self._update(job, status=SUCCEEDED, progress=1.0, result=result, message="Concluído")
+
+    def _purge(self):
+        limit = time.time() - self.ttl
+        expired = [jid for jid, j in self._jobs.items() if j.status in _FINISHED and j.updated_at < limit]
+        for jid in expired:
+            del self._jobs[jid]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Job]:
+        """Bloqueia até o job terminar (ou timeout)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._jobs[job_id].status in _FINISHED, timeout=timeout)
+            return self._jobs.get(job_id)
+
+    def watch(self, job_id: str, heartbeat: float = 15.0) -> Iterator[Optional[Dict[str, Any]]]:
+        """
+        Gera um snapshot do job a cada mudança, até terminar.
+        Gera None após `heartbeat` segundos sem mudança (keep-alive do SSE).
+        """
+        last_seq = -1
+        while True:
+            with self._cond:
+                job = self._jobs.get(job_id)
+                if job is None: return
+                changed = self._cond.wait_for(lambda: job.seq != last_seq, timeout=heartbeat)
+                snapshot = job.to_dict() if changed else None
+                last_seq = job.seq
+            yield snapshot
+            if snapshot and snapshot["status"] in _FINISHED: return
+
+
+# Instância global
+job_manager = JobManager()
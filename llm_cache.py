@@ -0,0 +1,222 @@
+"""
+llm_cache.py
+Cache de Respostas para chamadas determinísticas (temperatura 0).
+Chave: hash de (modelo, schema/tools, mensagens canonicalizadas). Dois níveis:
+LRU em memória e arquivos em disco (LLM_CACHE_DIR), ambos com TTL.
+Opt-in por nó: get_llm(0.0).with_structured_output(S).cached("router", ttl=...)
+Um hit devolve o objeto estruturado já validado, sem tocar no provider.
+Hits, misses e latência economizada por nó vão para metrics (GET /metrics).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage
+from pydantic import BaseModel
+
+from durable_io import atomic_write
+from metrics import metrics
+
+# --- CONFIGURAÇÃO ---
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "llm"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+
+metrics.describe("llm_cache_hits_total", "Respostas servidas pelo cache de LLM, por nó e nível")
+metrics.describe("llm_cache_misses_total", "Chamadas que foram ao provider, por nó")
+metrics.describe("llm_cache_saved_seconds_total", "Latência estimada economizada pelos hits, por nó")
+
+
+def _canonical_text(text: Any) -> str:
+    """Remove a indentação e linhas vazias dos prompts (f-strings indentadas geram o mesmo texto)."""
+    if not isinstance(text, str): return json.dumps(text, sort_keys=True, default=str)
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def _canonical_messages(messages: Any) -> Any:
+    if isinstance(messages, str): return _canonical_text(messages)
+    canonical = []
+    for msg in messages:
+        if isinstance(msg, BaseMessage):
+            canonical.append([msg.type, _canonical_text(msg.content)])
+        else:
+            canonical.append(_canonical_text(str(msg)))
+    return canonical
+
+
+@lru_cache(maxsize=256)
+def _model_schema_id(schema: type) -> str:
+    # Mudou o schema (campos, descrições) -> chave nova
+    return f"{schema.__module__}.{schema.__qualname__}:{json.dumps(schema.model_json_schema(), sort_keys=True)}"
+
+
+def _schema_id(schema: Any) -> Optional[str]:
+    if schema is None: return None
+    if isinstance(schema, type) and issubclass(schema, BaseModel): return _model_schema_id(schema)
+    return json.dumps(schema, sort_keys=True, default=str)
+
+
+def make_key(meta: Dict[str, Any], messages: Any) -> str:
+    payload = {
+        "model": meta.get("model"),
+        "temperature": meta.get("temperature"),
+        "schema": _schema_id(meta.get("schema")),
+        "tools": meta.get("tools"),
+        "messages": _canonical_messages(messages),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _encode(result: Any) -> Optional[Dict[str, Any]]:
+    if isinstance(result, BaseModel):
+        return {"kind": "model", "data": result.model_dump(mode="json")}
+    if isinstance(result, AIMessage):
+        return {"kind": "message", "content": result.content, "tool_calls": result.tool_calls}
+    if isinstance(result, dict):
+        return {"kind": "dict", "data": result}
+    return None  # Tipo desconhecido: não cacheia
+
+
+def _decode(entry: Dict[str, Any], schema: Any) -> Any:
+    if entry["kind"] == "model": return schema.model_validate(entry["data"])
+    if entry["kind"] == "message": return AIMessage(content=entry["content"], tool_calls=entry.get("tool_calls") or [])
+    return entry["data"]
+
+
+class ResponseCache:
+    """LRU em memória + arquivos em disco. Valores: (expires_at, entrada codificada)."""
+
+    def __init__(self, directory: str = LLM_CACHE_DIR, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """(entrada, nível) — nível é 'memory' ou 'disk'; (None, None) em miss/expirado."""
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item and item[0] > now:
+                self._memory.move_to_end(key)
+                return item[1], "memory"
+            if item: del self._memory[key]
+
+        try:
+            with open(self._path(key), "rb") as f:
+                stored = json.loads(f.read())
+        except (OSError, json.JSONDecodeError):
+            return None, None
+        if stored.get("expires_at", 0) <= now:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            return None, None
+        self._remember(key, stored["expires_at"], stored["entry"])
+        return stored["entry"], "disk"
+
+    def _remember(self, key: str, expires_at: float, entry: Dict[str, Any]):
+        with self._lock:
+            self._memory[key] = (expires_at, entry)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def put(self, key: str, entry: Dict[str, Any], ttl: float):
+        expires_at = time.time() + ttl
+        self._remember(key, expires_at, entry)
+        try:
+            data = json.dumps({"expires_at": expires_at, "entry": entry}, ensure_ascii=False).encode("utf-8")
+            # Cache é descartável: sem fsync
+            atomic_write(self._path(key), data, fsync=False)
+        except (OSError, TypeError) as e:
+            print(f"⚠️ [LLM CACHE] Falha ao gravar no disco: {e}")
+
+    def clear(self, disk: bool = False):
+        with self._lock:
+            self._memory.clear()
+        if disk and os.path.isdir(self.directory):
+            import shutil
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+# Instância global
+response_cache = ResponseCache()
+
+# Latência média dos misses por nó (estimativa do que cada hit economiza)
+_miss_latency: Dict[str, float] = {}
+_nodes: set = set()
+
+
+class CachedLLM:
+    """Runnable com cache na frente (criado por CancellableLLM.cached)."""
+
+    def __init__(self, llm: Any, meta: Dict[str, Any], node: str, ttl: float):
+        self._llm = llm
+        self._meta = meta
+        self.node = node
+        self.ttl = ttl
+        _nodes.add(node)
+
+    def __getattr__(self, name):
+        return getattr(self._llm, name)
+
+    def invoke(self, input, config=None, **kwargs):
+        if not LLM_CACHE_ENABLED:
+            return self._llm.invoke(input, config, **kwargs)
+
+        key = make_key(self._meta, input)
+        entry, level = response_cache.get(key)
+        if entry is not None:
+            try:
+                result = _decode(entry, self._meta.get("schema"))
+            except Exception:  # noqa: BLE001 - entrada incompatível (schema mudou): trata como miss
+                result = None
+            if result is not None:
+                metrics.inc("llm_cache_hits_total", node=self.node, level=level)
+                metrics.inc("llm_cache_saved_seconds_total", _miss_latency.get(self.node, 0.0), node=self.node)
+                return result
+
+        start = time.perf_counter()
+        result = self._llm.invoke(input, config, **kwargs)
+        elapsed = time.perf_counter() - start
+        previous = _miss_latency.get(self.node)
+        _miss_latency[self.node] = elapsed if previous is None else 0.8 * previous + 0.2 * elapsed
+        metrics.inc("llm_cache_misses_total", node=self.node)
+
+        encoded = _encode(result)
+        if encoded is not None:
+            response_cache.put(key, encoded, self.ttl)
+        return result
+
+
+def wrap(llm: Any, meta: Dict[str, Any], node: str, ttl: Optional[float] = None) -> Any:
+    """Põe o cache na frente de `llm`; só para temperatura 0 (com amostragem devolve `llm`)."""
+    if meta.get("temperature") != 0.0: return llm
+    return CachedLLM(llm, meta, node, LLM_CACHE_TTL if ttl is None else ttl)
+
+
+def cache_report() -> Dict[str, Dict[str, float]]:
+    """Taxa de acerto e latência economizada por nó (desde o início do processo)."""
+    report = {}
+    for node in sorted(_nodes):
+        hits = sum(metrics.get("llm_cache_hits_total", node=node, level=level) for level in ("memory", "disk"))
+        misses = metrics.get("llm_cache_misses_total", node=node)
+        total = hits + misses
+        report[node] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 3) if total else 0.0,
+            "saved_seconds": round(metrics.get("llm_cache_saved_seconds_total", node=node), 3),
+        }
+    return report
@@ -1,10 +1,56 @@
+"""
+llm_setup.py
+Fábrica de modelos (Gemini) compartilhada pelos agentes.
+- Registro de clientes: um ChatGoogleGenerativeAI por (modelo, temperatura, tier),
+  reaproveitando o cliente HTTP (pool de conexões/TLS) entre nós e turnos.
+- Cache de runnables: bind_tools / with_structured_output / with_retry com os
+  mesmos argumentos devolvem o mesmo objeto já montado.
+- Proxy de cancelamento (cancellation.py) em todas as chamadas.
+- Cache de respostas opt-in por nó para temperatura 0 (llm_cache.py): .cached(nó).
+- Timeouts por nó e hedge de chamadas lentas (hedging.py): .hedged(nó).
+- Agendador do provider (provider_scheduler.py): rate limit, concorrência, retries e circuit breaker.
+- Chamadas idênticas simultâneas compartilham uma única ida ao provider (singleflight.py):
+  automático só em temperatura 0; com amostragem, opt-in por nó via .coalesced().
+- Saída estruturada inválida passa pelo conserto local (output_repair.py) antes de qualquer retry.
+- with_retry em cliente agendado não empilha RunnableRetry sobre os retries do
+  agendador: vira no máximo um novo pedido por parse inválido (PARSE_RETRIES_MAX).
+- Tokens de entrada e lidos do cache de contexto, por prefixo de prompt (prompt_prefix.py).
+- LLM_PROVIDER=local troca o Gemini pelo provider offline de llm_local.py.
+"""
+import copy
+import json
+import os
+import threading
+import time
 from enum import Enum
+from functools import partial
+from typing import Any, Dict, Optional, Tuple
+
 from dotenv import load_dotenv
+from langchain_core.exceptions import OutputParserException
 from langchain_core.messages import AIMessage
+from langchain_core.runnables import Runnable, RunnableLambda
 from langchain_google_genai import ChatGoogleGenerativeAI, HarmBlockThreshold, HarmCategory
+from pydantic import BaseModel, ValidationError
+
+import llm_cache
+import prompt_prefix
+from cancellation import current_scope
+from hedging import HedgedLLM
+from llm_local import LocalLLM
+from metrics import metrics
+from output_repair import OUTPUT_REPAIR, repair_structured
+from provider_scheduler import ProviderUnavailable, provider_scheduler
+from singleflight import llm_flights
 
 load_dotenv()
 
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "google")
+PARSE_RETRIES_MAX = 1  # with_retry em cliente agendado: no máximo um novo pedido por parse inválido
+PARSE_ERRORS = (OutputParserException, ValidationError, json.JSONDecodeError)
+
+metrics.describe("llm_parse_retries_total", "Novos pedidos ao provider por saída estruturada inválida, por tier")
+
 
 class ModelTier(Enum):
     FAST = "fast"
@@ -12,42 +58,238 @@ class ModelTier(Enum):
 
 
 class FallbackLLM:
-    """Retorno seguro quando o provider não pode ser inicializado."""
+    """
+    Retorno seguro quando o provider não pode ser inicializado (ou o circuit
+    breaker do tier está aberto). Texto livre vira a mensagem de erro; saída
+    estruturada levanta ProviderUnavailable, que os nós já tratam no except.
+    """
 
-    def __init__(self, error_message: str):
+    def __init__(self, error_message: str, structured: bool = False):
         self.error_message = error_message
+        self.structured = structured
         self.is_fallback = True
 
     def bind_tools(self, *_args, **_kwargs):
         return self
 
     def with_structured_output(self, *_args, **_kwargs):
-        return self
+        return FallbackLLM(self.error_message, structured=True)
 
     def with_retry(self, *_args, **_kwargs):
         return self
 
-    def invoke(self, _input):
+    def cached(self, *_args, **_kwargs):
+        return self
+
+    def coalesced(self):
+        return self
+
+    def hedged(self, *_args, **_kwargs):
+        return self
+
+    def invoke(self, _input, *_args, **_kwargs):
+        if self.structured: raise ProviderUnavailable(self.error_message)
         return AIMessage(content=self.error_message)
 
 
+class CancellableLLM:
+    """
+    Proxy do modelo que respeita o CancelScope do turno (cancellation.py).
+    Antes da chamada: turno cancelado não vai ao provider. Depois: o resultado
+    de uma chamada que terminou após o cancelamento é descartado.
+    Os builders (bind_tools, with_structured_output...) devolvem o proxy de novo,
+    carregando em `meta` o modelo, a temperatura, o schema e as tools (chave do cache).
+    """
+
+    _BUILDERS = ("bind_tools", "with_structured_output", "with_retry", "bind", "with_config")
+
+    def __init__(self, inner, meta: Optional[Dict[str, Any]] = None):
+        self._inner = inner
+        self.meta = meta or {}
+        self._bound: Dict[Tuple, Any] = {}
+        self._bound_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self._inner, name)
+        if name in self._BUILDERS:
+            return lambda *args, **kwargs: self._build(name, attr, args, kwargs)
+        return attr
+
+    def _build(self, name: str, builder, args, kwargs) -> "CancellableLLM":
+        """Runnable derivado, montado uma vez por combinação de argumentos."""
+        key = (name, _freeze(args), _freeze(kwargs))
+        with self._bound_lock:
+            bound = self._bound.get(key)
+            if bound is None:
+                meta = dict(self.meta)
+                if name == "with_structured_output": meta["schema"] = args[0] if args else kwargs.get("schema")
+                if name == "bind_tools": meta["tools"] = _freeze(args[0] if args else kwargs.get("tools"))
+                if name == "with_retry" and "tier" in meta:
+                    # 429/5xx já são repetidos pelo agendador (orçamento, token bucket, jitter):
+                    # aqui sobra no máximo um novo pedido, e só para saída estruturada inválida
+                    attempts = kwargs.get("stop_after_attempt", 3)
+                    meta["parse_retries"] = min(PARSE_RETRIES_MAX, max(0, attempts - 1))
+                    runnable = self._inner
+                elif name == "with_structured_output" and _repairable(self._inner, meta["schema"], kwargs):
+                    # Parse que falha tenta o conserto local antes do novo pedido / fallback do nó
+                    runnable = builder(*args, include_raw=True, **kwargs) | RunnableLambda(partial(_structured_result, meta["schema"]))
+                else:
+                    runnable = builder(*args, **kwargs)
+                bound = self._bound[key] = CancellableLLM(runnable, meta)
+            return bound
+
+    def _memo(self, key: Tuple, factory):
+        with self._bound_lock:
+            bound = self._bound.get(key)
+            if bound is None:
+                bound = self._bound[key] = factory()
+            return bound
+
+    def cached(self, node: str, ttl: Optional[float] = None):
+        """
+        Runnable com cache de respostas (llm_cache.py) para o nó `node`.
+        Só vale para temperatura 0: com amostragem, devolve o próprio proxy.
+        """
+        return self._memo(("cached", node, ttl), lambda: llm_cache.wrap(self, self.meta, node, ttl))
+
+    def coalesced(self):
+        """
+        Runnable que coalesce chamadas idênticas simultâneas mesmo com temperatura > 0.
+        Só para nós em que todos os chamadores querem a mesma resposta (ex.: ficha de
+        monstro ou tema de classe que vão para um banco compartilhado).
+        """
+        return self._memo(("coalesced",), lambda: CancellableLLM(self._inner, {**self.meta, "coalesce": True}))
+
+    def hedged(self, node: str, timeout: Optional[float] = None):
+        """Runnable com timeout e hedge do nó `node` (hedging.py)."""
+        return self._memo(("hedged", node, timeout), lambda: HedgedLLM(self, node, timeout))
+
+    def invoke(self, input, config=None, **kwargs):
+        self._before_call()
+        if self.meta.get("temperature") == 0.0 or self.meta.get("coalesce"):
+            # Coalescência fica dentro das checagens: o cancelamento de um turno não vaza para os outros
+            key = (id(self._inner), llm_cache.make_key(self.meta, input), _freeze(kwargs), _freeze(config))
+            result, shared = llm_flights.do(key, lambda: self._provider_call(input, config, kwargs))
+            if shared: result = copy.deepcopy(result)  # Cada turno recebe sua cópia
+        else:
+            # Com amostragem, cada chamador pediu sua própria amostra
+            result = self._provider_call(input, config, kwargs)
+        self._after_call()
+        return result
+
+    def _before_call(self):
+        scope = current_scope()
+        if scope is not None and scope.cancelled:
+            metrics.inc("llm_calls_cancelled_total")
+            scope.check()
+
+    def _after_call(self):
+        scope = current_scope()
+        if scope is not None and scope.cancelled:
+            metrics.inc("llm_calls_discarded_total")
+            scope.check()
+
+    def _provider_call(self, input, config, kwargs, should_stop=None):
+        """
+        Chamada ao provider pelo agendador (rate limit, concorrência, retries, breaker).
+        Saída estruturada que nem o conserto local salvou pede de novo (parse_retries,
+        vindo do with_retry), também pelo agendador.
+        """
+        call = lambda: self._inner.invoke(input, config, **kwargs)  # noqa: E731
+        parse_retries = self.meta.get("parse_retries", 0)
+        with prompt_prefix.track(input, self.meta):
+            for attempt in range(parse_retries + 1):
+                try:
+                    if "tier" not in self.meta: result = call()
+                    else: result = provider_scheduler.call(self.meta["tier"], call, attempts=self.meta.get("attempts", 1), should_stop=should_stop)
+                except PARSE_ERRORS:
+                    # Tentativa que ninguém espera mais (hedge perdedor, timeout) não pede de novo
+                    if attempt == parse_retries or (should_stop is not None and should_stop()): raise
+                    metrics.inc("llm_parse_retries_total", tier=self.meta.get("tier", "?"))
+                    continue
+                break
+            if isinstance(result, AIMessage): prompt_prefix.record_usage(result)
+        return result
+
+
+def _structured_result(schema, output):
+    """Saída do with_structured_output(include_raw=True): mede o uso da resposta crua e conserta o parse."""
+    if isinstance(output, dict): prompt_prefix.record_usage(output.get("raw"))
+    return repair_structured(schema, output)
+
+
+def _repairable(inner, schema, kwargs) -> bool:
+    """Conserto local só para modelos LangChain com schema Pydantic (include_raw expõe a resposta crua)."""
+    return (OUTPUT_REPAIR and isinstance(inner, Runnable) and "include_raw" not in kwargs
+            and isinstance(schema, type) and issubclass(schema, BaseModel))
+
+
+def _freeze(value: Any):
+    """Chave hasheável para argumentos de builder (schemas são classes; tools são listas de dicts)."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return json.dumps(value, sort_keys=True, default=str)
+
+
+# Registro de clientes: (modelo, temperatura, max_retries) -> proxy do cliente
+_CLIENTS: Dict[Tuple[str, float, int], CancellableLLM] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def clear_llm_clients():
+    """Descarta os clientes registrados (ex.: depois de trocar a GOOGLE_API_KEY)."""
+    with _CLIENTS_LOCK:
+        _CLIENTS.clear()
+
+
 def get_llm(temperature: float = 0.1, tier: ModelTier = ModelTier.FAST):
-    """Retorna uma instância configurada do Gemini ou um fallback resiliente."""
+    """Retorna o cliente Gemini compartilhado para (tier, temperatura) ou um fallback resiliente."""
     model = "gemini-flash-latest" if tier == ModelTier.FAST else "gemini-pro-latest"
     max_retries = 3 if tier == ModelTier.FAST else 1
+    key = (model, float(temperature), max_retries)
+
+    # Provider fora: falha rápida pelo caminho do fallback, sem esperar retries a cada nó
+    if provider_scheduler.is_open(tier.value):
+        metrics.inc("provider_fail_fast_total", tier=tier.value)
+        return FallbackLLM("O narrador está indisponível no momento. Tente novamente em instantes.")
+
+    client = _CLIENTS.get(key)
+    if client is not None: return client
+
+    with _CLIENTS_LOCK:
+        if key not in _CLIENTS:
+            client = _create_client(model, temperature, max_retries, tier)
+            # Fallback não entra no registro: a próxima chamada tenta o provider de novo
+            if getattr(client, "is_fallback", False): return client
+            _CLIENTS[key] = client
+        return _CLIENTS[key]
+
+
+def _create_client(model: str, temperature: float, max_retries: int, tier: ModelTier = ModelTier.FAST):
+    # Retries ficam com o agendador (provider_scheduler.py), com orçamento compartilhado
+    meta = {"model": model, "temperature": float(temperature), "tier": tier.value, "attempts": max_retries}
+    if LLM_PROVIDER == "local":
+        # Prefixo no modelo: respostas fake não se misturam às reais no cache (llm_cache.py)
+        return CancellableLLM(LocalLLM(model), {**meta, "model": f"local/{model}"})
 
     try:
-        return ChatGoogleGenerativeAI(
+        return CancellableLLM(ChatGoogleGenerativeAI(
             model=model,
             temperature=temperature,
-            max_retries=max_retries,
+            max_retries=1,  # 1 = sem retries do SDK (0 usaria o padrão do Google)
             safety_settings={
                 HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
                 HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
                 HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
                 HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
             }
-        )
+        ), meta)
     except Exception as exc:  # noqa: BLE001 - captura falhas do provider
         print(
             "[LLM WARNING] Não foi possível inicializar o modelo Gemini. "
@@ -56,3 +298,40 @@ def get_llm(temperature: float = 0.1, tier: ModelTier = ModelTier.FAST):
         print(f"[LLM WARNING] Detalhes: {exc}")
         return FallbackLLM("O narrador está indisponível. Configure GOOGLE_API_KEY e tente novamente.")
 
+
+
+# --- BENCHMARK (python llm_setup.py) ---
+
+def _benchmark(turns: int = 200):
+    """Custo de montagem por turno (sem rede): cliente + runnables novos vs registro/cache."""
+    class Schema(BaseModel):
+        narrative: str
+
+    tools = [{"name": "roll_dice", "description": "Rola dados.", "parameters": {"type": "object", "properties": {}}}]
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark-sem-rede")
+
+    def turn_setup(factory):
+        # Aproximadamente o que um turno monta: router, storyteller (structured+retry), combate (tools)
+        factory(0.0, ModelTier.FAST).with_structured_output(Schema)
+        factory(0.7, ModelTier.FAST).with_structured_output(Schema).with_retry(stop_after_attempt=3)
+        factory(0.2, ModelTier.SMART).bind_tools(tools)
+
+    def fresh(temperature, tier):
+        # Comportamento antigo: cliente novo (e runnables novos) a cada chamada
+        model = "gemini-flash-latest" if tier == ModelTier.FAST else "gemini-pro-latest"
+        return _create_client(model, temperature, 3 if tier == ModelTier.FAST else 1, tier)
+
+    def measure(label, factory):
+        turn_setup(factory)  # aquecimento (imports, primeiro registro)
+        start = time.perf_counter()
+        for _ in range(turns): turn_setup(factory)
+        elapsed = (time.perf_counter() - start) / turns * 1000
+        print(f"   {label:<24} {elapsed:8.3f} ms/turno")
+
+    print(f"⚙️ Montagem de LLMs por turno ({turns} turnos, sem rede)")
+    measure("cliente novo por nó", fresh)
+    measure("registro + cache", get_llm)
+
+
+if __name__ == "__main__":
+    _benchmark()
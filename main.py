@@ -20,11 +20,16 @@ from agents.router import dm_router_node
 from agents.storyteller import storyteller_node
 from agents.loot import loot_node
 from agents.archivist import archive_node # <--- NOVO
+from archive_queue import DEFERRED_ARCHIVAL
 
 load_dotenv()
 
-def build_game_graph():
-    """Constrói e compila o grafo de estados do jogo."""
+def build_game_graph(deferred_archival: bool = DEFERRED_ARCHIVAL):
+    """
+    Constrói e compila o grafo de estados do jogo.
+    Com deferred_archival=True o turno termina no nó que agiu e o arquivamento
+    fica a cargo da fila em background (archive_queue.py).
+    """
     
     workflow = StateGraph(GameState)
 
@@ -35,7 +40,8 @@ def build_game_graph():
     workflow.add_node("combat_agent", combat_node)
     workflow.add_node("npc_actor", npc_actor_node)
     workflow.add_node("loot_agent", loot_node)
-    workflow.add_node("archivist", archive_node) # <--- NOVO
+    if not deferred_archival:
+        workflow.add_node("archivist", archive_node) # <--- NOVO
 
     # 2. Definir o Fluxo Inicial
     workflow.add_edge(START, "campaign_manager")
@@ -55,13 +61,16 @@ def build_game_graph():
     )
 
     # 4. Encerramento com Arquivamento
-    # Todo fim de turno passa pelo arquivista para atualizar memórias
-    workflow.add_edge("storyteller", "archivist")
-    workflow.add_edge("combat_agent", "archivist")
-    workflow.add_edge("npc_actor", "archivist")
-    workflow.add_edge("loot_agent", "archivist")
+    # Modo inline: todo fim de turno passa pelo arquivista para atualizar memórias.
+    # Modo diferido: responde direto e o arquivista roda fora do caminho crítico.
+    turn_end = END if deferred_archival else "archivist"
+    workflow.add_edge("storyteller", turn_end)
+    workflow.add_edge("combat_agent", turn_end)
+    workflow.add_edge("npc_actor", turn_end)
+    workflow.add_edge("loot_agent", turn_end)
     
-    workflow.add_edge("archivist", END) # O arquivista encerra o turno
+    if not deferred_archival:
+        workflow.add_edge("archivist", END) # O arquivista encerra o turno
 
     # Compila o grafo
     return workflow.compile()
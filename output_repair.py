@@ -0,0 +1,236 @@
+"""
+output_repair.py
+Conserto Local de Saída Estruturada (antes de pedir de novo ao modelo).
+Quando o parse do with_structured_output falha, a resposta crua quase sempre
+está "quase certa": JSON com texto em volta ou cercado por ```json, vírgula
+sobrando, string no lugar de lista (EnemySchema.attacks), número como texto
+("+5"), campo Optional que o modelo omitiu. Antes de gastar outra chamada
+(with_retry) ou cair no texto de fallback do nó, tentamos, contra o schema Pydantic:
+1. extrair o JSON (tool_calls, tool_calls inválidas ou o texto da mensagem);
+2. coagir os tipos campo a campo (listas, números, booleanos, enums, sub-modelos);
+3. preencher com None os campos Optional ausentes.
+Se ainda assim não validar, o erro original sobe e o nó segue como antes.
+Resultado por schema em structured_output_repairs_total{schema,outcome}.
+"""
+import collections.abc
+import enum
+import json
+import os
+import re
+import typing
+from typing import Any, Iterator, Optional, Type
+
+from langchain_core.exceptions import OutputParserException
+from pydantic import BaseModel, ValidationError
+
+from metrics import metrics
+
+# --- CONFIGURAÇÃO ---
+OUTPUT_REPAIR = os.getenv("OUTPUT_REPAIR", "1") == "1"
+
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_INT_RE = re.compile(r"[-+]?\d+")
+_FLOAT_RE = re.compile(r"[-+]?\d+(?:[.,]\d+)?")
+_TRUE = {"true", "sim", "yes", "1", "verdadeiro"}
+_FALSE = {"false", "não", "nao", "no", "0", "falso"}
+
+metrics.describe("structured_output_repairs_total", "Saídas estruturadas inválidas consertadas localmente (outcome=repaired|failed), por schema")
+
+
+# --- EXTRAÇÃO DE JSON ---
+def _text_of(content: Any) -> str:
+    """Conteúdo da mensagem como texto (o Gemini pode devolver lista de partes)."""
+    if isinstance(content, list):
+        return "".join(p if isinstance(p, str) else str(p.get("text", "")) for p in content if isinstance(p, (str, dict)))
+    return content if isinstance(content, str) else ""
+
+
+def _balanced(text: str, start: int) -> Optional[str]:
+    """Trecho de `text` do `{`/`[` em `start` até o fechamento correspondente (respeitando strings)."""
+    depth, in_string, escaped = 0, False, False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped: escaped = False
+            elif ch == "\\": escaped = True
+            elif ch == '"': in_string = False
+        elif ch == '"': in_string = True
+        elif ch in "{[": depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0: return text[start:i + 1]
+    return None
+
+
+def _loads(candidate: str) -> Any:
+    try: return json.loads(candidate)
+    except ValueError: pass
+    cleaned = _TRAILING_COMMA_RE.sub(r"\1", candidate)
+    cleaned = re.sub(r"\b(True|False|None)\b", lambda m: _PY_LITERALS[m.group(1)], cleaned)
+    try: return json.loads(cleaned)
+    except ValueError: return None
+
+
+def extract_json(text: str) -> Any:
+    """Primeiro objeto/lista JSON válido em `text` (cercas de código e texto em volta são ignorados)."""
+    if not text: return None
+    fenced = _FENCE_RE.search(text)
+    if fenced: text = fenced.group(1)
+    parsed = _loads(text.strip())
+    if parsed is not None: return parsed
+    for match in re.finditer(r"[{\[]", text):
+        chunk = _balanced(text, match.start())
+        if chunk is None: continue
+        parsed = _loads(chunk)
+        if parsed is not None: return parsed
+    return None
+
+
+# --- COERÇÃO CONTRA O SCHEMA ---
+def _is_model(annotation: Any) -> bool:
+    return isinstance(annotation, type) and issubclass(annotation, BaseModel)
+
+
+def coerce_value(value: Any, annotation: Any) -> Any:
+    """Aproxima `value` do tipo `annotation`. Sem conversão segura, devolve o valor como veio."""
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+
+    if origin is typing.Union or (origin is not None and type(None) in args):
+        if value is None: return None
+        options = [a for a in args if a is not type(None)]
+        return coerce_value(value, options[0]) if len(options) == 1 else value
+
+    if _is_model(annotation):
+        if isinstance(value, str): value = extract_json(value)
+        if isinstance(value, list) and len(value) == 1: value = value[0]
+        return coerce_model(value, annotation) if isinstance(value, dict) else value
+
+    if isinstance(annotation, type) and issubclass(annotation, enum.Enum):
+        if isinstance(value, str):
+            wanted = value.strip().lower()
+            for member in annotation:
+                if wanted in (str(member.value).lower(), member.name.lower()): return member.value
+        return value
+
+    if origin in (list, tuple, set, collections.abc.Sequence) or annotation in (list, tuple, set):
+        item_type = args[0] if args else Any
+        if isinstance(value, str):
+            parsed = extract_json(value)
+            if isinstance(parsed, list): value = parsed
+            elif isinstance(parsed, dict): value = [parsed]
+            else: value = [part.strip(" -•*") for part in re.split(r"\n|;", value) if part.strip(" -•*")]
+        elif isinstance(value, dict):
+            value = [value]
+        if isinstance(value, list):
+            return [coerce_value(v, item_type) for v in value] if item_type is not Any else value
+        return value
+
+    if origin is dict or annotation is dict:
+        if isinstance(value, str):
+            parsed = extract_json(value)
+            if isinstance(parsed, dict): value = parsed
+        if isinstance(value, dict) and len(args) == 2:
+            return {k: coerce_value(v, args[1]) for k, v in value.items()}
+        return value
+
+    if annotation is bool:
+        if isinstance(value, str):
+            word = value.strip().lower()
+            if word in _TRUE: return True
+            if word in _FALSE: return False
+        return value
+
+    if annotation is int:
+        if isinstance(value, float) and value.is_integer(): return int(value)
+        if isinstance(value, str):
+            match = _INT_RE.search(value)
+            if match: return int(match.group())
+        return value
+
+    if annotation is float:
+        if isinstance(value, str):
+            match = _FLOAT_RE.search(value)
+            if match: return float(match.group().replace(",", "."))
+        return value
+
+    if annotation is str:
+        if isinstance(value, bool): return value
+        if isinstance(value, (int, float)): return str(value)
+        if isinstance(value, list) and all(isinstance(v, (str, int, float)) for v in value):
+            return ", ".join(str(v) for v in value)
+        return value
+
+    return value
+
+
+def coerce_model(data: dict, schema: Type[BaseModel]) -> dict:
+    """Dict pronto para `schema.model_validate`: chaves normalizadas, tipos coagidos, Optional ausentes = None."""
+    fields = schema.model_fields
+    # {"EnemySchema": {...}} / {"properties": {...}}: o modelo embrulhou o objeto
+    if len(data) == 1:
+        (key, inner), = data.items()
+        if key not in fields and isinstance(inner, dict): data = inner
+
+    by_lower = {name.lower(): name for name in fields}
+    by_lower.update({info.alias.lower(): name for name, info in fields.items() if info.alias})
+    fixed = {}
+    for key, value in data.items():
+        name = by_lower.get(str(key).strip().lower(), key)
+        fixed[name] = coerce_value(value, fields[name].annotation) if name in fields else value
+
+    for name, info in fields.items():
+        if name in fixed or not info.is_required(): continue
+        if type(None) in typing.get_args(info.annotation): fixed[name] = None
+    return fixed
+
+
+# --- CONSERTO ---
+def _candidates(raw: Any) -> Iterator[Any]:
+    """Possíveis objetos na resposta crua: args das tool_calls, tool_calls inválidas e o texto."""
+    if isinstance(raw, str):
+        yield extract_json(raw)
+        return
+    for call in getattr(raw, "tool_calls", None) or []:
+        yield call.get("args")
+    for call in getattr(raw, "invalid_tool_calls", None) or []:
+        args = call.get("args")
+        yield extract_json(args) if isinstance(args, str) else args
+    yield extract_json(_text_of(getattr(raw, "content", None)))
+
+
+def repair(raw: Any, schema: Type[BaseModel]) -> Optional[BaseModel]:
+    """Tenta montar `schema` a partir da resposta crua (AIMessage ou texto). None se não der."""
+    for candidate in _candidates(raw):
+        if isinstance(candidate, list) and len(candidate) == 1: candidate = candidate[0]
+        if not isinstance(candidate, dict): continue
+        try:
+            return schema.model_validate(coerce_model(candidate, schema))
+        except (ValidationError, TypeError, ValueError):
+            continue
+    return None
+
+
+def repair_structured(schema: Type[BaseModel], output: Any) -> Any:
+    """
+    Etapa final do with_structured_output(include_raw=True) montado pelo llm_setup.
+    Parse bem-sucedido passa direto; falha tenta o conserto local e, se não
+    der, levanta o erro original (para o with_retry / fallback do nó).
+    """
+    if not isinstance(output, dict) or "raw" not in output: return output
+    error = output.get("parsing_error")
+    if error is None and output.get("parsed") is not None: return output["parsed"]
+
+    name = schema.__name__
+    fixed = repair(output["raw"], schema)
+    if fixed is not None:
+        metrics.inc("structured_output_repairs_total", schema=name, outcome="repaired")
+        print(f"🩹 [REPAIR] {name}: saída consertada localmente (sem nova chamada)")
+        return fixed
+
+    metrics.inc("structured_output_repairs_total", schema=name, outcome="failed")
+    if error is None: return None  # O parser não reclamou: mantém o comportamento original
+    print(f"⚠️ [REPAIR] {name}: conserto local falhou ({type(error).__name__})")
+    raise error if isinstance(error, BaseException) else OutputParserException(str(error))
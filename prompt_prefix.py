@@ -0,0 +1,215 @@
+"""
+prompt_prefix.py
+Prefixo Estável de Prompt (cache de contexto do provider).
+O Gemini reaproveita o começo idêntico de requisições recentes (cache implícito
+de prefixo: tokens lidos do cache custam menos e saem mais rápido), mas só se
+os primeiros tokens forem byte a byte iguais. Valor dinâmico (local, jogador,
+lore) no meio das instruções quebra o prefixo a cada turno.
+Cada agente registra a parte fixa do seu prompt (register_prefix) e monta a
+mensagem com PREFIXO.render(sufixo): instruções fixas primeiro, dados do turno depois.
+- Estabilidade: registrar de novo um nome com outro texto conta em
+  prompt_prefix_changes_total (sinal de que o "fixo" está variando).
+- Medição: tokens de entrada e tokens lidos do cache (usage_metadata) por prefixo,
+  em prompt_input_tokens_total / prompt_cached_tokens_total; cached_ratio_report().
+- Mínimo do provider: o cache (implícito ou explícito) só vale a partir de
+  ~1024 tokens estáticos no Flash e ~4096 no Pro (tools + schema + system).
+  Hoje nenhum prefixo chega lá (cacheable_report(): ~50 a ~220 tokens de
+  instruções); a separação prefixo/sufixo deixa os prompts prontos para quando
+  crescerem e a medição mostra se houve acerto. O CachedContent explícito, além
+  do mínimo, proíbe system_instruction e tools na chamada.
+- PrefixCacheStandIn: imitação local do cache de prefixo com o mesmo mínimo do
+  provider, usada pelo LocalLLM e nos testes.
+"""
+import hashlib
+import json
+import os
+import textwrap
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from langchain_core.messages import SystemMessage
+
+from context_builder import estimate_tokens
+from metrics import metrics
+
+# --- CONFIGURAÇÃO ---
+# Prefixo mínimo que o provider cacheia, por família de modelo (tools + schema + system)
+PREFIX_CACHE_MIN_TOKENS = {
+    "flash": int(os.getenv("PREFIX_CACHE_MIN_TOKENS_FLASH", "1024")),
+    "pro": int(os.getenv("PREFIX_CACHE_MIN_TOKENS_PRO", "4096")),
+}
+PREFIX_CACHE_MAX_ENTRIES = 256
+SUFFIX_SEPARATOR = "\n\n"
+
+metrics.describe("prompt_prefix_changes_total", "Prefixos re-registrados com texto diferente (prefixo instável)")
+metrics.describe("prompt_input_tokens_total", "Tokens de entrada das chamadas de LLM, por prefixo")
+metrics.describe("prompt_cached_tokens_total", "Tokens de entrada lidos do cache de contexto do provider, por prefixo")
+
+
+class PromptPrefix:
+    """Parte fixa do prompt de um agente (instruções, persona, exemplos)."""
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.text = textwrap.dedent(text).strip()
+        self.digest = hashlib.sha256(self.text.encode("utf-8")).hexdigest()[:16]
+        self.tokens = estimate_tokens(self.text)
+
+    def render(self, dynamic: str = "") -> str:
+        """Prefixo fixo seguido do trecho dinâmico do turno."""
+        dynamic = textwrap.dedent(dynamic).strip()
+        return self.text + (SUFFIX_SEPARATOR + dynamic if dynamic else "")
+
+    def system(self, dynamic: str = "") -> SystemMessage:
+        return SystemMessage(content=self.render(dynamic))
+
+
+_registry: Dict[str, PromptPrefix] = {}
+_registry_lock = threading.Lock()
+
+
+def register_prefix(name: str, text: str) -> PromptPrefix:
+    """Registra (ou devolve) o prefixo fixo `name`. Mesmo nome com outro texto é instabilidade."""
+    prefix = PromptPrefix(name, text)
+    with _registry_lock:
+        current = _registry.get(name)
+        if current is not None and current.digest != prefix.digest:
+            metrics.inc("prompt_prefix_changes_total", prefix=name)
+            print(f"⚠️ [PREFIX] Prefixo '{name}' mudou ({current.digest} -> {prefix.digest}): cache do provider perdido")
+        _registry[name] = prefix
+    return prefix
+
+
+def prefix_of(messages: Any) -> Optional[PromptPrefix]:
+    """Prefixo registrado com que a primeira SystemMessage da requisição começa (None se nenhum)."""
+    if isinstance(messages, str) or not messages: return None
+    first = messages[0]
+    if not isinstance(first, SystemMessage): return None
+    content = str(first.content)
+    with _registry_lock:
+        matches = [p for p in _registry.values() if content.startswith(p.text)]
+    return max(matches, key=lambda p: len(p.text)) if matches else None
+
+
+def min_cache_tokens(model: Optional[str]) -> int:
+    return PREFIX_CACHE_MIN_TOKENS["pro" if "pro" in (model or "") else "flash"]
+
+
+def static_text(schema: Any = None, tools: Any = None) -> str:
+    """Parte fixa que o provider recebe antes do system: declarações de tools e o schema da resposta."""
+    parts = []
+    if tools: parts.append(json.dumps(tools, sort_keys=True, ensure_ascii=False, default=str))
+    if isinstance(schema, type) and hasattr(schema, "model_json_schema"):
+        parts.append(json.dumps(schema.model_json_schema(), sort_keys=True, ensure_ascii=False))
+    return "\n".join(parts)
+
+
+# --- MEDIÇÃO ---
+_active: ContextVar[Optional[str]] = ContextVar("prompt_prefix", default=None)
+_seen = set()
+# prefixo -> maior parte estática vista (tokens) e mínimo do modelo usado
+_footprints: Dict[str, Dict[str, int]] = {}
+
+
+@contextmanager
+def track(messages: Any, meta: Optional[Dict[str, Any]] = None):
+    """Marca o prefixo da requisição em andamento (para record_usage, inclusive no parse estruturado)."""
+    prefix = prefix_of(messages)
+    if prefix is not None and meta is not None:
+        static = prefix.tokens + estimate_tokens(static_text(meta.get("schema"), meta.get("tools")))
+        with _registry_lock:
+            seen = _footprints.setdefault(prefix.name, {"static_tokens": 0, "min_tokens": 0})
+            seen["static_tokens"] = max(seen["static_tokens"], static)
+            seen["min_tokens"] = max(seen["min_tokens"], min_cache_tokens(meta.get("model")))
+    token = _active.set(prefix.name if prefix else "none")
+    try:
+        yield prefix
+    finally:
+        _active.reset(token)
+
+
+def usage_of(message: Any) -> Optional[Dict[str, Any]]:
+    usage = message if isinstance(message, dict) else getattr(message, "usage_metadata", None)
+    return usage or None
+
+
+def record_usage(message: Any):
+    """Contabiliza tokens de entrada / lidos do cache de uma resposta (AIMessage ou usage_metadata)."""
+    usage = usage_of(message)
+    if usage is None: return
+    name = _active.get() or "none"
+    _seen.add(name)
+    metrics.inc("prompt_input_tokens_total", usage.get("input_tokens", 0) or 0, prefix=name)
+    cached = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+    if cached: metrics.inc("prompt_cached_tokens_total", cached, prefix=name)
+
+
+def cached_ratio_report() -> Dict[str, Dict[str, float]]:
+    """Fração dos tokens de entrada servida pelo cache, por prefixo (desde o início do processo)."""
+    report = {}
+    for name in sorted(_seen):
+        total = metrics.get("prompt_input_tokens_total", prefix=name)
+        cached = metrics.get("prompt_cached_tokens_total", prefix=name)
+        report[name] = {"input_tokens": total, "cached_tokens": cached, "cached_ratio": round(cached / total, 3) if total else 0.0}
+    return report
+
+
+def cacheable_report() -> Dict[str, Dict[str, Any]]:
+    """
+    Por prefixo registrado: tokens estáticos (system + schema + tools das chamadas
+    vistas; só o system se o prefixo ainda não foi usado), o mínimo do provider e
+    se o prefixo chega a ser cacheável.
+    """
+    report = {}
+    with _registry_lock:
+        for name, prefix in sorted(_registry.items()):
+            seen = _footprints.get(name, {})
+            static = max(seen.get("static_tokens", 0), prefix.tokens)
+            minimum = seen.get("min_tokens") or PREFIX_CACHE_MIN_TOKENS["flash"]
+            report[name] = {"static_tokens": static, "min_tokens": minimum, "qualifies": static >= minimum}
+    return report
+
+
+# --- STAND-IN LOCAL ---
+def request_text(messages: Any, schema: Any = None, tools: Any = None) -> str:
+    """Serialização da requisição na ordem em que o provider a recebe (tools e schema, instruções, conversa)."""
+    body = messages if isinstance(messages, str) else \
+        "\n".join(f"{getattr(m, 'type', 'text')}: {getattr(m, 'content', m)}" for m in messages)
+    static = static_text(schema, tools)
+    return static + "\n" + body if static else body
+
+
+class PrefixCacheStandIn:
+    """
+    Imitação do cache implícito de prefixo: cada requisição lê do "cache" o maior
+    começo em comum com as requisições recentes, se tiver ao menos o mínimo do
+    provider para o modelo (ou `min_tokens`, se dado).
+    """
+
+    def __init__(self, min_tokens: Optional[int] = None, max_entries: int = PREFIX_CACHE_MAX_ENTRIES):
+        self.min_tokens = min_tokens
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        self._max = max_entries
+        self._lock = threading.Lock()
+
+    def observe(self, messages: Any, model: Optional[str] = None, schema: Any = None, tools: Any = None) -> Dict[str, Any]:
+        """Registra a requisição e devolve o usage_metadata que o provider reportaria."""
+        text = request_text(messages, schema, tools)
+        minimum = self.min_tokens if self.min_tokens is not None else min_cache_tokens(model)
+        with self._lock:
+            common = max((len(os.path.commonprefix([text, seen])) for seen in self._recent), default=0)
+            self._recent[text] = None
+            self._recent.move_to_end(text)
+            while len(self._recent) > self._max: self._recent.popitem(last=False)
+        input_tokens = estimate_tokens(text)
+        cached = min(estimate_tokens(text[:common]), input_tokens)
+        if cached < minimum: cached = 0
+        return {"input_tokens": input_tokens, "output_tokens": 0, "total_tokens": input_tokens,
+                "input_token_details": {"cache_read": cached}}
+
+
+# Instância global (provider local)
+local_prefix_cache = PrefixCacheStandIn()
@@ -0,0 +1,296 @@
+"""
+provider_scheduler.py
+Agendador Compartilhado do Provider de LLM (por tier de modelo).
+- Token bucket: limita requisições por segundo de cada tier (PROVIDER_RPS_*).
+- Concorrência limitada: no máximo PROVIDER_MAX_CONCURRENT_* chamadas em voo.
+- Retries com backoff exponencial + jitter, debitados de um orçamento global
+  (RetryBudget): numa tempestade de 429 os nós param de multiplicar a carga.
+- Circuit breaker: após PROVIDER_BREAKER_FAILURES falhas seguidas o tier abre e
+  get_llm devolve o FallbackLLM (falha rápida) até o cooldown; depois uma
+  chamada de teste (half-open) decide se fecha.
+- Latência observada por tier (janela das últimas chamadas), usada pelo tier_policy.py.
+Métricas provider_* em GET /metrics.
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+from langchain_core.exceptions import ModelConnectionError, ModelRateLimitError, ModelTimeoutError
+
+from metrics import metrics
+
+# --- CONFIGURAÇÃO ---
+PROVIDER_LIMITS = {
+    "fast": {
+        "rps": float(os.getenv("PROVIDER_RPS_FAST", "20")),
+        "burst": float(os.getenv("PROVIDER_BURST_FAST", "40")),
+        "concurrency": int(os.getenv("PROVIDER_MAX_CONCURRENT_FAST", "16")),
+    },
+    "smart": {
+        "rps": float(os.getenv("PROVIDER_RPS_SMART", "5")),
+        "burst": float(os.getenv("PROVIDER_BURST_SMART", "10")),
+        "concurrency": int(os.getenv("PROVIDER_MAX_CONCURRENT_SMART", "6")),
+    },
+}
+PROVIDER_QUEUE_TIMEOUT = float(os.getenv("PROVIDER_QUEUE_TIMEOUT", "15"))
+PROVIDER_BACKOFF_BASE = float(os.getenv("PROVIDER_BACKOFF_BASE", "0.5"))
+PROVIDER_BACKOFF_MAX = float(os.getenv("PROVIDER_BACKOFF_MAX", "8"))
+# Cada requisição bem-sucedida deposita RATIO de retry; o saldo nunca passa de MAX
+PROVIDER_RETRY_RATIO = float(os.getenv("PROVIDER_RETRY_RATIO", "0.2"))
+PROVIDER_RETRY_MAX = float(os.getenv("PROVIDER_RETRY_MAX", "10"))
+PROVIDER_BREAKER_FAILURES = int(os.getenv("PROVIDER_BREAKER_FAILURES", "5"))
+PROVIDER_BREAKER_COOLDOWN = float(os.getenv("PROVIDER_BREAKER_COOLDOWN_SECONDS", "30"))
+PROVIDER_LATENCY_WINDOW = 100
+PROVIDER_LATENCY_MIN_SAMPLES = int(os.getenv("PROVIDER_LATENCY_MIN_SAMPLES", "5"))
+
+metrics.describe("provider_requests_total", "Chamadas ao provider por tier e resultado (ok, error, rejected)")
+metrics.describe("provider_retries_total", "Retries feitos pelo agendador, por tier")
+metrics.describe("provider_retry_budget_exhausted_total", "Retries negados por falta de orçamento")
+metrics.describe("provider_wait_seconds", "Espera por token do rate limit e vaga de concorrência")
+metrics.describe("provider_inflight", "Chamadas ao provider em andamento, por tier")
+metrics.describe("provider_circuit_state", "Estado do circuit breaker (0 fechado, 1 half-open, 2 aberto)")
+metrics.describe("provider_fail_fast_total", "Chamadas recusadas na hora pelo circuit breaker aberto")
+metrics.describe("provider_latency_seconds", "Latência das chamadas bem-sucedidas ao provider, por tier")
+
+# Erros transitórios: status HTTP (ClientError/ServerError do google-genai guardam em .code,
+# httpx em .response.status_code) ou tipo da exceção (rede, timeout, rate limit do LangChain)
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+_RETRYABLE_TYPES = (TimeoutError, ConnectionError, httpx.TransportError,
+                    ModelRateLimitError, ModelConnectionError, ModelTimeoutError)
+
+
+class ProviderUnavailable(Exception):
+    """Provider fora (circuit breaker aberto) ou fila do rate limit cheia demais."""
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    code = getattr(exc, "code", None)
+    if code is None: code = getattr(getattr(exc, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """429/5xx/timeout/rede, olhando a exceção e as causas encadeadas (o LangChain reembrulha as do SDK)."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, ProviderUnavailable): return False
+        code = _status_code(exc)
+        if code is not None: return code in _RETRYABLE_STATUS
+        if isinstance(exc, _RETRYABLE_TYPES): return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline: return False
+            time.sleep(wait)
+
+
+class RetryBudget:
+    """Orçamento global de retries: sucesso deposita `ratio`, cada retry gasta 1."""
+
+    def __init__(self, ratio: float = PROVIDER_RETRY_RATIO, maximum: float = PROVIDER_RETRY_MAX):
+        self.ratio = ratio
+        self.maximum = maximum
+        self._balance = maximum
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._balance = min(self.maximum, self._balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._balance < 1: return False
+            self._balance -= 1
+            return True
+
+
+class CircuitBreaker:
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, tier: str, failures: int = PROVIDER_BREAKER_FAILURES, cooldown: float = PROVIDER_BREAKER_COOLDOWN):
+        self.tier = tier
+        self.threshold = failures
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+
+    def _set(self, state: int):
+        if state != self.state:
+            label = {self.CLOSED: "fechado", self.HALF_OPEN: "half-open", self.OPEN: "aberto"}[state]
+            print(f"🔌 [PROVIDER] Circuit breaker '{self.tier}': {label}")
+        self.state = state
+        metrics.set_gauge("provider_circuit_state", state, tier=self.tier)
+
+    def is_open(self) -> bool:
+        """Aberto e ainda em cooldown (sem consumir a vaga de teste)."""
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self._opened_at < self.cooldown
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED: return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.cooldown: return False
+                self._set(self.HALF_OPEN)
+            if self._probing: return False  # Half-open: uma chamada de teste por vez
+            self._probing = True
+            return True
+
+    def release_probe(self):
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self._set(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+                self._set(self.OPEN)
+
+
+class TierScheduler:
+    def __init__(self, tier: str, rps: float, burst: float, concurrency: int):
+        self.tier = tier
+        self.bucket = TokenBucket(rps, burst)
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.breaker = CircuitBreaker(tier)
+        self.latencies = deque(maxlen=PROVIDER_LATENCY_WINDOW)
+        self._inflight = 0
+        self._lock = threading.Lock()
+
+    def _track(self, delta: int):
+        with self._lock:
+            self._inflight += delta
+            metrics.set_gauge("provider_inflight", self._inflight, tier=self.tier)
+
+    def attempt(self, fn: Callable[[], Any], should_stop: Optional[Callable[[], bool]] = None) -> Any:
+        """Uma tentativa: espera token e vaga (até PROVIDER_QUEUE_TIMEOUT) e chama o provider."""
+        start = time.monotonic()
+        if not self.bucket.acquire(PROVIDER_QUEUE_TIMEOUT):
+            metrics.inc("provider_requests_total", tier=self.tier, outcome="rejected")
+            raise ProviderUnavailable(f"Rate limit do tier '{self.tier}' saturado.")
+        remaining = max(0.0, PROVIDER_QUEUE_TIMEOUT - (time.monotonic() - start))
+        if not self.slots.acquire(timeout=remaining):
+            metrics.inc("provider_requests_total", tier=self.tier, outcome="rejected")
+            raise ProviderUnavailable(f"Concorrência do tier '{self.tier}' esgotada.")
+        metrics.observe("provider_wait_seconds", time.monotonic() - start, tier=self.tier)
+        if should_stop is not None and should_stop():
+            # Desistiram enquanto esperava na fila (ex.: hedge perdedor): não gasta a chamada
+            self.slots.release()
+            raise ProviderUnavailable("Chamada cancelada antes de chegar ao provider.")
+        self._track(+1)
+        try:
+            called = time.monotonic()
+            result = fn()
+            elapsed = time.monotonic() - called
+            with self._lock: self.latencies.append(elapsed)
+            metrics.observe("provider_latency_seconds", elapsed, tier=self.tier)
+            return result
+        finally:
+            self._track(-1)
+            self.slots.release()
+
+
+class ProviderScheduler:
+    def __init__(self, limits: Optional[Dict[str, Dict[str, float]]] = None, retry_budget: Optional[RetryBudget] = None):
+        limits = limits or PROVIDER_LIMITS
+        self.tiers = {name: TierScheduler(name, cfg["rps"], cfg["burst"], int(cfg["concurrency"])) for name, cfg in limits.items()}
+        self.retry_budget = retry_budget or RetryBudget()
+        self._listeners: List[Callable[[str], None]] = []
+
+    def add_listener(self, fn: Callable[[str], None]):
+        """`fn(tier)` a cada chamada que o provider atendeu (ex.: custo por jogo no tier_policy)."""
+        self._listeners.append(fn)
+
+    def is_open(self, tier: str) -> bool:
+        scheduler = self.tiers.get(tier)
+        return scheduler is not None and scheduler.breaker.is_open()
+
+    def latency(self, tier: str, q: float = 0.9) -> Optional[float]:
+        """Quantil `q` da latência recente do tier (None sem amostras suficientes)."""
+        scheduler = self.tiers.get(tier)
+        if scheduler is None: return None
+        with scheduler._lock:
+            samples = sorted(scheduler.latencies)
+        if len(samples) < PROVIDER_LATENCY_MIN_SAMPLES: return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def call(self, tier: str, fn: Callable[[], Any], attempts: int = 1,
+             should_stop: Optional[Callable[[], bool]] = None) -> Any:
+        """`should_stop()` True interrompe os retries (chamada que ninguém mais espera)."""
+        scheduler = self.tiers.get(tier)
+        if scheduler is None: return fn()
+
+        breaker = scheduler.breaker
+        for attempt in range(1, attempts + 1):
+            if not breaker.allow():
+                metrics.inc("provider_fail_fast_total", tier=tier)
+                raise ProviderUnavailable(f"Provider '{tier}' indisponível (circuit breaker aberto).")
+            try:
+                result = scheduler.attempt(fn, should_stop)
+            except ProviderUnavailable:
+                breaker.release_probe()  # Nem chegou ao provider: não é sinal de saúde nem de falha
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    # Erro do pedido (schema, parse): o provider respondeu, não conta contra ele
+                    breaker.record_success()
+                    metrics.inc("provider_requests_total", tier=tier, outcome="error")
+                    raise
+                breaker.record_failure()
+                metrics.inc("provider_requests_total", tier=tier, outcome="error")
+                if attempt == attempts or (should_stop is not None and should_stop()): raise
+                if not self.retry_budget.withdraw():
+                    metrics.inc("provider_retry_budget_exhausted_total", tier=tier)
+                    raise
+                metrics.inc("provider_retries_total", tier=tier)
+                # Full jitter: espalha os retries de muitos turnos no tempo
+                time.sleep(random.uniform(0, min(PROVIDER_BACKOFF_MAX, PROVIDER_BACKOFF_BASE * 2 ** (attempt - 1))))
+                continue
+            except BaseException:
+                breaker.release_probe()
+                raise
+            breaker.record_success()
+            self.retry_budget.deposit()
+            metrics.inc("provider_requests_total", tier=tier, outcome="ok")
+            for listener in self._listeners: listener(tier)
+            return result
+
+
+# Instância global
+provider_scheduler = ProviderScheduler()
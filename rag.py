@@ -4,33 +4,54 @@ Sistema Híbrido: Global Lore (Google Gemini) + Session Memory.
 Mantém compatibilidade com indexação de arquivos de texto e busca contextual.
 """
 import os
+import shutil
 from typing import List, Optional
+from langchain_core.embeddings import Embeddings
 from langchain_community.vectorstores import FAISS
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_community.document_loaders import TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from dotenv import load_dotenv
 
+from singleflight import embedding_flights
+
 load_dotenv()
 
 # Configurações de Caminho
 SAVES_DIR = "data/saves_memory" # Pasta onde ficam os vetores dos saves individuais
 
-_embeddings: Optional[GoogleGenerativeAIEmbeddings] = None
+class CoalescingEmbeddings(Embeddings):
+    """Embeddings com coalescência: a mesma consulta simultânea vira uma chamada só (singleflight.py)."""
+
+    def __init__(self, inner: Embeddings):
+        self.inner = inner
+
+    def embed_query(self, text: str) -> List[float]:
+        result, _shared = embedding_flights.do(("query", text), lambda: self.inner.embed_query(text))
+        return list(result)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        result, _shared = embedding_flights.do(("documents", tuple(texts)), lambda: self.inner.embed_documents(texts))
+        return [list(vector) for vector in result]
 
-def get_embeddings() -> Optional[GoogleGenerativeAIEmbeddings]:
+_embeddings: Optional[Embeddings] = None
+
+def get_embeddings() -> Optional[Embeddings]:
     """Inicializa embeddings do Google sob demanda."""
     global _embeddings
     if _embeddings:
         return _embeddings
 
+    if os.getenv("LLM_PROVIDER", "google") == "local":
+        return None  # Provider offline: sem embeddings (RAG vazio)
+
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
         print("[RAG] GOOGLE_API_KEY não configurada. Embeddings desativados.")
         return None
 
     try:
-        _embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
+        _embeddings = CoalescingEmbeddings(GoogleGenerativeAIEmbeddings(model="models/text-embedding-004"))
     except Exception as exc:
         print(f"[RAG] Falha ao inicializar embeddings: {exc}")
         _embeddings = None
@@ -93,9 +114,10 @@ def query_rag(query: str, index_name: str = "lore", game_id: Optional[str] = Non
             
     return "\n---\n".join(final_text)
 
-def add_memory_to_session(game_id: str, texts: List[str]):
+def add_memory_to_session(game_id: str, texts: List[str], turn: Optional[int] = None):
     """
     Adiciona novas memórias ao índice específico deste save (game_id).
+    O turno vai como metadado para permitir rollback (rewind) da memória.
     """
     if not game_id or not texts: return
 
@@ -103,16 +125,17 @@ def add_memory_to_session(game_id: str, texts: List[str]):
     if not embeddings: return
 
     session_path = _get_session_path(game_id)
+    metadatas = [{"turn": turn} for _ in texts] if turn is not None else None
     
     try:
         if os.path.exists(session_path):
             # Carrega existente
             db = FAISS.load_local(session_path, embeddings, allow_dangerous_deserialization=True)
-            db.add_texts(texts)
+            db.add_texts(texts, metadatas=metadatas)
         else:
             # Cria novo
             if not os.path.exists(SAVES_DIR): os.makedirs(SAVES_DIR)
-            db = FAISS.from_texts(texts, embeddings)
+            db = FAISS.from_texts(texts, embeddings, metadatas=metadatas)
 
         # Salva
         db.save_local(session_path)
@@ -121,6 +144,38 @@ def add_memory_to_session(game_id: str, texts: List[str]):
     except Exception as e:
         print(f"❌ [RAG ERROR] Falha ao salvar memória: {e}")
 
+def rollback_session_memory(game_id: str, turn: int) -> int:
+    """
+    Remove da memória da sessão os fatos gravados depois de `turn`.
+    Fatos antigos sem metadado de turno são mantidos. Retorna quantos foram removidos.
+    """
+    session_path = _get_session_path(game_id) if game_id else None
+    if not session_path or not os.path.exists(session_path): return 0
+
+    embeddings = get_embeddings()
+    if not embeddings: return 0
+
+    try:
+        db = FAISS.load_local(session_path, embeddings, allow_dangerous_deserialization=True)
+        stale_ids = []
+        for doc_id in db.index_to_docstore_id.values():
+            doc = db.docstore.search(doc_id)
+            if (getattr(doc, "metadata", None) or {}).get("turn", -1) > turn:
+                stale_ids.append(doc_id)
+        if not stale_ids: return 0
+
+        if len(stale_ids) == len(db.index_to_docstore_id):
+            shutil.rmtree(session_path)
+        else:
+            db.delete(stale_ids)
+            db.save_local(session_path)
+        print(f"⏪ [RAG] Memória da sessão '{game_id}' voltou ao turno {turn}: -{len(stale_ids)} fatos.")
+        return len(stale_ids)
+
+    except Exception as e:
+        print(f"❌ [RAG ERROR] Falha no rollback da memória: {e}")
+        return 0
+
 # --- FUNÇÕES DE UTILIDADE (Setup Inicial) ---
 
 def ingest_file(file_path: str, index_name: str):
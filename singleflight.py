@@ -0,0 +1,70 @@
+"""
+singleflight.py
+Coalescência de Chamadas em Andamento (single-flight).
+Chamadas idênticas e simultâneas (mesmo tema de classe, mesma lore de região,
+mesmo monstro pedido por várias sessões) viram uma única chamada ao provider:
+a primeira executa, as demais esperam e recebem o mesmo resultado (ou erro).
+Diferente de idempotency.py, nada fica guardado depois que a chamada termina.
+Usado pelo proxy de LLM (llm_setup.CancellableLLM) e pelos embeddings do RAG.
+"""
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from metrics import metrics
+
+# --- CONFIGURAÇÃO ---
+SINGLEFLIGHT_ENABLED = os.getenv("LLM_SINGLEFLIGHT", "1") != "0"
+
+metrics.describe("provider_calls_coalesced_total", "Chamadas idênticas que aproveitaram uma chamada já em andamento")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Executa `fn` uma vez por chave em andamento. Retorna (resultado, shared)."""
+        if not SINGLEFLIGHT_ENABLED: return fn(), False
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.inc("provider_calls_coalesced_total", kind=self.kind)
+            call.done.wait()
+            if call.error is not None: raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # Sai do mapa antes de acordar: quem chegar depois faz uma chamada nova
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+# Instâncias globais
+llm_flights = SingleFlight("llm")
+embedding_flights = SingleFlight("embedding")
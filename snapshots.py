@@ -0,0 +1,144 @@
+"""
+snapshots.py
+Histórico por turno (time-travel) de cada jogo.
+Cada snapshot é uma árvore endereçada por conteúdo: seções do estado (player,
+world, cada NPC, cada mensagem...) viram objetos imutáveis nomeados pelo hash.
+Turnos consecutivos compartilham tudo que não mudou, então guardar 100 turnos
+custa pouco mais que um save.
+
+Layout: saves/history/<game_id>/turns.json + saves/history/<game_id>/objects/<hash>.json
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from durable_io import atomic_write, dumps_json, path_lock, read_bytes
+from persistence import SAVES_DIR, _pack_state, _unpack_state
+
+HISTORY_DIR = os.path.join(SAVES_DIR, "history")
+SNAPSHOT_KEEP_TURNS = int(os.getenv("SNAPSHOT_KEEP_TURNS", "100"))
+
+# Seções do save v2 guardadas como objetos próprios (o resto fica inline na raiz)
+_SECTION_KEYS = ("player", "world", "party", "enemies", "campaign_plan", "inventory", "quests")
+
+
+def _game_dir(game_id: str) -> str:
+    return os.path.join(HISTORY_DIR, game_id)
+
+def _manifest_path(game_id: str) -> str:
+    return os.path.join(_game_dir(game_id), "turns.json")
+
+def _object_path(game_id: str, digest: str) -> str:
+    return os.path.join(_game_dir(game_id), "objects", f"{digest}.json")
+
+
+def _put(game_id: str, value: Any) -> str:
+    """Grava o objeto se ainda não existir e devolve seu hash."""
+    blob = json.dumps(value, ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    digest = hashlib.sha256(blob).hexdigest()[:16]
+    path = _object_path(game_id, digest)
+    if not os.path.exists(path):
+        # Objetos são imutáveis e recriáveis: dispensamos fsync por objeto
+        atomic_write(path, blob, fsync=False)
+    return digest
+
+def _get(game_id: str, digest: str) -> Any:
+    raw = read_bytes(_object_path(game_id, digest))
+    if raw is None: raise FileNotFoundError(f"Objeto de snapshot ausente: {digest}")
+    return json.loads(raw)
+
+
+def load_history(game_id: str) -> List[Dict[str, Any]]:
+    """Entradas do manifesto, em ordem de turno."""
+    raw = read_bytes(_manifest_path(game_id))
+    if not raw: return []
+    try: return json.loads(raw)
+    except json.JSONDecodeError: return []
+
+def _write_history(game_id: str, entries: List[Dict[str, Any]]):
+    atomic_write(_manifest_path(game_id), dumps_json(entries))
+
+
+def record_snapshot(state: Dict[str, Any]) -> Optional[int]:
+    """Registra o estado do fim do turno. Retorna o número do turno gravado."""
+    game_id = state.get("game_id") if state else None
+    if not game_id: return None
+
+    packed = _pack_state(state)
+    root = {k: v for k, v in packed.items() if k not in _SECTION_KEYS + ("npcs", "messages")}
+    for key in _SECTION_KEYS:
+        root[key] = _put(game_id, packed.get(key))
+    root["npcs"] = [[ref, _put(game_id, data)] for ref, data in packed["npcs"]]
+    root["messages"] = [_put(game_id, list(msg)) for msg in packed["messages"]]
+
+    world = state.get("world") or {}
+    turn = world.get("turn_count", 0)
+    entry = {
+        "turn": turn,
+        "root": _put(game_id, root),
+        "created_at": time.time(),
+        "location": world.get("current_location"),
+        "hp": (state.get("player") or {}).get("hp"),
+    }
+
+    with path_lock(_manifest_path(game_id)):
+        # Mesmo turno gravado de novo (ex.: save manual) substitui a entrada anterior
+        entries = [e for e in load_history(game_id) if e["turn"] < turn]
+        entries.append(entry)
+        pruned = len(entries) > SNAPSHOT_KEEP_TURNS
+        entries = entries[-SNAPSHOT_KEEP_TURNS:]
+        _write_history(game_id, entries)
+        if pruned: _collect_garbage(game_id, entries)
+
+    return turn
+
+def load_snapshot(game_id: str, turn: int) -> Optional[Dict[str, Any]]:
+    """Reconstrói o estado (formato GameState) de um turno registrado."""
+    entry = next((e for e in load_history(game_id) if e["turn"] == turn), None)
+    if not entry: return None
+
+    root = _get(game_id, entry["root"])
+    packed = dict(root)
+    for key in _SECTION_KEYS:
+        packed[key] = _get(game_id, root[key])
+    packed["npcs"] = [[ref, _get(game_id, digest)] for ref, digest in root["npcs"]]
+    packed["messages"] = [_get(game_id, digest) for digest in root["messages"]]
+    return _unpack_state(packed)
+
+def truncate_history(game_id: str, turn: int):
+    """Descarta os snapshots posteriores a `turn` (a linha do tempo volta a partir dali)."""
+    with path_lock(_manifest_path(game_id)):
+        entries = [e for e in load_history(game_id) if e["turn"] <= turn]
+        _write_history(game_id, entries)
+        _collect_garbage(game_id, entries)
+
+
+def _collect_garbage(game_id: str, entries: List[Dict[str, Any]]):
+    """Remove objetos que nenhum snapshot restante referencia."""
+    reachable = set()
+    for entry in entries:
+        reachable.add(entry["root"])
+        try:
+            root = _get(game_id, entry["root"])
+        except FileNotFoundError:
+            continue
+        reachable.update(root[key] for key in _SECTION_KEYS)
+        reachable.update(digest for _, digest in root["npcs"])
+        reachable.update(root["messages"])
+
+    objects_dir = os.path.join(_game_dir(game_id), "objects")
+    if not os.path.isdir(objects_dir): return
+    for name in os.listdir(objects_dir):
+        if name.endswith(".json") and name[:-5] not in reachable:
+            try:
+                os.remove(os.path.join(objects_dir, name))
+            except OSError:
+                pass
+
+def history_size_bytes(game_id: str) -> int:
+    total = 0
+    for dirpath, _, files in os.walk(_game_dir(game_id)):
+        total += sum(os.path.getsize(os.path.join(dirpath, f)) for f in files)
+    return total
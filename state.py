@@ -1,9 +1,211 @@
 """Typed structures describing the shared game state for the LangGraph workflow."""
 
 import operator
-from typing import Annotated, Dict, List, Literal, Optional, TypedDict
+import os
+from collections.abc import MutableSequence
+from typing import Annotated, Any, Dict, Iterable, List, Literal, Optional, Sequence, Tuple, TypedDict
 
-from langchain_core.messages import BaseMessage
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+# --- LIMITES DO HISTÓRICO ---
+MESSAGE_WINDOW = int(os.getenv("MESSAGE_WINDOW", "20"))
+MESSAGE_TOKEN_BUDGET = int(os.getenv("MESSAGE_TOKEN_BUDGET", "8000"))
+
+# Marcadores de controle emitidos por nós (ex.: router -> combat). Só valem até serem lidos.
+TRANSIENT_MARKERS = ("SYSTEM: COMBAT START",)
+
+
+# --- MENSAGENS COMPACTAS ---
+# Forma do save: (tipo, conteúdo) ou (tipo, conteúdo, sequência). O reducer do histórico
+# trabalha nelas direto, então um save carregado não vira BaseMessage a cada turno.
+_MSG_KIND = {HumanMessage: "h", AIMessage: "a", SystemMessage: "s"}
+_KIND_CLASS = {"h": HumanMessage, "a": AIMessage, "s": SystemMessage}
+
+CompactMessage = Tuple[Any, ...]
+
+
+def _compact_message(msg: Any) -> Optional[CompactMessage]:
+    if isinstance(msg, tuple): return msg
+    for cls, kind in _MSG_KIND.items():
+        if isinstance(msg, cls):
+            seq = message_seq(msg)
+            return (kind, msg.content) if seq is None else (kind, msg.content, seq)
+    return None  # ToolMessage e afins não são persistidos (mesmo comportamento do v1)
+
+
+class LazyMessages(MutableSequence):
+    """
+    Lista de mensagens que guarda tuplas (tipo, conteúdo) e só constrói o
+    BaseMessage na primeira leitura de cada posição.
+    """
+
+    __slots__ = ("_items",)
+
+    def __init__(self, items: Iterable[Any] = ()):
+        self._items = list(items)
+
+    def _materialize(self, idx: int) -> BaseMessage:
+        item = self._items[idx]
+        if isinstance(item, tuple):
+            kind, content, *seq = item
+            item = _KIND_CLASS[kind](content=content)
+            if seq: set_message_seq(item, seq[0])
+            self._items[idx] = item
+        return item
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._materialize(i) for i in range(*idx.indices(len(self._items)))]
+        return self._materialize(idx)
+
+    def __setitem__(self, idx, value):
+        self._items[idx] = value
+
+    def __delitem__(self, idx):
+        del self._items[idx]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def insert(self, idx: int, value: Any):
+        self._items.insert(idx, value)
+
+    def __add__(self, other) -> List[BaseMessage]:
+        return list(self) + list(other)
+
+    def __radd__(self, other) -> List[BaseMessage]:
+        return list(other) + list(self)
+
+    def __repr__(self) -> str:
+        return f"LazyMessages({len(self._items)} msgs)"
+
+    def compact(self) -> List[CompactMessage]:
+        """Forma compacta sem materializar o que nunca foi lido."""
+        return [c for c in (_compact_message(m) for m in self._items) if c is not None]
+
+
+def _items(messages: Optional[Sequence[Any]]) -> List[Any]:
+    """Itens crus (tuplas compactas ou BaseMessage) sem materializar LazyMessages."""
+    if isinstance(messages, LazyMessages): return list(messages._items)
+    return list(messages or [])
+
+
+def _is_system(item: Any) -> bool:
+    return item[0] == "s" if isinstance(item, tuple) else isinstance(item, SystemMessage)
+
+
+def _content(item: Any) -> Any:
+    return item[1] if isinstance(item, tuple) else item.content
+
+
+def is_transient_marker(msg: Any) -> bool:
+    return _is_system(msg) and str(_content(msg)).startswith(TRANSIENT_MARKERS)
+
+
+def _estimate_tokens(msg: Any) -> int:
+    return len(str(_content(msg))) // 4 + 1
+
+
+_SEQ_PREFIX = "seq-"
+
+
+def message_seq(msg: Any) -> Optional[int]:
+    """Número de sequência da mensagem no jogo (None se ainda não numerada)."""
+    if isinstance(msg, tuple): return msg[2] if len(msg) > 2 else None  # Forma compacta do save
+    msg_id = getattr(msg, "id", None)
+    if isinstance(msg_id, str) and msg_id.startswith(_SEQ_PREFIX):
+        try:
+            return int(msg_id[len(_SEQ_PREFIX):])
+        except ValueError:
+            return None
+    return None
+
+
+def set_message_seq(msg: BaseMessage, seq: int) -> BaseMessage:
+    msg.id = f"{_SEQ_PREFIX}{seq}"
+    return msg
+
+
+def _with_seq(item: Any, seq: int) -> Any:
+    if isinstance(item, tuple): return (item[0], item[1], seq)
+    return set_message_seq(item if message_seq(item) is None else item.model_copy(), seq)
+
+
+def stamp_messages(messages: Sequence[Any]) -> List[Any]:
+    """
+    Numera as mensagens novas em sequência crescente (no id da mensagem, que vai para o save).
+    O número nunca se repete no jogo, mesmo com conteúdo repetido ou histórico aparado:
+    é o cursor do arquivista. Objeto reaproveitado (já numerado antes) vira uma cópia.
+    Tuplas compactas recebem o número na própria tupla, sem virar BaseMessage.
+    """
+    stamped: List[Any] = []
+    last = 0
+    for item in _items(messages):
+        seq = message_seq(item)
+        if seq is None or seq <= last:
+            last += 1
+            item = _with_seq(item, last)
+        else:
+            last = seq
+        stamped.append(item)
+    return stamped
+
+
+def bounded_messages(left: Sequence[BaseMessage], right: Sequence[BaseMessage]) -> Sequence[BaseMessage]:
+    """
+    Reducer do histórico: concatena como operator.add, numera as novas e limita o tamanho.
+    Histórico vindo de um save (LazyMessages) continua lazy: o reducer lê tipo e conteúdo
+    das tuplas e só os nós que leem uma mensagem constroem o BaseMessage dela.
+    """
+    history = stamp_messages(_items(left) + _items(right))
+    if isinstance(left, LazyMessages) or isinstance(right, LazyMessages):
+        history = LazyMessages(history)
+    return trim_history(history)
+
+
+def trim_history(
+    messages: Sequence[BaseMessage],
+    window: Optional[int] = None,
+    token_budget: Optional[int] = None,
+) -> Sequence[BaseMessage]:
+    """
+    Limita o histórico usado pelo grafo.
+    - Marcadores transitórios saem assim que alguma mensagem vier depois deles (já foram consumidos).
+    - O SystemMessage original (primeira mensagem) é sempre preservado.
+    - Mantém no máximo `window` mensagens e `token_budget` tokens estimados.
+    - Nunca começa o recorte com ToolMessage órfã (o provider rejeita).
+    LazyMessages entra e sai LazyMessages, sem materializar nada.
+    """
+    window = MESSAGE_WINDOW if window is None else window
+    token_budget = MESSAGE_TOKEN_BUDGET if token_budget is None else token_budget
+
+    lazy = isinstance(messages, LazyMessages)
+    history = _items(messages)
+    if not history: return LazyMessages() if lazy else history
+
+    last = len(history) - 1
+    history = [m for i, m in enumerate(history) if i == last or not is_transient_marker(m)]
+
+    pinned = history[0] if _is_system(history[0]) and not is_transient_marker(history[0]) else None
+    body = history[1:] if pinned else history
+
+    body = body[-max(1, window - (1 if pinned else 0)):]
+
+    # Corta do mais antigo até caber no orçamento (a mensagem mais recente sempre fica)
+    used = _estimate_tokens(pinned) if pinned else 0
+    kept: List[Any] = []
+    for msg in reversed(body):
+        cost = _estimate_tokens(msg)
+        if kept and used + cost > token_budget: break
+        kept.append(msg)
+        used += cost
+    body = kept[::-1]
+
+    while len(body) > 1 and isinstance(body[0], ToolMessage):
+        body = body[1:]
+
+    trimmed = [pinned] + body if pinned else body
+    return LazyMessages(trimmed) if lazy else trimmed
 
 
 class Attributes(TypedDict):
@@ -89,8 +291,11 @@ class GameState(TypedDict):
     game_id: str  # ID único da sessão para isolar o RAG
     narrative_summary: str # Resumo de curto prazo (contexto comprimido)
     archivist_last_run: int # Controle de frequência do arquivista
+    archivist_last_message: Optional[int] # Sequência (state.message_seq) da última mensagem já resumida
+    archivist_last_location: Optional[str] # Local visto na última checagem (gatilho de mudança)
+    archivist_combat_active: bool # Havia combate na última checagem (gatilho de fim de combate)
 
-    messages: Annotated[List[BaseMessage], operator.add]
+    messages: Annotated[List[BaseMessage], bounded_messages]
     next: Optional[str]
     player: PlayerStats
     world: WorldState
@@ -106,4 +311,8 @@ class GameState(TypedDict):
     
     # --- Campos de Transição ---
     combat_target: Optional[str]
-    loot_source: Optional[str]
\ No newline at end of file
+    loot_source: Optional[str]
+
+    # --- Prazo do Turno (turn_budget.py) ---
+    turn_deadline: Optional[float] # Epoch limite do turno; None = sem prazo
+    degradations: Annotated[List[str], operator.add] # "nó:degradação" aplicadas neste turno
\ No newline at end of file
@@ -0,0 +1,98 @@
+"""
+state_sync.py
+Sincronização Incremental de Estado (JSON-Patch, RFC 6902).
+O cliente guarda uma cópia local do estado e envia a versão que conhece; a API
+responde só o patch até a versão atual. Versões vêm dos snapshots por turno
+(snapshots.py) no formato "<turno>.<hash da raiz>", então um rewind que reescreve
+um turno gera outra versão e o cliente antigo recebe o estado completo.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import jsonpatch
+
+from persistence import DEFAULT_SAVE_NAME, _compact_messages
+from snapshots import load_history, load_snapshot
+
+# Views recentes por versão (o caso comum é o cliente estar um turno atrás)
+VIEW_CACHE_SIZE = 256
+_view_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_view_lock = threading.Lock()  # Requisições da API rodam no threadpool do FastAPI
+
+# Campos do GameState que o cliente espelha, com os defaults do formato de save
+# (persistence._pack_state): estado em memória e reconstruído de um snapshot dão a mesma view
+_VIEW_DEFAULTS = {
+    "narrative_summary": "", "player": {}, "world": {}, "party": [], "enemies": [], "npcs": {},
+    "inventory": [], "quests": [], "campaign_plan": {},
+}
+_MESSAGE_TYPES = {"h": "human", "a": "ai", "s": "system"}
+
+
+def client_view(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Projeção do estado que o cliente mantém localmente (só JSON puro)."""
+    view = {"game_id": state.get("game_id", DEFAULT_SAVE_NAME)}
+    for key, default in _VIEW_DEFAULTS.items():
+        view[key] = state.get(key, default)
+    view["npcs"] = view["npcs"] or {}
+    # Mesmo filtro do save (sem ToolMessages); LazyMessages não precisa materializar
+    view["messages"] = [{"type": _MESSAGE_TYPES[kind], "content": content}
+                        for kind, content, *_seq in _compact_messages(state.get("messages", []))]
+    return view
+
+
+def _parse_version(version: str) -> Tuple[Optional[int], Optional[str]]:
+    turn, _, root = (version or "").partition(".")
+    try:
+        return int(turn), root
+    except ValueError:
+        return None, None
+
+
+def state_version(game_id: str, turn: Optional[int] = None) -> Optional[str]:
+    """Versão do snapshot de `turn` (ou do último registrado)."""
+    history = load_history(game_id)
+    if turn is not None:
+        history = [e for e in history if e["turn"] == turn]
+    if not history: return None
+    entry = history[-1]
+    return f"{entry['turn']}.{entry['root']}"
+
+
+def _view_at(game_id: str, version: str) -> Optional[Dict[str, Any]]:
+    """View de uma versão registrada. None se a versão não existe (podada ou de outra linha do tempo)."""
+    key = f"{game_id}:{version}"
+    with _view_lock:
+        view = _view_cache.get(key)
+        if view is not None:
+            _view_cache.move_to_end(key)
+            return view
+
+    turn, _ = _parse_version(version)
+    if turn is None or state_version(game_id, turn) != version: return None
+    state = load_snapshot(game_id, turn)
+    if not state: return None
+
+    view = client_view(state)
+    with _view_lock:
+        _view_cache[key] = view
+        while len(_view_cache) > VIEW_CACHE_SIZE:
+            _view_cache.popitem(last=False)
+    return view
+
+
+def diff_since(state: Dict[str, Any], since: Optional[str]) -> Dict[str, Any]:
+    """
+    Patch da versão `since` até o estado atual.
+    Sem `since` (ou com versão desconhecida) devolve o estado completo em "full".
+    """
+    game_id = state.get("game_id")
+    version = state_version(game_id)
+    current = client_view(state)
+
+    base = _view_at(game_id, since) if since else None
+    if base is None:
+        return {"game_id": game_id, "version": version, "base_version": None, "patch": None, "full": current}
+
+    patch = jsonpatch.make_patch(base, current).patch if since != version else []
+    return {"game_id": game_id, "version": version, "base_version": since, "patch": patch, "full": None}
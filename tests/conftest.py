@@ -0,0 +1,16 @@
+import pytest
+
+import llm_cache
+import tier_policy
+
+
+@pytest.fixture(autouse=True)
+def isolated_logs(tmp_path, monkeypatch):
+    """Logs de diagnóstico dos testes vão para tmp_path, não para logs/ do repositório."""
+    monkeypatch.setattr(tier_policy, "TIER_DECISION_LOG", str(tmp_path / "tier_decisions.jsonl"))
+
+
+@pytest.fixture(autouse=True)
+def isolated_llm_cache(tmp_path, monkeypatch):
+    """Cache de respostas vazio por teste, com o nível de disco em tmp_path (nada vaza para cache/llm)."""
+    monkeypatch.setattr(llm_cache, "response_cache", llm_cache.ResponseCache(str(tmp_path / "llm_cache")))
@@ -0,0 +1,59 @@
+import threading
+import time
+
+import pytest
+
+from admission import PRIORITY_NEW_GAME, PRIORITY_TURN, AdmissionController, Overloaded
+from metrics import metrics
+
+
+def test_rejects_fast_when_estimated_wait_exceeds_deadline():
+    controller = AdmissionController(max_concurrent=1, max_queue=10, initial_service_time=30)
+    controller.acquire()
+
+    start = time.monotonic()
+    with pytest.raises(Overloaded) as exc:
+        controller.acquire(deadline=5)
+    assert time.monotonic() - start < 0.1
+    assert exc.value.retry_after == 30
+
+    controller.release()
+    assert controller.acquire(deadline=5) < 0.1
+
+
+def test_queue_bound_and_deadline_in_queue():
+    controller = AdmissionController(max_concurrent=1, max_queue=0, initial_service_time=0.01)
+    controller.acquire()
+    with pytest.raises(Overloaded) as exc:
+        controller.acquire()
+    assert exc.value.reason == "queue_full"
+
+    controller.max_queue = 5
+    with pytest.raises(Overloaded) as exc:
+        controller.acquire(deadline=0.05)  # Slot nunca libera
+    assert exc.value.reason == "deadline"
+
+
+def test_turns_go_ahead_of_new_games():
+    controller = AdmissionController(max_concurrent=1, max_queue=10, initial_service_time=0.01)
+    controller.acquire()
+    order = []
+
+    def wait_for_slot(priority, label):
+        with controller.admit(priority, deadline=5):
+            order.append(label)
+
+    new_game = threading.Thread(target=wait_for_slot, args=(PRIORITY_NEW_GAME, "new_game"))
+    new_game.start()
+    time.sleep(0.05)
+    turn = threading.Thread(target=wait_for_slot, args=(PRIORITY_TURN, "turn"))
+    turn.start()
+    time.sleep(0.05)
+
+    assert metrics.get("admission_queue_depth", priority="new_game") == 1
+    controller.release()
+    new_game.join(2)
+    turn.join(2)
+
+    assert order == ["turn", "new_game"]
+    assert "admission_wait_seconds_count" in metrics.render()
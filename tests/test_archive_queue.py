@@ -0,0 +1,98 @@
+import threading
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from archive_queue import ArchiveQueue
+
+
+def make_state(game_id, summary, turn):
+    return {
+        "game_id": game_id,
+        "narrative_summary": summary,
+        "archivist_last_run": 0,
+        "world": {"turn_count": turn},
+        "messages": [HumanMessage(content=f"acao {turn}"), AIMessage(content=f"cena {turn}")],
+    }
+
+
+def test_jobs_of_same_game_run_in_order_and_chain_summary():
+    seen = []
+
+    def fake_archive(snapshot):
+        time.sleep(0.01)
+        seen.append((snapshot["world"]["turn_count"], snapshot["narrative_summary"]))
+        turn = snapshot["world"]["turn_count"]
+        return {"narrative_summary": f"resumo {turn}", "archivist_last_run": turn}
+
+    queue = ArchiveQueue(fake_archive, max_workers=4)
+    for turn in range(1, 4):
+        queue.submit(make_state("g1", "inicio", turn))
+
+    updates = queue.collect("g1", timeout=5)
+
+    assert [t for t, _ in seen] == [1, 2, 3]
+    # Cada job enxerga o resumo do anterior, mesmo sem merge intermediário
+    assert seen[1][1] == "resumo 1"
+    assert updates == {"narrative_summary": "resumo 3", "archivist_last_run": 3}
+    assert queue.collect("g1", timeout=1) == {}
+
+
+def test_merge_into_waits_for_pending_job():
+    release = threading.Event()
+
+    def slow_archive(snapshot):
+        release.wait(5)
+        return {"narrative_summary": "novo resumo"}
+
+    queue = ArchiveQueue(slow_archive, max_workers=1)
+    queue.submit(make_state("g2", "velho", 1))
+    assert queue.is_pending("g2")
+
+    threading.Timer(0.05, release.set).start()
+    state = make_state("g2", "velho", 2)
+    queue.merge_into(state)
+
+    assert state["narrative_summary"] == "novo resumo"
+    assert not queue.is_pending("g2")
+
+
+def test_failed_job_does_not_block_queue():
+    def broken_archive(snapshot):
+        raise RuntimeError("provider fora do ar")
+
+    queue = ArchiveQueue(broken_archive, max_workers=1)
+    queue.submit(make_state("g3", "x", 1))
+
+    assert queue.collect("g3", timeout=5) == {}
+    assert queue.submit({"narrative_summary": "sem id"}) is False
+
+
+def test_peek_does_not_wait_for_running_job():
+    release = threading.Event()
+
+    def slow_archive(snapshot):
+        release.wait(5)
+        return {"narrative_summary": "novo resumo"}
+
+    queue = ArchiveQueue(slow_archive, max_workers=1)
+    queue.submit(make_state("g4", "velho", 1))
+
+    start = time.monotonic()
+    assert queue.peek("g4") == {}
+    assert time.monotonic() - start < 0.5
+    release.set()
+    assert queue.collect("g4", timeout=5) == {"narrative_summary": "novo resumo"}
+
+
+def test_unmerged_results_expire():
+    queue = ArchiveQueue(lambda snapshot: {"narrative_summary": snapshot["game_id"]}, max_workers=1, result_ttl=0.05)
+    queue.submit(make_state("abandonado", "x", 1))
+    assert queue.wait("abandonado", timeout=5)
+    assert queue.peek("abandonado") == {"narrative_summary": "abandonado"}
+
+    time.sleep(0.1)
+    queue.submit(make_state("outro", "x", 1))
+    assert queue.wait("outro", timeout=5)
+    assert "abandonado" not in queue._results
+    assert queue.collect("abandonado", timeout=1) == {}
@@ -0,0 +1,183 @@
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from agents import archivist
+from agents.archivist import archive_trigger, archive_tracking, messages_since_last_run
+from state import bounded_messages, message_seq, stamp_messages
+from turn_budget import CANNED_CONTINUATION
+
+
+def base_state(turn=1, location="Vila"):
+    return {
+        "game_id": "policy-test",
+        "narrative_summary": "",
+        "archivist_last_run": 0,
+        "archivist_last_message": None,
+        "archivist_last_location": location,
+        "archivist_combat_active": False,
+        "world": {"current_location": location, "turn_count": turn},
+        "enemies": [],
+        "messages": stamp_messages([HumanMessage(content="olho ao redor"), AIMessage(content="Uma vila quieta.")]),
+    }
+
+
+def test_only_messages_after_last_run_are_fed():
+    state = base_state()
+    state["archivist_last_message"] = message_seq(state["messages"][-1])
+    state["messages"] = stamp_messages(state["messages"] + [HumanMessage(content="sigo pela estrada"), AIMessage(content="A estrada escurece.")])
+
+    new_msgs = messages_since_last_run(state)
+
+    assert [m.content for m in new_msgs] == ["sigo pela estrada", "A estrada escurece."]
+
+
+def test_no_trigger_without_new_messages():
+    state = base_state(turn=50)
+    state["archivist_last_message"] = message_seq(state["messages"][-1])
+    assert archive_trigger(state) is None
+
+
+def test_location_change_and_combat_end_trigger():
+    state = base_state(location="Floresta")
+    state["archivist_last_location"] = "Vila"
+    assert archive_trigger(state) == "location_change"
+
+    state = base_state()
+    state["archivist_combat_active"] = True
+    state["enemies"] = [{"name": "Goblin", "status": "morto"}]
+    assert archive_trigger(state) == "combat_end"
+
+
+def test_turn_interval_and_token_budget_trigger():
+    state = base_state(turn=archivist.ARCHIVIST_TURN_INTERVAL)
+    assert archive_trigger(state) == "turn_interval"
+
+    state = base_state(turn=1)
+    state["messages"].append(AIMessage(content="x" * (archivist.ARCHIVIST_TOKEN_THRESHOLD * 4)))
+    assert archive_trigger(state) == "token_budget"
+
+
+def test_tracking_follows_location_and_combat():
+    state = base_state(location="Masmorra")
+    state["enemies"] = [{"name": "Orc", "status": "ativo"}]
+    assert archive_tracking(state) == {"archivist_last_location": "Masmorra", "archivist_combat_active": True}
+
+
+def simulate_calls(turns=100):
+    """Simula uma campanha: troca de local a cada 25 turnos e combates de 3 turnos a cada 15."""
+    state = base_state(turn=0)
+    state["messages"] = []
+    calls = 0
+    for turn in range(1, turns + 1):
+        state["world"]["turn_count"] = turn
+        state["world"]["current_location"] = f"Local {turn // 25}"
+        in_combat = turn % 15 in (1, 2, 3)
+        state["enemies"] = [{"name": "Goblin", "status": "ativo" if in_combat else "morto"}]
+        state["messages"] = bounded_messages(state["messages"], [
+            HumanMessage(content=f"acao {turn}"),
+            AIMessage(content="", tool_calls=[]),
+            ToolMessage(tool_call_id="t", content="Rolagem: 12"),
+            AIMessage(content=f"narrativa do turno {turn} " * 20),
+        ])
+        if archive_trigger(state):
+            calls += 1
+            state["archivist_last_run"] = turn
+            state["archivist_last_message"] = message_seq(state["messages"][-1])
+        state.update(archive_tracking(state))
+    return calls
+
+
+def test_policy_cuts_calls_per_100_turns():
+    # Antes: o arquivista rodava em todos os turnos (100 chamadas); medido com a política: 25
+    assert simulate_calls(100) == 25
+
+
+def test_turn_clock_does_not_add_periodic_replans(monkeypatch):
+    from agents import campaign_manager
+
+    planned = []
+    def fake_plan(state, _budget=None):
+        planned.append(state["world"]["turn_count"])
+        return {"location": "Vila", "beats": [{"description": "b", "status": "pending"}] * 3, "climax": "c",
+                "current_step": 0, "last_planned_turn": state["world"]["turn_count"]}
+    monkeypatch.setattr(campaign_manager, "_build_plan", fake_plan)
+
+    def play(turns):
+        planned.clear()
+        state = {"world": {"current_location": "Vila", "turn_count": 0}, "messages": [], "campaign_plan": None}
+        for _ in range(turns):
+            state.update(campaign_manager.campaign_manager_node(state))
+        return list(planned)
+
+    # O relógio anda um por turno, mas o plano só é gerado quando precisa (igual a antes do relógio)
+    assert play(30) == [1]
+    monkeypatch.setattr(campaign_manager, "CAMPAIGN_REPLAN_INTERVAL", 10)
+    assert play(30) == [1, 11, 21]  # Cadência explícita, contada a partir do turno atual
+
+
+class RecordingArchivist:
+    """Fake do LLM do arquivista: guarda o que recebeu em cada passada."""
+    def __init__(self):
+        self.inputs = []
+
+    def with_structured_output(self, _schema):
+        return self
+
+    def invoke(self, messages):
+        self.inputs.append(messages)
+        return archivist.MemoryUpdate(new_summary=f"resumo {len(self.inputs)}", important_facts=[])
+
+
+def test_large_backlog_keeps_summary_and_is_archived_in_passes(monkeypatch):
+    llm = RecordingArchivist()
+    monkeypatch.setattr(archivist, "get_llm", lambda **_kw: llm)
+    monkeypatch.setattr(archivist, "choose_tier", lambda *_a, **_kw: None)
+
+    state = base_state(turn=30)
+    state["narrative_summary"] = "O herói jurou vingar a vila queimada."
+    # Backlog de ~40 turnos (arquivista adiado): bem maior que o orçamento do nó
+    archived = AIMessage(content="Fim do último resumo.")
+    backlog = [m for t in range(40) for m in (HumanMessage(content=f"acao {t}"), AIMessage(content=f"evento {t} " * 120))]
+    state["messages"] = stamp_messages([archived] + backlog)
+    state["archivist_last_message"] = message_seq(archived)
+
+    first = archivist.archive_now(state)
+    system, *batch = llm.inputs[0]
+    assert "O herói jurou vingar a vila queimada." in system.content
+    assert batch[0].content == "acao 0"  # Do mais antigo para o mais novo
+    assert len(batch) < len(backlog) and "archivist_last_run" not in first
+    assert first["archivist_last_message"] == message_seq(batch[-1])
+
+    # Próximas passadas continuam de onde parou até alcançar o fim
+    seen = list(batch)
+    state.update(first)
+    while "archivist_last_run" not in state or state["archivist_last_run"] != 30:
+        state.update(archivist.archive_now(state))
+        seen += llm.inputs[-1][1:]
+    assert [m.content for m in seen] == [m.content for m in backlog]
+    assert state["archivist_last_message"] == message_seq(state["messages"][-1])
+
+
+def test_repeated_messages_do_not_move_the_cursor():
+    msgs = stamp_messages([HumanMessage(content="ataco"), AIMessage(content=CANNED_CONTINUATION),
+                           HumanMessage(content="fujo"), AIMessage(content="corre"),
+                           HumanMessage(content="ataco"), AIMessage(content=CANNED_CONTINUATION)])
+    state = base_state()
+    state["messages"] = msgs
+    state["archivist_last_message"] = message_seq(msgs[1])
+    assert [m.content for m in messages_since_last_run(state)] == ["fujo", "corre", "ataco", CANNED_CONTINUATION]
+
+    # Cursor aparado da janela: só o que veio depois dele, nada do que já foi resumido
+    state["messages"] = bounded_messages(msgs, [HumanMessage(content=f"acao {i}") for i in range(30)])
+    state["archivist_last_message"] = message_seq(state["messages"][4])
+    assert [m.content for m in messages_since_last_run(state)] == [m.content for m in state["messages"][5:]]
+
+    # Mesmo objeto devolvido de novo por um nó: ganha sequência nova
+    again = bounded_messages(msgs, [msgs[1]])
+    assert message_seq(again[-1]) == message_seq(msgs[-1]) + 1 and message_seq(msgs[1]) == 2
+
+
+def test_legacy_fingerprint_cursor_archives_nothing_and_is_migrated():
+    state = base_state(turn=50)
+    state["archivist_last_message"] = "3f1c0ddc2a7b9e41"
+    assert messages_since_last_run(state) == [] and archive_trigger(state) is None
+    assert archive_tracking(state)["archivist_last_message"] == message_seq(state["messages"][-1])
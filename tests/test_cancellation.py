@@ -0,0 +1,95 @@
+import asyncio
+import time
+from typing import TypedDict
+
+import pytest
+from fastapi import HTTPException
+from langchain_core.messages import AIMessage
+from langgraph.graph import END, START, StateGraph
+
+from cancellation import CancelScope, TurnCancelled, use_scope
+from llm_setup import CancellableLLM
+from metrics import metrics
+
+
+class CountingLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, _input, config=None, **kwargs):
+        self.calls += 1
+        return AIMessage(content="ok")
+
+
+class FlowState(TypedDict):
+    log: list
+
+
+def test_cancel_stops_graph_at_next_llm_call_even_inside_try_except():
+    inner = CountingLLM()
+    llm = CancellableLLM(inner)
+    scope = CancelScope()
+
+    def first(state):
+        llm.invoke("a")
+        scope.cancel("cliente desconectou")
+        return {"log": state["log"] + ["first"]}
+
+    def second(state):
+        try:  # Nós capturam Exception; o cancelamento precisa atravessar
+            llm.invoke("b")
+        except Exception:
+            pass
+        return {"log": state["log"] + ["second"]}
+
+    graph = StateGraph(FlowState)
+    graph.add_node("first", first)
+    graph.add_node("second", second)
+    graph.add_edge(START, "first")
+    graph.add_edge("first", "second")
+    graph.add_edge("second", END)
+
+    before = metrics.get("llm_calls_cancelled_total")
+    with use_scope(scope), pytest.raises(TurnCancelled):
+        graph.compile().invoke({"log": []})
+
+    assert inner.calls == 1
+    assert metrics.get("llm_calls_cancelled_total") == before + 1
+
+
+class DisconnectingRequest:
+    async def is_disconnected(self):
+        return True
+
+
+def test_disconnect_cancels_the_running_turn(monkeypatch):
+    import api
+    monkeypatch.setattr(api, "DISCONNECT_POLL_INTERVAL", 0.01)
+
+    def slow_turn(scope):
+        for _ in range(100):
+            scope.check()
+            time.sleep(0.01)
+        return "terminou"
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(api._run_cancellable(DisconnectingRequest(), slow_turn))
+    assert exc.value.status_code == 499
+
+
+def test_engine_final_narration_does_not_swallow_cancellation():
+    from langchain_core.messages import HumanMessage, SystemMessage
+    from engine_utils import execute_engine
+
+    class CancelledWhileNarrating:
+        def bind_tools(self, _tools):
+            return self
+
+        def invoke(self, messages):
+            if isinstance(messages[-1], HumanMessage):
+                return AIMessage(content="", tool_calls=[{"id": "t1", "name": "roll_dice", "args": {"formula": "1d4"}}])
+            raise TurnCancelled("cliente desconectou")
+
+    state = {"player": {"name": "Lyra", "hp": 10}, "messages": [HumanMessage(content="ataco")]}
+    with pytest.raises(TurnCancelled):
+        execute_engine(CancelledWhileNarrating(), SystemMessage(content="engine"), state["messages"], state)
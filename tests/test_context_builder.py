@@ -0,0 +1,54 @@
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from context_builder import CHUNK_SEPARATOR, Section, build_context, estimate_tokens
+
+
+def long_history(n):
+    msgs = []
+    for i in range(n):
+        msgs.append(HumanMessage(content=f"ação {i} " + "x" * 200))
+        msgs.append(AIMessage(content=f"narração {i} " + "y" * 400))
+    return msgs
+
+
+def test_prompt_fits_budget_and_keeps_the_player_request():
+    history = long_history(20) + [HumanMessage(content="ataco o dragão")]
+    lore = CHUNK_SEPARATOR.join(["Dragões temem prata. " * 20, "A vila fica ao norte. " * 20, "Dragões temem prata. " * 20])
+
+    ctx = build_context("storyteller", history, fixed="instruções " * 50, budget=600, max_messages=10, sections={
+        "summary": Section("O herói chegou à vila.", priority=1),
+        "lore": Section(lore, priority=3, chunks=True),
+    })
+
+    assert ctx.tokens <= 600
+    assert ctx.history[-1].content == "ataco o dragão"
+    assert ctx.text("summary") == "O herói chegou à vila."
+    # Histórico contíguo e mais recente (prioridade 2) antes da lore (prioridade 3)
+    contents = [m.content for m in ctx.history[:-1]]
+    assert contents == [m.content for m in history[-1 - len(contents):-1]]
+    # Lore: duplicata descartada antes de competir pelo orçamento
+    assert len(Section(lore, chunks=True).parts()) == 2
+
+
+def test_lore_is_ranked_and_last_chunk_trimmed():
+    chunks = ["primeiro " * 40, "segundo " * 40, "terceiro " * 40]
+    ctx = build_context("npc_actor", [HumanMessage(content="oi")], budget=estimate_tokens(chunks[0]) + 60,
+                        sections={"lore": Section(CHUNK_SEPARATOR.join(chunks), chunks=True)})
+
+    parts = ctx.sections["lore"]
+    assert parts[0] == chunks[0].strip()
+    assert len(parts) == 2 and parts[1].startswith("segundo") and parts[1].endswith("[…]")
+    assert ctx.dropped["lore"] == 1
+
+
+def test_history_never_starts_with_orphan_tool_message():
+    history = [
+        HumanMessage(content="ataco"),
+        AIMessage(content="", tool_calls=[{"id": "t1", "name": "roll_dice", "args": {"formula": "1d20"}}]),
+        ToolMessage(tool_call_id="t1", content="15"),
+        AIMessage(content="Você acerta."),
+        HumanMessage(content="de novo"),
+    ]
+    ctx = build_context("router", history, max_messages=3)
+    assert not isinstance(ctx.history[0], ToolMessage)
+    assert ctx.history[-1].content == "de novo"
@@ -0,0 +1,38 @@
+import gzip
+import json
+
+from fastapi.testclient import TestClient
+
+import gamedata
+from durable_io import group_commit
+from data_bundle import get_bundle
+
+
+def test_bundle_is_cached_until_custom_artifact_is_saved(tmp_path, monkeypatch):
+    monkeypatch.setattr(gamedata, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(gamedata, "ARTIFACTS_DB", dict(gamedata.ARTIFACTS_DB))
+    monkeypatch.setattr(gamedata, "CUSTOM_ARTIFACTS", dict(gamedata.CUSTOM_ARTIFACTS))
+    monkeypatch.setattr(gamedata, "ALL_ARTIFACT_IDS", list(gamedata.ALL_ARTIFACT_IDS))
+
+    first = get_bundle()
+    assert get_bundle() is first
+    assert json.loads(gzip.decompress(first.gzipped)) == json.loads(first.raw)
+
+    gamedata.save_custom_artifact("espada_teste", {"name": "Espada de Teste"})
+    second = get_bundle()
+    assert second.etag != first.etag
+    assert "espada_teste" in json.loads(second.raw)["artifacts"]
+    group_commit.flush()
+
+
+def test_endpoint_etag_and_gzip():
+    import api
+    client = TestClient(api.app)
+
+    response = client.get("/data/bundle", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert set(response.json()) == {"classes", "abilities", "origins", "artifacts"}
+
+    cached = client.get("/data/bundle", headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304 and cached.content == b""
@@ -0,0 +1,80 @@
+import json
+import os
+import stat
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+import durable_io
+from durable_io import GroupCommitQueue, atomic_write, read_bytes
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_failure_before_rename_keeps_original(tmp_path, monkeypatch):
+    target = tmp_path / "save.json"
+    target.write_bytes(b'{"hp": 30}')
+
+    def crash(*_args, **_kwargs):
+        raise OSError("disco cheio")
+
+    monkeypatch.setattr(durable_io.os, "replace", crash)
+    with pytest.raises(OSError):
+        atomic_write(str(target), b'{"hp": 1', fsync=True)
+
+    assert target.read_bytes() == b'{"hp": 30}'
+    assert [p.name for p in tmp_path.iterdir()] == ["save.json"]  # temporário removido
+
+
+def test_process_killed_mid_write_leaves_previous_save(tmp_path):
+    target = tmp_path / "save.json"
+    target.write_text(json.dumps({"hp": 30}), encoding="utf-8")
+
+    # Processo real morre (os._exit) depois de gravar o temporário, antes do rename
+    script = textwrap.dedent(f"""
+        import os, sys
+        sys.path.insert(0, {ROOT!r})
+        import durable_io
+        durable_io.os.replace = lambda *a, **k: os._exit(9)
+        durable_io.atomic_write({str(target)!r}, b'{{"hp": 0, "trunc', fsync=True)
+    """)
+    proc = subprocess.run([sys.executable, "-c", script])
+
+    assert proc.returncode == 9
+    assert json.loads(target.read_text(encoding="utf-8")) == {"hp": 30}
+
+
+def test_group_commit_coalesces_and_reads_pending(tmp_path):
+    target = str(tmp_path / "bestiary.json")
+    queue = GroupCommitQueue(window=0.05, fsync=False)
+
+    for i in range(20):
+        queue.submit(target, json.dumps({"version": i}).encode())
+    assert json.loads(queue.read_pending(target)) == {"version": 19}
+
+    assert queue.flush(timeout=5)
+    assert queue.stats["written"] < queue.stats["submitted"]
+    with open(target, "rb") as f:
+        assert json.loads(f.read()) == {"version": 19}
+
+
+def test_read_bytes_sees_queued_write(tmp_path):
+    target = str(tmp_path / "npc.json")
+    durable_io.write_file(target, b'{"a": 1}', coalesce=True)
+    assert read_bytes(target) == b'{"a": 1}'
+    durable_io.group_commit.flush(target)
+    assert read_bytes(str(tmp_path / "missing.json")) is None
+
+
+def test_atomic_write_keeps_permissions_like_open(tmp_path):
+    plain = tmp_path / "plain.json"
+    with open(plain, "w") as f: f.write("{}")
+    fresh = tmp_path / "fresh.json"
+    atomic_write(str(fresh), b"{}")
+    assert stat.S_IMODE(fresh.stat().st_mode) == stat.S_IMODE(plain.stat().st_mode)
+
+    os.chmod(fresh, 0o640)  # Modo escolhido pelo usuário sobrevive às regravações
+    atomic_write(str(fresh), b"{\"v\": 2}")
+    assert stat.S_IMODE(fresh.stat().st_mode) == 0o640
@@ -0,0 +1,76 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+import engine_utils
+from engine_utils import EntityIndex, execute_engine, register_tool, tool_schemas
+
+
+def goblins(n):
+    return [{"id": f"goblin_{i}", "name": f"Goblin {i}", "hp": 10, "status": "ativo"} for i in range(1, n + 1)]
+
+
+class ScriptedLLM:
+    """Pede as ferramentas dadas na primeira chamada e narra depois."""
+    def __init__(self, calls):
+        self.calls = calls
+        self.bound = None
+
+    def bind_tools(self, tools):
+        self.bound = tools
+        return self
+
+    def invoke(self, messages):
+        if isinstance(messages[-1], HumanMessage):
+            return AIMessage(content="", tool_calls=[{"id": f"t{i}", "name": n, "args": a} for i, (n, a) in enumerate(self.calls)])
+        return AIMessage(content="Feito.")
+
+
+def test_numbered_enemies_resolve_exactly():
+    player = {"name": "Aria", "hp": 20}
+    party = [{"name": "Bran", "hp": 12}]
+    enemies = goblins(12) + [{"id": "orc_chefe", "name": "Orc Chefe", "hp": 30, "aliases": ["Grom"]}]
+    index = EntityIndex(player, party, enemies)
+
+    assert index.resolve("Goblin 1")[1]["id"] == "goblin_1"
+    assert index.resolve("goblin 10")[1]["id"] == "goblin_10"
+    assert index.resolve("goblin_12") == ("enemy", enemies[11], "exact")
+    assert index.resolve("ataco o Goblin 10 com a espada")[1:] == (enemies[9], "fuzzy")
+    assert index.resolve("grom")[1]["name"] == "Orc Chefe"
+    assert index.resolve("Orc Chefee")[1:] == (enemies[12], "fuzzy")
+    assert index.resolve("herói")[0] == "player" and index.resolve("aria")[0] == "player"
+    assert index.resolve("Goblin 13") == (None, None, "miss")  # Não vira "Goblin 1"
+
+
+def test_engine_dispatches_registered_tools_on_state_copies():
+    state = {"player": {"name": "Aria", "hp": 20, "gold": 0, "inventory": []}, "party": [],
+             "enemies": goblins(10), "messages": [HumanMessage(content="ataco")]}
+    llm = ScriptedLLM([("update_hp", {"target": "Goblin 1", "amount": -10}),
+                       ("update_hp", {"target": "Player", "amount": -3}),
+                       ("fly", {})])
+    result = execute_engine(llm, SystemMessage(content="engine"), state["messages"], state, "Teste")
+
+    assert llm.bound is engine_utils.TOOLS_SCHEMA
+    hp = {e["name"]: (e["hp"], e["status"]) for e in result["enemies"]}
+    assert hp["Goblin 1"] == (0, "morto") and hp["Goblin 10"] == (10, "ativo")
+    assert result["player"]["hp"] == 17 and state["player"]["hp"] == 20
+    assert "Ferramenta 'fly' não existe." in [m.content for m in result["messages"]]
+
+
+def test_plugin_tool_reaches_bind_tools(monkeypatch):
+    monkeypatch.setattr(engine_utils, "TOOL_REGISTRY", dict(engine_utils.TOOL_REGISTRY))
+    monkeypatch.setattr(engine_utils, "TOOLS_SCHEMA", list(engine_utils.TOOLS_SCHEMA))
+    schema = engine_utils.TOOLS_SCHEMA
+
+    @register_tool("heal_all", "Cura o grupo.", {"type": "object", "properties": {}})
+    def _heal_all(args, ctx):
+        for ally in ctx.party: ally["hp"] = ally["max_hp"]
+        return "Grupo curado."
+
+    assert engine_utils.TOOLS_SCHEMA is schema  # Mesmo objeto, atualizado no lugar
+    assert [t["name"] for t in tool_schemas()] == ["roll_dice", "update_hp", "transaction", "heal_all"]
+
+    state = {"player": {"name": "Aria", "hp": 20}, "party": [{"name": "Bran", "hp": 2, "max_hp": 12}],
+             "enemies": [], "messages": [HumanMessage(content="descanso")]}
+    llm = ScriptedLLM([("heal_all", {})])
+    result = execute_engine(llm, SystemMessage(content="engine"), state["messages"], state, "Teste")
+    assert "heal_all" in [t["name"] for t in llm.bound]
+    assert result["party"][0]["hp"] == 12
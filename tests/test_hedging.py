@@ -0,0 +1,105 @@
+import itertools
+import threading
+import time
+
+import pytest
+
+import hedging
+from hedging import LLMTimeout, hedged_call
+from metrics import metrics
+from provider_scheduler import RetryBudget
+
+
+def warm_tracker(node, seconds=0.05):
+    for _ in range(hedging.HEDGE_MIN_SAMPLES):
+        hedging.tracker(node).observe(seconds)
+
+
+class Straggler:
+    """Primeira chamada demora; as seguintes respondem rápido."""
+
+    def __init__(self, slow=1.0):
+        self.slow = slow
+        self.counter = itertools.count()
+        self.stops = []
+
+    def __call__(self, should_stop):
+        n = next(self.counter)
+        self.stops.append(should_stop)
+        time.sleep(self.slow if n == 0 else 0.01)
+        return f"resposta {n}"
+
+
+def test_hedge_fires_after_p95_and_first_answer_wins(monkeypatch):
+    monkeypatch.setattr(hedging, "hedge_budget", RetryBudget(ratio=0.1, maximum=5))
+    warm_tracker("hedge_test")
+    before = metrics.get("llm_hedge_wins_total", node="hedge_test")
+
+    call = Straggler()
+    start = time.monotonic()
+    assert hedged_call("hedge_test", call, timeout=5, hedge=True) == "resposta 1"
+    assert time.monotonic() - start < 0.5
+    assert metrics.get("llm_hedge_wins_total", node="hedge_test") == before + 1
+    assert call.stops[0]()  # A original (perdedora) foi sinalizada para parar
+
+
+def test_hedge_respects_budget(monkeypatch):
+    monkeypatch.setattr(hedging, "hedge_budget", RetryBudget(ratio=0.0, maximum=0))
+    warm_tracker("budget_test")
+    call = Straggler(slow=0.2)
+    assert hedged_call("budget_test", call, timeout=5, hedge=True) == "resposta 0"
+    assert metrics.get("llm_hedge_budget_exhausted_total", node="budget_test") >= 1
+
+
+def test_node_timeout_raises():
+    release = threading.Event()
+    with pytest.raises(LLMTimeout):
+        hedged_call("timeout_test", lambda _stop: release.wait(2), timeout=0.1, hedge=False)
+    release.set()
+    assert metrics.get("llm_timeouts_total", node="timeout_test") == 1
+
+
+def test_losing_attempt_does_not_ask_again_after_bad_parse(monkeypatch):
+    import llm_setup
+    from langchain_core.exceptions import OutputParserException
+    from langchain_core.runnables import RunnableLambda
+    from llm_setup import CancellableLLM
+    from provider_scheduler import ProviderScheduler
+
+    monkeypatch.setattr(llm_setup, "provider_scheduler", ProviderScheduler({"fast": {"rps": 1000, "burst": 1000, "concurrency": 4}}))
+    monkeypatch.setattr(hedging, "hedge_budget", RetryBudget(ratio=0.1, maximum=5))
+    warm_tracker("parse_hedge")
+    calls = itertools.count()
+
+    def provider(_input):
+        n = next(calls)
+        if n == 0:
+            time.sleep(0.3)  # Original lenta e com JSON quebrado: perde para o hedge
+            raise OutputParserException("json quebrado")
+        return "ok"
+
+    llm = CancellableLLM(RunnableLambda(provider), {"tier": "fast", "attempts": 1})
+    assert llm.with_retry(stop_after_attempt=3).hedged("parse_hedge", timeout=5).invoke("oi") == "ok"
+    time.sleep(0.4)
+    assert next(calls) == 2  # Original + hedge; a perdedora não pediu de novo
+
+
+def test_tracker_records_primary_latency_and_timeouts(monkeypatch):
+    monkeypatch.setattr(hedging, "hedge_budget", RetryBudget(ratio=0.1, maximum=5))
+    warm_tracker("censor_test", seconds=0.05)
+    samples = hedging.tracker("censor_test")._samples
+
+    # O hedge vence, mas a janela recebe a latência da primária quando ela termina
+    assert hedged_call("censor_test", Straggler(slow=0.4), timeout=5, hedge=True) == "resposta 1"
+    time.sleep(0.5)
+    assert len(samples) == hedging.HEDGE_MIN_SAMPLES + 1
+    assert samples[-1] >= 0.4
+
+    # Timeout conta como o próprio prazo, e a primária atrasada não gera outra amostra
+    release = threading.Event()
+    with pytest.raises(LLMTimeout):
+        hedged_call("censor_test", lambda _stop: release.wait(2), timeout=0.1, hedge=False)
+    release.set()
+    time.sleep(0.05)
+    assert len(samples) == hedging.HEDGE_MIN_SAMPLES + 2
+    assert samples[-1] == pytest.approx(0.1)
@@ -0,0 +1,47 @@
+import threading
+import time
+
+import pytest
+
+from idempotency import IdempotencyConflict, IdempotencyStore
+
+
+def test_retry_while_running_attaches_and_completed_key_replays():
+    store = IdempotencyStore(ttl=60)
+    calls = []
+    release = threading.Event()
+
+    def slow_turn():
+        calls.append(1)
+        release.wait(2)
+        return {"message": "turno"}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.run("k", slow_turn, "a"))) for _ in range(3)]
+    for t in threads: t.start()
+    time.sleep(0.05)
+    release.set()
+    for t in threads: t.join()
+
+    assert len(calls) == 1
+    assert sorted(replayed for _, replayed in results) == [False, True, True]
+    assert store.run("k", slow_turn, "a") == ({"message": "turno"}, True)
+    assert len(calls) == 1
+
+
+def test_failures_are_not_stored_and_keys_expire():
+    store = IdempotencyStore(ttl=0.05)
+
+    with pytest.raises(RuntimeError):
+        store.run("k", lambda: (_ for _ in ()).throw(RuntimeError("LLM caiu")))
+    assert store.run("k", lambda: "ok") == ("ok", False)
+
+    time.sleep(0.1)
+    assert store.run("k", lambda: "de novo") == ("de novo", False)
+
+
+def test_same_key_with_other_body_conflicts():
+    store = IdempotencyStore()
+    store.run("k", lambda: "ok", "acao A")
+    with pytest.raises(IdempotencyConflict):
+        store.run("k", lambda: "ok", "acao B")
@@ -0,0 +1,73 @@
+import threading
+
+from fastapi.testclient import TestClient
+
+from jobs import FAILED, SUCCEEDED, JobManager
+
+
+def test_job_reports_progress_and_result():
+    manager = JobManager(max_workers=1)
+    release = threading.Event()
+
+    def work(report):
+        report(0.5, "metade")
+        release.wait(2)
+        return {"ok": True}
+
+    job = manager.submit("teste", work)
+    updates = manager.watch(job.id, heartbeat=1)
+    seen = [next(updates)]
+    release.set()
+    seen += list(updates)
+
+    assert seen[-1]["status"] == SUCCEEDED and seen[-1]["result"] == {"ok": True}
+    assert manager.get(job.id).progress == 1.0
+
+
+def test_failed_job_keeps_error_and_pool_survives():
+    manager = JobManager(max_workers=1)
+    bad = manager.submit("teste", lambda report: 1 / 0)
+    assert manager.wait(bad.id, timeout=2).status == FAILED
+    assert "division" in bad.error
+
+    good = manager.submit("teste", lambda report: "ok")
+    assert manager.wait(good.id, timeout=2).result == "ok"
+
+
+def test_turn_does_not_leak_into_the_next_job_on_the_same_worker():
+    from turn_budget import current_turn, start_turn, use_turn
+
+    manager = JobManager(max_workers=1)
+
+    def turn_job(report):
+        with use_turn(start_turn({"game_id": "novo"})):
+            return current_turn()["game_id"]
+
+    assert manager.wait(manager.submit("teste", turn_job).id, timeout=2).result == "novo"
+    assert manager.wait(manager.submit("teste", lambda report: current_turn()).id, timeout=2).result is None
+
+
+def test_job_context_is_isolated_from_the_worker_thread():
+    from contextvars import ContextVar
+
+    marker = ContextVar("marker", default=None)
+    manager = JobManager(max_workers=1)
+    manager.wait(manager.submit("teste", lambda report: marker.set("sujo")).id, timeout=2)
+    assert manager.wait(manager.submit("teste", lambda report: marker.get()).id, timeout=2).result is None
+
+
+def test_new_game_returns_job_and_streams_until_done(monkeypatch):
+    import api
+    monkeypatch.setattr(api, "_create_game", lambda req, report: api.GameResponse(
+        game_id="g", message="Olá", message_type="STORY", player_stats={}, inventory=[],
+        current_location="Vila", narrative_summary="", last_turn_log=[],
+    ))
+    client = TestClient(api.app)
+
+    accepted = client.post("/game/new", json={"name": "Lyra", "race": "Elfo", "class_name": "Mago", "region": "Vila"})
+    assert accepted.status_code == 202
+    job_id = accepted.json()["job_id"]
+
+    stream = client.get(f"/jobs/{job_id}/events").text
+    assert "event: done" in stream
+    assert client.get(f"/jobs/{job_id}").json()["result"]["game_id"] == "g"
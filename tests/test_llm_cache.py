@@ -0,0 +1,63 @@
+from langchain_core.messages import HumanMessage, SystemMessage
+from pydantic import BaseModel
+
+import llm_cache
+from llm_setup import CancellableLLM
+
+
+class Decision(BaseModel):
+    route: str
+    target: str = ""
+
+
+class StructuredLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def with_structured_output(self, _schema):
+        return self
+
+    def invoke(self, _input, config=None, **kwargs):
+        self.calls += 1
+        return Decision(route="COMBAT", target="goblin")
+
+
+def make_llm(temperature=0.0):
+    inner = StructuredLLM()
+    llm = CancellableLLM(inner, {"model": "fake", "temperature": temperature})
+    return inner, llm.with_structured_output(Decision)
+
+
+def test_temperature_zero_calls_hit_memory_then_disk(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "response_cache", llm_cache.ResponseCache(str(tmp_path)))
+    inner, llm = make_llm()
+    cached = llm.cached("router_test", ttl=60)
+    prompt = [SystemMessage(content="    Você é o router.\n\n    Classifique."), HumanMessage(content="ataco o goblin")]
+
+    first = cached.invoke(prompt)
+    # Mesma mensagem com outra indentação: mesma chave
+    second = cached.invoke([SystemMessage(content="Você é o router.\nClassifique."), HumanMessage(content="ataco o goblin")])
+    assert inner.calls == 1
+    assert isinstance(second, Decision) and second == first
+
+    llm_cache.response_cache.clear()  # Só memória: o disco ainda responde
+    assert cached.invoke(prompt) == first
+    assert inner.calls == 1
+
+    report = llm_cache.cache_report()["router_test"]
+    assert report["hits"] == 2 and report["misses"] == 1
+
+    cached.invoke([HumanMessage(content="outra coisa")])
+    assert inner.calls == 2
+
+
+def test_expired_entries_and_sampled_calls_go_to_provider(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "response_cache", llm_cache.ResponseCache(str(tmp_path)))
+    inner, llm = make_llm()
+    cached = llm.cached("expiring_test", ttl=0)
+    cached.invoke("prompt")
+    cached.invoke("prompt")
+    assert inner.calls == 2
+
+    inner, sampled = make_llm(temperature=0.7)
+    assert sampled.cached("storyteller") is sampled  # Com amostragem não há cache
@@ -0,0 +1,86 @@
+import random
+
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+
+import llm_cache
+import llm_setup
+from agents.archivist import MemoryUpdate
+from agents.bestiary import EnemySchema
+from agents.campaign_manager import CampaignPlanModel
+from agents.combat import EncounterScanner
+from agents.librarian import EntityMatch
+from agents.loot import LootSchema, TransactionResult
+from agents.npc import NPCResponse, NPCSchema
+from agents.router import RouterDecision, RouteType
+from agents.ruler_completo import Ruling
+from agents.storyteller import StoryUpdate
+from character_creator import BackstoryAnalysis, PlayerStatsSchema
+from llm_local import LocalLLM, Scenario, parse_latency
+
+
+@pytest.mark.parametrize("schema", [
+    RouterDecision, StoryUpdate, EncounterScanner, Ruling, MemoryUpdate, EnemySchema, NPCSchema,
+    NPCResponse, TransactionResult, LootSchema, CampaignPlanModel, EntityMatch, PlayerStatsSchema, BackstoryAnalysis,
+])
+def test_local_provider_returns_valid_instances_for_agent_schemas(schema):
+    result = LocalLLM().with_structured_output(schema).invoke([HumanMessage(content="olho ao redor")])
+    assert isinstance(result, schema)
+
+
+def test_scripted_scenario_and_latency():
+    scenario = Scenario({"structured": {"RouterDecision": [{"route": "loot", "loot_context": "CRAFT"}]}})
+    router = LocalLLM(scenario=scenario).with_structured_output(RouterDecision)
+    assert router.invoke("qualquer coisa").route == RouteType.LOOT
+    assert router.invoke("qualquer coisa").route == RouteType.STORY  # Roteiro esgotado
+
+    sample = parse_latency("uniform:0.2,0.4")
+    rng = random.Random(1)
+    assert all(0.2 <= sample(rng) <= 0.4 for _ in range(50))
+    assert parse_latency("fixed:0.3")(rng) == 0.3 and parse_latency("0")(rng) == 0.0
+
+
+def test_full_combat_turn_runs_offline(tmp_path, monkeypatch):
+    import agents.bestiary as bestiary
+    from main import build_game_graph
+    from turn_budget import start_turn
+
+    monkeypatch.setattr(llm_setup, "LLM_PROVIDER", "local")
+    monkeypatch.setattr(bestiary, "BESTIARY_FILE", str(tmp_path / "bestiary.json"))
+    monkeypatch.setattr(llm_cache, "response_cache", llm_cache.ResponseCache(str(tmp_path / "cache")))
+    llm_setup.clear_llm_clients()
+    try:
+        state = {
+            "game_id": "offline",
+            "player": {"name": "Lyra", "hp": 12, "max_hp": 12, "gold": 20, "inventory": [], "attributes": {}, "abilities": []},
+            "world": {"current_location": "Vila", "turn_count": 3},
+            "messages": [SystemMessage(content="início"), HumanMessage(content="ataco o goblin")],
+            "party": [], "enemies": [], "npcs": {}, "campaign_plan": {}, "needs_replan": False,
+        }
+        final = build_game_graph(deferred_archival=True).invoke(start_turn(state))
+    finally:
+        llm_setup.clear_llm_clients()
+
+    assert [e["name"] for e in final["enemies"]] == ["Goblin 1", "Goblin 2"]
+    assert "Rolagem" in final["messages"][-1].content  # Passou pelo loop de ferramentas
+
+
+def test_offline_campaign_plan_is_not_regenerated_every_turn(monkeypatch):
+    from agents import campaign_manager
+
+    monkeypatch.setattr(llm_setup, "LLM_PROVIDER", "local")
+    monkeypatch.setattr(campaign_manager, "query_rag", lambda *_a, **_kw: "")
+    llm_setup.clear_llm_clients()
+    plans = []
+    build = campaign_manager._build_plan
+    monkeypatch.setattr(campaign_manager, "_build_plan", lambda *a, **kw: plans.append(1) or build(*a, **kw))
+    try:
+        state = {"world": {"current_location": "Vila Alta", "turn_count": 0},
+                 "messages": [HumanMessage(content="olho ao redor")], "campaign_plan": None}
+        for _ in range(3):
+            state.update(campaign_manager.campaign_manager_node(state))
+    finally:
+        llm_setup.clear_llm_clients()
+
+    assert state["campaign_plan"]["location"] == "Vila Alta"
+    assert len(plans) == 1
@@ -0,0 +1,35 @@
+from pydantic import BaseModel
+
+import llm_setup
+from engine_utils import TOOLS_SCHEMA
+from llm_setup import ModelTier, get_llm
+
+
+class Answer(BaseModel):
+    text: str
+
+
+def test_clients_and_bound_runnables_are_reused(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "teste-sem-rede")
+    llm_setup.clear_llm_clients()
+    try:
+        llm = get_llm(0.7)
+        assert get_llm(0.7) is llm
+        assert get_llm(0.2) is not llm
+        assert get_llm(0.7, ModelTier.SMART) is not llm
+
+        structured = llm.with_structured_output(Answer)
+        assert llm.with_structured_output(Answer) is structured
+        assert structured.with_retry(stop_after_attempt=3) is structured.with_retry(stop_after_attempt=3)
+        # Listas de dicts iguais (mesmo que não sejam o mesmo objeto) reaproveitam o bind
+        assert llm.bind_tools(TOOLS_SCHEMA) is llm.bind_tools([dict(t) for t in TOOLS_SCHEMA])
+    finally:
+        llm_setup.clear_llm_clients()
+
+
+def test_fallback_is_not_registered(monkeypatch):
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    llm_setup.clear_llm_clients()
+    assert getattr(get_llm(0.3), "is_fallback", False)
+    assert llm_setup._CLIENTS == {}
@@ -0,0 +1,56 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from state import bounded_messages, trim_history
+
+
+def test_keeps_original_system_prompt_and_window():
+    history = [SystemMessage(content="A jornada começa.")]
+    history += [HumanMessage(content=f"acao {i}") for i in range(30)]
+
+    trimmed = trim_history(history, window=10, token_budget=10_000)
+
+    assert len(trimmed) == 10
+    assert trimmed[0].content == "A jornada começa."
+    assert trimmed[-1].content == "acao 29"
+
+
+def test_combat_marker_survives_until_consumed():
+    base = [HumanMessage(content="Ataco o goblin!")]
+    marker = SystemMessage(content="SYSTEM: COMBAT START. TARGET_HINT: Goblin")
+
+    after_router = bounded_messages(base, [marker])
+    assert after_router[-1] is marker
+
+    after_combat = bounded_messages(after_router, [AIMessage(content="O goblin cai.")])
+    assert all("COMBAT START" not in str(m.content) for m in after_combat)
+    assert [m.content for m in after_combat] == ["Ataco o goblin!", "O goblin cai."]
+
+
+def test_token_budget_drops_oldest_and_orphan_tool_messages():
+    history = [
+        AIMessage(content="", tool_calls=[{"name": "roll_dice", "args": {"formula": "1d20"}, "id": "t1"}]),
+        ToolMessage(tool_call_id="t1", content="Rolagem: 15"),
+        HumanMessage(content="x" * 400),
+        AIMessage(content="resposta final"),
+    ]
+
+    trimmed = trim_history(history, window=3, token_budget=200)
+
+    assert not isinstance(trimmed[0], ToolMessage)
+    assert trimmed[-1].content == "resposta final"
+
+
+def test_reducer_and_router_context_do_not_materialize_a_loaded_history():
+    from context_builder import build_context
+    from persistence import LazyMessages
+
+    saved = LazyMessages([("s", "A jornada começa.", 1)] + [(("h", "a")[i % 2], f"fala {i}", i + 2) for i in range(30)])
+    history = bounded_messages(saved, [HumanMessage(content="olho ao redor")])
+
+    assert isinstance(history, LazyMessages) and len(history) == 20
+    assert all(isinstance(item, tuple) for item in history._items[:-1])
+    assert history._items[-1].content == "olho ao redor"
+
+    ctx = build_context("router", history)
+    built = sum(not isinstance(item, tuple) for item in history._items)
+    assert len(ctx.history) <= 4 and built <= 4  # Só a janela do router vira BaseMessage
@@ -0,0 +1,82 @@
+from enum import Enum
+from typing import List, Optional
+
+import pytest
+from langchain_core.exceptions import OutputParserException
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel, Field
+
+from agents.bestiary import EnemySchema
+from llm_setup import CancellableLLM
+from metrics import metrics
+from output_repair import extract_json, repair, repair_structured
+
+
+class Route(str, Enum):
+    STORY = "storyteller"
+    COMBAT = "combat_agent"
+
+
+class Decision(BaseModel):
+    route: Route
+    target: Optional[str] = Field(description="Inimigo, se houver")
+    confidence: float
+
+
+def failed(raw):
+    return {"raw": raw, "parsed": None, "parsing_error": OutputParserException("json inválido")}
+
+
+def test_extracts_json_from_chatty_fenced_output():
+    text = 'Claro! Aqui está:\n```json\n{"route": "combat_agent", "confidence": 0.9,}\n```\nBoa sorte.'
+    assert extract_json(text) == {"route": "combat_agent", "confidence": 0.9}
+    assert extract_json('Resultado: {"a": [1, 2]} e mais nada') == {"a": [1, 2]}
+    assert extract_json("sem json aqui") is None
+
+
+def test_coerces_types_and_fills_missing_optionals():
+    raw = AIMessage(content='Decisão: {"Route": "COMBAT", "confidence": "0,8"}')
+    fixed = repair(raw, Decision)
+    assert fixed == Decision(route=Route.COMBAT, target=None, confidence=0.8)
+
+
+def test_attacks_given_as_string_are_repaired_without_a_new_call():
+    attacks = '[{"name": "Mordida", "type": "melee", "bonus": "+4", "damage": "1d6+2 piercing"}]'
+    raw = AIMessage(content="", tool_calls=[{"id": "1", "name": "EnemySchema", "args": {
+        "name": "Lobo", "description": "Um lobo", "type": "Minion", "hp": "11", "max_hp": 11, "ac": 13.0,
+        "attacks": attacks, "attributes": {"str": "12", "dex": 15}, "abilities": "Faro apurado\nAtaque em matilha",
+    }}])
+    before = metrics.get("structured_output_repairs_total", schema="EnemySchema", outcome="repaired")
+
+    enemy = repair_structured(EnemySchema, failed(raw))
+
+    assert enemy.attacks[0].bonus == 4 and enemy.hp == 11 and enemy.attributes == {"str": 12, "dex": 15}
+    assert enemy.abilities == ["Faro apurado", "Ataque em matilha"]
+    assert metrics.get("structured_output_repairs_total", schema="EnemySchema", outcome="repaired") == before + 1
+
+
+def test_unrepairable_output_raises_original_error():
+    output = failed(AIMessage(content="Desculpe, não posso ajudar."))
+    with pytest.raises(OutputParserException):
+        repair_structured(Decision, output)
+    assert metrics.get("structured_output_repairs_total", schema="Decision", outcome="failed") >= 1
+
+
+class RawModel(RunnableLambda):
+    """Modelo LangChain falso: with_structured_output devolve a resposta crua com erro de parse."""
+
+    def __init__(self, content):
+        super().__init__(lambda _input: AIMessage(content=content))
+        self.include_raw = None
+
+    def with_structured_output(self, schema, include_raw=False, **_kwargs):
+        self.include_raw = include_raw
+        return self | failed
+
+
+def test_structured_runnables_are_wired_through_repair():
+    model = RawModel('{"route": "storyteller", "target": null, "confidence": 1}')
+    decision = CancellableLLM(model).with_structured_output(Decision).invoke("oi")
+    assert model.include_raw is True
+    assert decision.route is Route.STORY
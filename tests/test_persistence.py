@@ -0,0 +1,90 @@
+import json
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+import persistence
+from persistence import LazyMessages, load_game_state, save_game_state
+
+
+def sample_state():
+    return {
+        "game_id": "save-test",
+        "narrative_summary": "Valerius chegou à vila.",
+        "archivist_last_run": 3,
+        "player": {"name": "Valerius", "hp": 20, "inventory": ["pocao_cura", "adaga_ferro", "pocao_cura"]},
+        "world": {"current_location": "Vila", "turn_count": 4},
+        "npcs": {"Borin": {"name": "Borin", "memory": []}},
+        "messages": [
+            SystemMessage(content="A jornada começa."),
+            HumanMessage(content="Olá"),
+            AIMessage(content="Borin acena."),
+            ToolMessage(tool_call_id="t1", content="ignorada"),
+        ],
+    }
+
+
+def test_roundtrip_compact_with_each_codec(tmp_path, monkeypatch):
+    monkeypatch.setattr(persistence, "SAVES_DIR", str(tmp_path))
+    for codec in ["none", "zlib", "zstd"]:
+        monkeypatch.setattr(persistence, "SAVE_COMPRESSION", codec)
+        assert save_game_state(sample_state())
+
+        path = persistence.get_save_path("save-test")
+        assert len(list(tmp_path.glob("save-test*"))) == 1  # troca de codec não deixa cópia velha
+
+        state = load_game_state(path)
+        assert state["player"]["inventory"] == ["pocao_cura", "adaga_ferro", "pocao_cura"]
+        assert list(state["npcs"]) == ["Borin"]
+        assert [m.content for m in state["messages"]] == ["A jornada começa.", "Olá", "Borin acena."]
+
+
+def test_v2_file_is_compact_with_interned_ids(tmp_path, monkeypatch):
+    monkeypatch.setattr(persistence, "SAVES_DIR", str(tmp_path))
+    monkeypatch.setattr(persistence, "SAVE_COMPRESSION", "none")
+    save_game_state(sample_state())
+
+    raw_text = (tmp_path / "save-test.json").read_text(encoding="utf-8")
+    raw = json.loads(raw_text)
+    assert "\n" not in raw_text
+    assert raw["v"] == persistence.SAVE_FORMAT_VERSION
+    assert raw["player"]["inventory"] == [0, 1, 0]
+    assert raw["messages"][1] == ["h", "Olá"]
+
+
+def test_lazy_messages_materialize_on_access_only():
+    lazy = LazyMessages([("s", "sys"), ("h", "oi"), ("a", "resposta")])
+
+    assert isinstance(lazy[-1], AIMessage)
+    assert isinstance(lazy._items[0], tuple)  # ainda não lida
+    lazy.append(HumanMessage(content="nova"))
+    combined = [SystemMessage(content="x")] + lazy
+    assert len(combined) == 5
+    assert lazy.compact()[-1] == ("h", "nova")
+
+
+def test_loads_legacy_v1_save(tmp_path):
+    legacy = {
+        "game_id": "old",
+        "player": {"inventory": ["corda"]},
+        "npcs": {"Lyra": {}},
+        "message_history": [{"type": "human", "content": "oi"}, {"type": "unknown", "content": "?"}],
+    }
+    path = tmp_path / "old.json"
+    path.write_text(json.dumps(legacy, indent=4), encoding="utf-8")
+
+    state = load_game_state(str(path))
+
+    assert state["player"]["inventory"] == ["corda"]
+    assert [m.content for m in state["messages"]] == ["oi"]
+
+
+def test_message_sequence_survives_save_and_load(tmp_path, monkeypatch):
+    from state import message_seq, stamp_messages
+
+    monkeypatch.setattr(persistence, "SAVES_DIR", str(tmp_path))
+    state = sample_state()
+    state["messages"] = stamp_messages(state["messages"])
+    save_game_state(state)
+
+    loaded = load_game_state(persistence.get_save_path("save-test"))
+    assert [message_seq(m) for m in loaded["messages"]] == [1, 2, 3]
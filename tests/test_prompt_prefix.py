@@ -0,0 +1,74 @@
+import importlib
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+import llm_local
+import llm_setup
+import prompt_prefix
+import tier_policy
+from agents.storyteller import STORYTELLER_PROMPT, storyteller_node
+from metrics import metrics
+from prompt_prefix import PREFIX_CACHE_MIN_TOKENS, PrefixCacheStandIn, prefix_of, register_prefix
+
+
+@pytest.fixture
+def local_provider(monkeypatch):
+    monkeypatch.setattr(llm_setup, "LLM_PROVIDER", "local")
+    monkeypatch.setattr(llm_local, "local_prefix_cache", PrefixCacheStandIn())
+    monkeypatch.setattr(tier_policy, "TIER_DECISION_LOG", "")
+    llm_setup.clear_llm_clients()
+    yield
+    llm_setup.clear_llm_clients()
+
+
+def test_stable_prefix_is_served_from_cache_and_interleaved_values_are_not():
+    # Acima do mínimo do Flash (1024 tokens): é o único regime em que o provider cacheia
+    prefix = register_prefix("teste_prefixo", "Você é o narrador. " * 250)
+    assert prefix.tokens >= PREFIX_CACHE_MIN_TOKENS["flash"]
+    cache = PrefixCacheStandIn()
+
+    cache.observe([prefix.system("Local: Vila"), HumanMessage(content="olho")], "gemini-flash-latest")
+    usage = cache.observe([prefix.system("Local: Floresta"), HumanMessage(content="corro")], "gemini-flash-latest")
+    assert usage["input_token_details"]["cache_read"] >= prefix.tokens
+    # O mesmo prefixo não basta para o mínimo do Pro
+    cache.observe([prefix.system("Local: Vila")], "gemini-pro-latest")
+    assert cache.observe([prefix.system("Local: Rio")], "gemini-pro-latest")["input_token_details"]["cache_read"] == 0
+
+    # Valor dinâmico antes das instruções: nada em comum para reaproveitar
+    cache.observe([SystemMessage(content="Local: Pântano\n" + prefix.text)])
+    usage = cache.observe([SystemMessage(content="Local: Deserto\n" + prefix.text)])
+    assert usage["input_token_details"]["cache_read"] == 0
+    assert prefix_of([prefix.system("x")]) is prefix
+
+
+def test_agent_prefixes_are_below_the_provider_minimum(local_provider):
+    def turn(location):
+        state = {"game_id": "prefixo", "world": {"current_location": location, "turn_count": 5},
+                 "messages": [HumanMessage(content="olho ao redor"), AIMessage(content="A névoa cobre tudo."),
+                              HumanMessage(content=f"caminho até {location}")]}
+        return storyteller_node(state)
+
+    before = metrics.get("prompt_cached_tokens_total", prefix="storyteller")
+    turn("Vila")
+    turn("Floresta Sombria")
+    # Prefixo estável, mas curto demais: o provider não cacheia nada (e o stand-in também não)
+    assert metrics.get("prompt_cached_tokens_total", prefix="storyteller") == before
+    assert metrics.get("prompt_input_tokens_total", prefix="storyteller") > 0
+
+    report = prompt_prefix.cacheable_report()
+    storyteller = report["storyteller"]
+    assert storyteller["static_tokens"] > STORYTELLER_PROMPT.tokens  # Schema StoryUpdate entra na conta
+    assert storyteller["min_tokens"] == PREFIX_CACHE_MIN_TOKENS["flash"] and not storyteller["qualifies"]
+
+
+def test_reimporting_agents_does_not_change_registered_prefixes():
+    import agents.bestiary
+    import agents.campaign_manager
+    import agents.ruler_completo
+
+    changes = lambda name: metrics.get("prompt_prefix_changes_total", prefix=name)  # noqa: E731
+    before = {name: changes(name) for name in ("bestiary", "campaign_architect", "ruler")}
+    for module in (agents.bestiary, agents.campaign_manager, agents.ruler_completo):
+        importlib.reload(module)
+    assert {name: changes(name) for name in before} == before
@@ -0,0 +1,124 @@
+import time
+
+import httpx
+import pytest
+from google.genai.errors import ClientError, ServerError
+from langchain_core.exceptions import OutputParserException
+from langchain_core.runnables import RunnableLambda
+
+import llm_setup
+import provider_scheduler as ps
+from llm_setup import CancellableLLM, FallbackLLM, ModelTier
+from metrics import metrics
+from provider_scheduler import CircuitBreaker, ProviderScheduler, ProviderUnavailable, RetryBudget, TokenBucket, is_retryable
+
+LIMITS = {"fast": {"rps": 1000, "burst": 1000, "concurrency": 4}}
+
+
+def quota_error():
+    return ClientError(429, {"error": {"message": "quota", "status": "RESOURCE_EXHAUSTED"}})
+
+
+class Flaky:
+    def __init__(self, failures, error=quota_error):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures: raise self.error()
+        return "ok"
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(ps, "PROVIDER_BACKOFF_BASE", 0.001)
+
+
+def test_transient_errors_are_retried_against_shared_budget():
+    scheduler = ProviderScheduler(LIMITS, RetryBudget(ratio=0.0, maximum=2))
+    before = metrics.get("provider_retries_total", tier="fast")
+
+    assert scheduler.call("fast", Flaky(2), attempts=3) == "ok"
+    assert metrics.get("provider_retries_total", tier="fast") == before + 2
+
+    # Orçamento zerado: o próximo 429 sobe na hora, mesmo com tentativas sobrando
+    flaky = Flaky(1)
+    with pytest.raises(ClientError):
+        scheduler.call("fast", flaky, attempts=3)
+    assert flaky.calls == 1
+
+    # Erro do pedido (não transitório) não é repetido
+    bad_request = Flaky(1, error=lambda: ValueError("campo faltando (código 500 no texto)"))
+    with pytest.raises(ValueError):
+        ProviderScheduler(LIMITS).call("fast", bad_request, attempts=3)
+    assert bad_request.calls == 1
+
+
+def test_circuit_breaker_fails_fast_to_fallback_and_recovers(monkeypatch):
+    scheduler = ProviderScheduler(LIMITS)
+    scheduler.tiers["fast"].breaker = CircuitBreaker("fast", failures=2, cooldown=0.2)
+    monkeypatch.setattr(llm_setup, "provider_scheduler", scheduler)
+
+    for _ in range(2):
+        with pytest.raises(ServerError):
+            scheduler.call("fast", Flaky(1, error=lambda: ServerError(503, {"error": {"status": "UNAVAILABLE"}})))
+
+    provider = Flaky(0)
+    with pytest.raises(ProviderUnavailable):
+        scheduler.call("fast", provider)
+    assert provider.calls == 0
+
+    llm = llm_setup.get_llm(0.0, ModelTier.FAST)
+    assert isinstance(llm, FallbackLLM)
+    with pytest.raises(ProviderUnavailable):  # Nós com saída estruturada caem no próprio except
+        llm.with_structured_output(dict).invoke("oi")
+
+    time.sleep(0.25)  # Cooldown: uma chamada de teste fecha o circuito
+    assert scheduler.call("fast", provider) == "ok"
+    assert scheduler.tiers["fast"].breaker.state == CircuitBreaker.CLOSED
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=50, burst=1)
+    start = time.monotonic()
+    assert all(bucket.acquire(timeout=1) for _ in range(5))
+    assert time.monotonic() - start >= 0.07  # 4 tokens a 50/s
+
+    empty = TokenBucket(rate=1, burst=1)
+    empty.acquire(0)
+    assert not empty.acquire(timeout=0.1)
+
+
+def test_retryable_is_classified_by_status_and_type():
+    assert is_retryable(quota_error()) and is_retryable(httpx.ConnectTimeout("lento"))
+    assert not is_retryable(ClientError(400, {"error": {"message": "connection 500 timeout"}}))
+    assert not is_retryable(RuntimeError("connection reset 503"))  # Só texto não basta
+    try:
+        try: raise ServerError(502, {"error": {}})
+        except ServerError as inner: raise RuntimeError("embrulhado") from inner
+    except RuntimeError as wrapped:
+        assert is_retryable(wrapped)
+
+
+def test_with_retry_on_scheduled_client_does_not_multiply_attempts(monkeypatch):
+    monkeypatch.setattr(llm_setup, "provider_scheduler", ProviderScheduler(LIMITS))
+    calls = []
+
+    def provider(_input, error):
+        calls.append(1)
+        raise error
+
+    # 429 em todas: só as 3 tentativas do agendador (antes eram 3 x 3 com o RunnableRetry)
+    llm = CancellableLLM(RunnableLambda(lambda x: provider(x, quota_error())), {"tier": "fast", "attempts": 3})
+    with pytest.raises(ClientError):
+        llm.with_retry(stop_after_attempt=3).invoke("oi")
+    assert len(calls) == 3
+
+    # Parse inválido: um único novo pedido, de novo pelo agendador
+    calls.clear()
+    llm = CancellableLLM(RunnableLambda(lambda x: provider(x, OutputParserException("json quebrado"))), {"tier": "fast", "attempts": 3})
+    with pytest.raises(OutputParserException):
+        llm.with_retry(stop_after_attempt=3).invoke("oi")
+    assert len(calls) == 2
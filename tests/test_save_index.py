@@ -0,0 +1,73 @@
+import persistence
+from persistence import latest_game_id, load_index, query_games, save_game_state
+
+
+def make_state(game_id, name, class_name, level, location):
+    return {
+        "game_id": game_id,
+        "narrative_summary": f"{name} explora {location}. " * 20,
+        "player": {"name": name, "class": class_name, "level": level, "hp": 10 * level, "max_hp": 10 * level, "inventory": []},
+        "world": {"current_location": location, "turn_count": level},
+        "messages": [],
+    }
+
+
+def test_listing_filters_and_paginates_from_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(persistence, "SAVES_DIR", str(tmp_path))
+    save_game_state(make_state("g1", "Valerius", "Guerreiro", 1, "Vila"))
+    save_game_state(make_state("g2", "Lyra", "Mago", 4, "Floresta Sombria"))
+    save_game_state(make_state("g3", "Borin", "Guerreiro", 7, "Floresta Sombria"))
+
+    # Listagem não abre os saves
+    monkeypatch.setattr(persistence, "load_game_state", lambda *_: (_ for _ in ()).throw(AssertionError))
+
+    page = query_games(limit=2)
+    assert page["total"] == 3
+    assert [g["game_id"] for g in page["items"]] == ["g3", "g2"]
+    assert query_games(offset=2, limit=2)["items"][0]["game_id"] == "g1"
+
+    assert [g["game_id"] for g in query_games(class_name="guerreiro", min_level=2)["items"]] == ["g3"]
+    assert [g["game_id"] for g in query_games(location="floresta", max_level=5)["items"]] == ["g2"]
+    assert query_games(player="lyr")["items"][0]["summary_snippet"].endswith("...")
+    assert latest_game_id() == "g3"
+
+
+def test_index_rebuilt_from_existing_saves(tmp_path, monkeypatch):
+    monkeypatch.setattr(persistence, "SAVES_DIR", str(tmp_path))
+    save_game_state(make_state("old", "Kael", "Ladino", 2, "Porto"))
+    # Índice perdido e processo novo (sem o índice em memória)
+    (tmp_path / "index" / "games.jsonl").unlink()
+    persistence._index_cache.clear()
+
+    assert load_index()["old"]["player_name"] == "Kael"
+    assert latest_game_id() == "old"
+
+
+def test_saves_append_to_the_index_and_compact_it(tmp_path, monkeypatch):
+    monkeypatch.setattr(persistence, "SAVES_DIR", str(tmp_path))
+    monkeypatch.setattr(persistence, "INDEX_COMPACT_MIN_LINES", 4)
+    index_file = tmp_path / "index" / "games.jsonl"
+
+    save_game_state(make_state("g1", "Valerius", "Guerreiro", 1, "Vila"))
+    lines = len(index_file.read_bytes().splitlines())
+    save_game_state(make_state("g1", "Valerius", "Guerreiro", 2, "Vila"))
+    assert len(index_file.read_bytes().splitlines()) == lines + 1  # Uma linha por save, sem reescrever o índice
+
+    for level in range(3, 6):
+        save_game_state(make_state("g1", "Valerius", "Guerreiro", level, "Vila"))
+    assert len(index_file.read_bytes().splitlines()) <= 4  # Compactado
+
+    # Outro processo lê o diário do disco: a última linha de cada jogo vale
+    persistence._index_cache.clear()
+    assert load_index()["g1"]["level"] == 5
+
+
+def test_empty_index_is_not_rebuilt_on_every_call(tmp_path, monkeypatch):
+    monkeypatch.setattr(persistence, "SAVES_DIR", str(tmp_path))
+    rebuilds = []
+    rebuild = persistence.rebuild_index
+    monkeypatch.setattr(persistence, "rebuild_index", lambda: rebuilds.append(1) or rebuild())
+
+    assert latest_game_id() is None
+    assert query_games()["total"] == 0
+    assert len(rebuilds) == 1  # Sem saves: a pasta é listada uma vez, não a cada chamada
@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from llm_setup import CancellableLLM
+from metrics import metrics
+from rag import CoalescingEmbeddings
+from singleflight import SingleFlight
+
+
+class SlowLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, _input, config=None, **kwargs):
+        self.calls += 1
+        time.sleep(0.2)
+        return AIMessage(content="tema: guerreiro")
+
+
+def run_concurrently(fn, n=5):
+    results = [None] * n
+
+    def worker(i):
+        results[i] = fn()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    return results
+
+
+def test_identical_concurrent_llm_calls_share_one_provider_call():
+    inner = SlowLLM()
+    llm = CancellableLLM(inner, {"model": "fake", "temperature": 0.0})
+    before = metrics.get("provider_calls_coalesced_total", kind="llm")
+
+    results = run_concurrently(lambda: llm.invoke("tema da classe Guerreiro"))
+
+    assert inner.calls == 1
+    assert all(r.content == "tema: guerreiro" for r in results)
+    assert len({id(r) for r in results}) == 5  # Cada chamador recebe sua cópia
+    assert metrics.get("provider_calls_coalesced_total", kind="llm") == before + 4
+
+    llm.invoke("tema da classe Guerreiro")  # Já terminou: chamada nova
+    assert inner.calls == 2
+
+
+def test_sampled_calls_are_coalesced_only_when_the_node_opts_in():
+    inner = SlowLLM()
+    llm = CancellableLLM(inner, {"model": "fake", "temperature": 0.7})
+
+    run_concurrently(lambda: llm.invoke("descreva a taverna"))
+    assert inner.calls == 5  # Cada chamador pediu sua própria amostra
+
+    assert llm.coalesced() is llm.coalesced()
+    run_concurrently(lambda: llm.coalesced().invoke("ficha do Lobo Cinzento"))
+    assert inner.calls == 6
+
+
+def test_errors_are_shared_and_not_remembered():
+    flights = SingleFlight("test")
+    calls = []
+
+    def failing():
+        calls.append(1)
+        time.sleep(0.1)
+        raise RuntimeError("429")
+
+    def attempt():
+        try:
+            flights.do("k", failing)
+        except RuntimeError as e:
+            return str(e)
+
+    assert run_concurrently(attempt, 3) == ["429"] * 3
+    assert len(calls) == 1 and flights.in_flight() == 0
+
+    with pytest.raises(RuntimeError):
+        flights.do("k", failing)
+    assert len(calls) == 2
+
+
+def test_embedding_queries_are_coalesced():
+    class SlowEmbeddings:
+        calls = 0
+
+        def embed_query(self, text):
+            SlowEmbeddings.calls += 1
+            time.sleep(0.2)
+            return [0.1, 0.2]
+
+        def embed_documents(self, texts):
+            return [[0.0] for _ in texts]
+
+    embeddings = CoalescingEmbeddings(SlowEmbeddings())
+    results = run_concurrently(lambda: embeddings.embed_query("lore de Vila Alta"))
+    assert SlowEmbeddings.calls == 1 and results == [[0.1, 0.2]] * 5
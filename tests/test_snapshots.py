@@ -0,0 +1,56 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+import persistence
+import snapshots
+from persistence import save_game_state
+
+
+def make_state(turn, messages):
+    return {
+        "game_id": "rewind-test",
+        "narrative_summary": "A aventura segue.",
+        "player": {"name": "Valerius", "hp": 30 - turn, "inventory": ["corda"]},
+        "world": {"current_location": "Estrada", "turn_count": turn},
+        "npcs": {f"NPC {i}": {"name": f"NPC {i}", "persona": "p" * 300} for i in range(5)},
+        "campaign_plan": {"beats": [{"description": "b" * 200, "status": "pending"}] * 3},
+        "messages": list(messages),
+    }
+
+
+def play(tmp_path, monkeypatch, turns):
+    monkeypatch.setattr(persistence, "SAVES_DIR", str(tmp_path))
+    monkeypatch.setattr(snapshots, "HISTORY_DIR", str(tmp_path / "history"))
+    messages = [SystemMessage(content="A jornada começa.")]
+    for turn in range(1, turns + 1):
+        messages += [HumanMessage(content=f"acao {turn}"), AIMessage(content=f"cena {turn} " * 40)]
+        messages = messages[:1] + messages[-19:]
+        state = make_state(turn, messages)
+        save_game_state(state)
+        snapshots.record_snapshot(state)
+    return state
+
+
+def test_rewind_restores_turn(tmp_path, monkeypatch):
+    play(tmp_path, monkeypatch, 5)
+
+    restored = snapshots.load_snapshot("rewind-test", 3)
+
+    assert restored["world"]["turn_count"] == 3
+    assert restored["player"]["hp"] == 27
+    assert restored["messages"][-1].content.startswith("cena 3")
+
+    snapshots.truncate_history("rewind-test", 3)
+    assert [e["turn"] for e in snapshots.load_history("rewind-test")] == [1, 2, 3]
+    assert snapshots.load_snapshot("rewind-test", 3)["player"]["hp"] == 27
+
+
+def test_hundred_turns_share_unchanged_sections(tmp_path, monkeypatch):
+    play(tmp_path, monkeypatch, 100)
+
+    one_save = (tmp_path / "rewind-test.json").stat().st_size
+    history = snapshots.history_size_bytes("rewind-test")
+
+    assert len(snapshots.load_history("rewind-test")) == 100
+    # Sem compartilhamento seriam ~100 saves completos. Com objetos por hash cada turno
+    # só acrescenta as mensagens novas e as seções que mudaram.
+    assert history < one_save * 100 / 4
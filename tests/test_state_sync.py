@@ -0,0 +1,88 @@
+import json
+
+import jsonpatch
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+import persistence
+import snapshots
+from snapshots import record_snapshot, truncate_history
+from state_sync import client_view, diff_since, state_version
+
+
+def make_state(turn, hp=20):
+    return {
+        "game_id": "sync-test",
+        "narrative_summary": "Resumo.",
+        "player": {"name": "Lyra", "hp": hp, "inventory": ["pocao_cura"] * turn},
+        "world": {"current_location": "Vila", "turn_count": turn},
+        "npcs": {f"NPC {i}": {"name": f"NPC {i}", "memory": ["..."] * 10} for i in range(20)},
+        "messages": [SystemMessage(content="Início")]
+        + [m for t in range(1, turn + 1) for m in (HumanMessage(content=f"acao {t}"), AIMessage(content=f"cena {t} " * 30))],
+    }
+
+
+def setup(tmp_path, monkeypatch):
+    monkeypatch.setattr(persistence, "SAVES_DIR", str(tmp_path))
+    monkeypatch.setattr(snapshots, "HISTORY_DIR", str(tmp_path / "history"))
+
+
+def test_patch_brings_client_copy_up_to_date(tmp_path, monkeypatch):
+    setup(tmp_path, monkeypatch)
+    record_snapshot(make_state(1))
+    local = client_view(make_state(1))
+    since = state_version("sync-test")
+
+    current = make_state(2, hp=14)
+    record_snapshot(current)
+    delta = diff_since(current, since)
+
+    assert delta["base_version"] == since and delta["full"] is None
+    assert jsonpatch.apply_patch(local, delta["patch"]) == client_view(current)
+    # Só o que mudou trafega
+    assert len(json.dumps(delta["patch"])) < len(json.dumps(client_view(current))) / 5
+
+    assert diff_since(current, delta["version"])["patch"] == []
+
+
+def test_unknown_or_rewritten_version_gets_full_state(tmp_path, monkeypatch):
+    setup(tmp_path, monkeypatch)
+    record_snapshot(make_state(1))
+    record_snapshot(make_state(2))
+    old_turn_2 = state_version("sync-test")
+
+    # Rewind para o turno 1 e outro turno 2 na nova linha do tempo
+    truncate_history("sync-test", 1)
+    current = make_state(2, hp=5)
+    record_snapshot(current)
+
+    assert diff_since(current, old_turn_2)["full"] == client_view(current)
+    assert diff_since(current, "lixo")["patch"] is None
+
+
+def test_views_are_built_without_packing_and_cache_is_thread_safe(tmp_path, monkeypatch):
+    import threading
+    import state_sync
+
+    setup(tmp_path, monkeypatch)
+    versions = []
+    for turn in range(1, 6):
+        record_snapshot(make_state(turn))
+        versions.append(state_version("sync-test"))
+
+    def no_packing(_state):
+        raise AssertionError("client_view não deve re-empacotar o estado")
+    monkeypatch.setattr(persistence, "_pack_state", no_packing)
+    monkeypatch.setattr(state_sync, "VIEW_CACHE_SIZE", 2)  # Força inserções e remoções concorrentes
+
+    current = make_state(5)
+    errors = []
+    def client(offset):
+        try:
+            for i in range(40):
+                assert diff_since(current, versions[(i + offset) % len(versions)])["full"] is None
+        except Exception as exc:  # noqa: BLE001
+            errors.append(exc)
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert errors == [] and len(state_sync._view_cache) <= 2
@@ -9,12 +9,11 @@ from langchain_core.messages import AIMessage, HumanMessage
 
 from agents.archivist import archive_narrative
 from agents.bestiary import (
-    _infer_tier_from_name as infer_enemy_tier,
     generate_new_enemy,
     get_enemy_template,
 )
 from agents.combat import _tree_of_thoughts_strategy, combat_node
-from agents.npc import _infer_tier_from_name as infer_npc_tier, generate_new_npc, npc_actor_node
+from agents.npc import generate_new_npc, npc_actor_node
 from agents.router import dm_router_node
 from agents.rules import rules_node
 from agents.storyteller import storyteller_node
@@ -23,6 +22,7 @@ from engine_utils import DamageTarget, EngineUpdate
 from persistence import load_game, save_game
 from prologue_manager import generate_prologue
 from state import GameState
+from tier_policy import enemy_importance, npc_importance
 
 
 HAS_API_KEY = bool(os.getenv("GOOGLE_API_KEY"))
@@ -170,7 +170,7 @@ def test_persistence_roundtrip(tmp_path):
 @pytest.mark.skipif(not HAS_API_KEY, reason="GOOGLE_API_KEY não configurada")
 def test_bestiary_spawner_and_cache():
     for name in ["Rat", "Ancient Void Dragon Boss"]:
-        tier = infer_enemy_tier(name)
+        tier = enemy_importance(name)
         enemy = generate_new_enemy(name, context="Arena de testes")
         assert enemy and enemy.get("hp") is not None
         cached = get_enemy_template(name)
@@ -181,7 +181,7 @@ def test_bestiary_spawner_and_cache():
 @pytest.mark.skipif(not HAS_API_KEY, reason="GOOGLE_API_KEY não configurada")
 def test_npc_designer_outputs_fields():
     for name in ["Beggar", "King of Shadows"]:
-        tier = infer_npc_tier(name)
+        tier = npc_importance(name)
         npc = generate_new_npc(name, context="Cidade portuária")
         assert npc and "persona" in npc
         assert tier is not None
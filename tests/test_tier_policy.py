@@ -0,0 +1,86 @@
+import json
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import tier_policy
+from llm_setup import ModelTier
+from provider_scheduler import ProviderScheduler
+from tier_policy import Importance, TierPolicy, enemy_importance, npc_importance
+from turn_budget import TurnBudget, current_turn, start_turn, use_turn
+
+
+@pytest.fixture(autouse=True)
+def decision_log(tmp_path, monkeypatch):
+    path = tmp_path / "tier.jsonl"
+    monkeypatch.setattr(tier_policy, "TIER_DECISION_LOG", str(path))
+    return path
+
+
+def game_state(seconds_left=25, first_scene=False):
+    messages = [HumanMessage(content="entro na taverna")]
+    if not first_scene: messages = [HumanMessage(content="olá"), AIMessage(content="Bem-vindo.")] + messages
+    return start_turn({"game_id": "jogo_1", "messages": messages}, seconds_left)
+
+
+def warm(scheduler, tier, seconds, n=10):
+    scheduler.tiers[tier].latencies.extend([seconds] * n)
+
+
+def test_importance_and_deadline_drive_the_tier(decision_log):
+    policy = TierPolicy(scheduler=ProviderScheduler())
+    assert policy.choose("bestiary", enemy_importance("Rato"), game_state()) == ModelTier.FAST
+    assert policy.choose("combat", Importance.HIGH, game_state()) == ModelTier.SMART
+
+    # Pouco tempo: SMART vira FAST e a degradação entra no turno
+    budget = TurnBudget(game_state(seconds_left=4), "combat")
+    assert policy.choose("combat", Importance.CRITICAL, budget=budget) == ModelTier.FAST
+    assert budget.updates() == {"degradations": ["combat:fast_tier"]}
+
+    tier_policy.flush_decision_log()
+    records = [json.loads(line) for line in decision_log.read_text().splitlines()]
+    assert [(r["node"], r["tier"], r["reason"]) for r in records][-1] == ("combat", "fast", "deadline")
+
+
+def test_measured_latency_relaxes_or_tightens_the_deadline():
+    scheduler = ProviderScheduler()
+    policy = TierPolicy(scheduler=scheduler)
+    warm(scheduler, "smart", 2.0)
+    # p90 de 2s: 6s restantes bastam (o mínimo fixo seria 10s)
+    assert policy.choose("loot", Importance.HIGH, game_state(seconds_left=6)) == ModelTier.SMART
+
+    warm(scheduler, "smart", 15.0, n=100)
+    assert policy.choose("loot", Importance.HIGH, game_state(seconds_left=60)) == ModelTier.FAST  # lento demais
+
+
+def test_cost_budget_spares_boss_fights_and_first_scene():
+    policy = TierPolicy(game_budget=10, scheduler=ProviderScheduler())
+    assert policy.choose("npc_actor", Importance.HIGH, game_state()) == ModelTier.SMART
+    # Sem ida ao provider (cache, fallback) a decisão não custa nada
+    assert policy.choose("npc_actor", Importance.HIGH, game_state()) == ModelTier.SMART
+    with use_turn(game_state()):
+        policy.record_call("smart")  # Chamada atendida: cobrada do jogo do turno
+    assert policy.spent("jogo_1") == tier_policy.TIER_COST[ModelTier.SMART]
+    assert policy.choose("npc_actor", Importance.HIGH, game_state()) == ModelTier.FAST  # orçamento do jogo estourado
+    assert policy.choose("combat", enemy_importance("Goblin King"), game_state()) == ModelTier.SMART
+    assert policy.choose("storyteller", Importance.NORMAL, game_state(first_scene=True)) == ModelTier.SMART
+    assert npc_importance("Rainha Élfica") == Importance.HIGH and npc_importance("Viking") == Importance.NORMAL
+
+
+def test_only_calls_served_by_the_provider_are_charged():
+    from provider_scheduler import provider_scheduler
+
+    policy = tier_policy.tier_policy
+    state = game_state()
+    state["game_id"] = "jogo_cobranca"
+    before = policy.spent("jogo_cobranca")
+
+    with use_turn(state):
+        assert policy.choose("loot", Importance.HIGH, state) == ModelTier.SMART
+        provider_scheduler.call("smart", lambda: "ok")
+    assert policy.spent("jogo_cobranca") == before + tier_policy.TIER_COST[ModelTier.SMART]
+
+    # Fora do turno nada fica no contexto: a próxima chamada não é cobrada do jogo anterior
+    assert current_turn() is None
+    provider_scheduler.call("smart", lambda: "ok")
+    assert policy.spent("jogo_cobranca") == before + tier_policy.TIER_COST[ModelTier.SMART]
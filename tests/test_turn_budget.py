@@ -0,0 +1,74 @@
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from agents.campaign_manager import campaign_manager_node
+from agents.storyteller import storyteller_node
+from engine_utils import execute_engine
+from llm_setup import ModelTier
+from turn_budget import CANNED_CONTINUATION, TurnBudget, start_turn
+
+
+def state_with(seconds_left):
+    state = {
+        "player": {"name": "Lyra", "hp": 10, "gold": 0, "inventory": []},
+        "world": {"current_location": "Vila", "turn_count": 3},
+        "messages": [HumanMessage(content="olho ao redor")],
+        "campaign_plan": {},
+        "needs_replan": True,
+    }
+    return start_turn(state, seconds_left)
+
+
+def test_budget_degrades_by_remaining_time():
+    budget = TurnBudget(state_with(5), "combat")
+    assert budget.tier(ModelTier.SMART) == ModelTier.FAST
+    assert budget.max_steps(8) == 1
+    assert budget.updates() == {"degradations": ["combat:fast_tier", "combat:tool_steps_capped"]}
+
+    relaxed = TurnBudget({}, "combat")  # Sem prazo: nada muda
+    assert relaxed.tier(ModelTier.SMART) == ModelTier.SMART and relaxed.max_steps(8) == 8
+    assert relaxed.updates() == {}
+
+
+def test_nodes_skip_llm_work_when_deadline_is_near(monkeypatch):
+    state = state_with(0.5)
+
+    plan = campaign_manager_node(state)
+    assert plan["needs_replan"] is True
+    assert plan["degradations"] == ["campaign_manager:skip_replan"]
+
+    story = storyteller_node(state)
+    assert story["messages"][0].content == CANNED_CONTINUATION
+    assert story["degradations"] == ["storyteller:canned"]
+
+
+class LoopingLLM:
+    """Pede ferramenta em toda chamada; conta as chamadas."""
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+
+    def bind_tools(self, _tools):
+        return self
+
+    def invoke(self, _messages):
+        self.calls += 1
+        time.sleep(self.delay)
+        return AIMessage(content="", tool_calls=[{"id": f"t{self.calls}", "name": "roll_dice", "args": {"formula": "1d20"}}])
+
+
+def test_tool_loop_is_capped_by_budget():
+    state = state_with(7)
+    llm = LoopingLLM()
+    result = execute_engine(llm, SystemMessage(content="engine"), state["messages"], state, budget=TurnBudget(state, "combat"))
+
+    assert llm.calls == 2 + 1  # 7s / 3s por volta, mais a narração final
+    assert result["degradations"] == ["combat:tool_steps_capped"]
+
+    # Prazo estourado durante a chamada: sem narração extra, resposta pronta
+    state = state_with(2.5)
+    llm = LoopingLLM(delay=0.6)
+    result = execute_engine(llm, SystemMessage(content="engine"), state["messages"], state, budget=TurnBudget(state, "combat"))
+    assert llm.calls == 1
+    assert result["messages"][-1].content == CANNED_CONTINUATION
@@ -0,0 +1,205 @@
+"""
+tier_policy.py
+Escolha Adaptativa do Tier de Modelo (FAST vs SMART) por chamada.
+Substitui o tier fixo por nó e as heurísticas de nome (_infer_tier_from_name).
+Cada chamada declara a importância da tarefa e a política decide com base em:
+1. importância: NORMAL fica no FAST; HIGH (arquivista, combate, loot, NPC,
+   planejador) e CRITICAL (chefe, primeira cena) pedem SMART;
+2. provider: circuit breaker do SMART aberto -> FAST;
+3. prazo do turno: SMART só se o tempo restante comporta o p90 medido do tier
+   (TIER_DEADLINE_FACTOR x p90; sem medições, SMART_MIN_BUDGET do turn_budget);
+4. custo por jogo: cada chamada que chega ao provider debita TIER_COST_<TIER>
+   do orçamento TIER_GAME_BUDGET do jogo do turno atual (turn_budget.use_turn);
+   resposta do cache ou FallbackLLM não custa;
+   estourado, só CRITICAL ainda usa SMART;
+5. latência: SMART com p90 acima de TIER_SMART_MAX_LATENCY só para CRITICAL.
+Cada decisão vai para o log (🎚️ [TIER]), para tier_decisions_total{node,tier,reason}
+e, em JSONL, para TIER_DECISION_LOG (dados para calibrar a política), gravado por
+uma thread de fundo fora do caminho da chamada.
+O gasto por jogo fica em memória (zera quando o processo reinicia).
+"""
+import atexit
+import json
+import math
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from enum import IntEnum
+from typing import Any, Dict, Optional
+
+from langchain_core.messages import AIMessage
+
+from llm_setup import ModelTier
+from metrics import metrics
+from provider_scheduler import provider_scheduler
+from turn_budget import SMART_MIN_BUDGET, TurnBudget, current_turn, remaining
+
+# --- CONFIGURAÇÃO ---
+TIER_COST = {
+    ModelTier.FAST: float(os.getenv("TIER_COST_FAST", "1")),
+    ModelTier.SMART: float(os.getenv("TIER_COST_SMART", "8")),
+}
+TIER_GAME_BUDGET = float(os.getenv("TIER_GAME_BUDGET", "600"))
+TIER_DEADLINE_FACTOR = float(os.getenv("TIER_DEADLINE_FACTOR", "2"))
+TIER_SMART_MAX_LATENCY = float(os.getenv("TIER_SMART_MAX_LATENCY", "12"))
+TIER_LATENCY_QUANTILE = 0.9
+TIER_DECISION_LOG = os.getenv("TIER_DECISION_LOG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "tier_decisions.jsonl"))
+MAX_TRACKED_GAMES = 1024
+
+# Nomes que indicam chefe / figura importante (monstros e NPCs)
+NOTABLE_NAME_RE = re.compile(r"\b(boss|chefe|dragon|drag[aã]o|lich|god|deus|lord|lorde|king|rei|queen|rainha|archmage|arquimago)\b",
+                             re.IGNORECASE)
+
+metrics.describe("tier_decisions_total", "Decisões de tier por nó, tier escolhido e motivo")
+
+
+class Importance(IntEnum):
+    NORMAL = 1
+    HIGH = 2      # Qualidade pesa: SMART se houver tempo e orçamento
+    CRITICAL = 3  # Chefe, primeira cena: SMART sempre que o prazo e o provider permitirem
+
+
+def is_notable(name: str) -> bool:
+    return bool(NOTABLE_NAME_RE.search(name or ""))
+
+
+def enemy_importance(name: str, enemy_type: Optional[str] = None) -> Importance:
+    """Chefe (tipo BOSS ou nome de chefe) é CRITICAL; o resto, NORMAL."""
+    if (enemy_type or "").upper() == "BOSS" or is_notable(name): return Importance.CRITICAL
+    return Importance.NORMAL
+
+
+def npc_importance(name: str) -> Importance:
+    return Importance.HIGH if is_notable(name) else Importance.NORMAL
+
+
+# Jogo da última decisão no contexto: a chamada ao provider que vem em seguida é cobrada dele
+
+
+# --- LOG DE DECISÕES (JSONL, gravado em segundo plano) ---
+_log_queue: "queue.Queue[tuple]" = queue.Queue()
+_log_thread: Optional[threading.Thread] = None
+_log_thread_lock = threading.Lock()
+
+
+def _log_writer():
+    while True:
+        batch = [_log_queue.get()]
+        while True:
+            try: batch.append(_log_queue.get_nowait())
+            except queue.Empty: break
+        by_path: Dict[str, list] = {}
+        for path, line in batch: by_path.setdefault(path, []).append(line)
+        for path, lines in by_path.items():
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                with open(path, "a", encoding="utf-8") as f: f.write("".join(lines))
+            except OSError as exc:
+                print(f"⚠️ [TIER] Falha ao gravar log de decisões: {exc}")
+        for _ in batch: _log_queue.task_done()
+
+
+def _enqueue_log(path: str, record: Dict[str, Any]):
+    global _log_thread
+    if _log_thread is None:
+        with _log_thread_lock:
+            if _log_thread is None:
+                _log_thread = threading.Thread(target=_log_writer, name="tier-log", daemon=True)
+                _log_thread.start()
+    _log_queue.put((path, json.dumps(record, ensure_ascii=False) + "\n"))
+
+
+def flush_decision_log():
+    """Espera a thread de fundo gravar as decisões pendentes."""
+    if _log_thread is not None: _log_queue.join()
+
+
+atexit.register(flush_decision_log)
+
+
+def is_first_scene(state: Optional[Dict[str, Any]]) -> bool:
+    """Nenhuma narração ainda (e turno inicial): a primeira cena define o tom do jogo."""
+    if not state or "messages" not in state: return False
+    if ((state.get("world") or {}).get("turn_count") or 0) > 1: return False
+    return not any(isinstance(m, AIMessage) for m in state["messages"])
+
+
+class TierPolicy:
+    def __init__(self, game_budget: float = TIER_GAME_BUDGET, scheduler=provider_scheduler):
+        self.game_budget = game_budget
+        self.scheduler = scheduler
+        self._spent: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def spent(self, game_id: Optional[str]) -> float:
+        with self._lock:
+            return self._spent.get(game_id or "", 0.0)
+
+    def _charge(self, game_id: Optional[str], tier: ModelTier) -> float:
+        with self._lock:
+            key = game_id or ""
+            self._spent[key] = self._spent.get(key, 0.0) + TIER_COST[tier]
+            self._spent.move_to_end(key)
+            while len(self._spent) > MAX_TRACKED_GAMES: self._spent.popitem(last=False)
+            return self._spent[key]
+
+    def choose(self, node: str, importance: Importance = Importance.NORMAL,
+               state: Optional[Dict[str, Any]] = None, budget: Optional[TurnBudget] = None) -> ModelTier:
+        """
+        Tier para uma chamada do nó `node`. O estado vem de `budget`, de `state` ou
+        do turno atual (turn_budget.current_turn); sem nenhum, não há prazo nem jogo.
+        """
+        state = budget.state if budget is not None else (state if state is not None else current_turn())
+        game_id = (state or {}).get("game_id")
+        if is_first_scene(state): importance = Importance.CRITICAL
+        left = remaining(state) if state else math.inf
+        smart_p90 = self.scheduler.latency(ModelTier.SMART.value, TIER_LATENCY_QUANTILE)
+        needed = TIER_DEADLINE_FACTOR * smart_p90 if smart_p90 is not None else SMART_MIN_BUDGET
+        spent = self.spent(game_id)
+        over_budget = spent + TIER_COST[ModelTier.SMART] > self.game_budget
+
+        tier, reason = ModelTier.FAST, "importance"
+        if importance < Importance.HIGH: pass
+        elif self.scheduler.is_open(ModelTier.SMART.value): reason = "smart_unavailable"
+        elif left < needed:
+            reason = "deadline"
+            if budget is not None: budget.allow(needed, "fast_tier")  # Registra a degradação do turno
+        elif importance < Importance.CRITICAL and over_budget: reason = "cost_budget"
+        elif importance < Importance.CRITICAL and smart_p90 is not None and smart_p90 > TIER_SMART_MAX_LATENCY:
+            reason = "smart_slow"
+        else: tier = ModelTier.SMART
+
+        self._log(node, tier, reason, importance, left, smart_p90, spent, game_id)
+        return tier
+
+    def record_call(self, tier: str, game_id: Optional[str] = None):
+        """Debita uma chamada atendida pelo provider do jogo do turno atual (turn_budget.use_turn)."""
+        if tier not in (t.value for t in TIER_COST): return
+        if game_id is None: game_id = (current_turn() or {}).get("game_id")
+        self._charge(game_id, ModelTier(tier))
+
+    def _log(self, node, tier, reason, importance, left, smart_p90, spent, game_id):
+        metrics.inc("tier_decisions_total", node=node, tier=tier.value, reason=reason)
+        left_str = "sem prazo" if math.isinf(left) else f"{left:.1f}s restantes"
+        p90_str = f"{smart_p90:.1f}s" if smart_p90 is not None else "?"
+        print(f"🎚️ [TIER] {node}: {tier.value.upper()} ({reason}, {importance.name}, {left_str}, p90 smart {p90_str}, custo {spent:.0f}/{self.game_budget:.0f})")
+        if not TIER_DECISION_LOG: return
+        _enqueue_log(TIER_DECISION_LOG, {
+            "ts": round(time.time(), 3), "node": node, "tier": tier.value, "reason": reason,
+            "importance": importance.name, "remaining": None if math.isinf(left) else round(left, 2),
+            "smart_p90": smart_p90, "fast_p90": self.scheduler.latency(ModelTier.FAST.value, TIER_LATENCY_QUANTILE),
+            "spent": spent, "game_id": game_id,
+        })
+
+
+# Instância global
+tier_policy = TierPolicy()
+provider_scheduler.add_listener(tier_policy.record_call)
+
+
+def choose_tier(node: str, importance: Importance = Importance.NORMAL,
+                state: Optional[Dict[str, Any]] = None, budget: Optional[TurnBudget] = None) -> ModelTier:
+    return tier_policy.choose(node, importance, state, budget)
@@ -0,0 +1,115 @@
+"""
+turn_budget.py
+Prazo por Turno (deadline) e Degradação Graciosa.
+A API marca no estado um prazo absoluto (state["turn_deadline"], epoch) antes de
+rodar o grafo. Cada nó consulta o tempo restante e, se não couber, abre mão do
+que é opcional: replanejamento, RAG, tier SMART, passos extras do loop de
+ferramentas ou a própria chamada de LLM (resposta pronta). Cada degradação
+aplicada vai para state["degradations"] ("nó:degradação") e volta na resposta.
+O estado do turno também fica no contexto (use_turn / current_turn) para quem
+não recebe o state, como os geradores de monstros e NPCs (escolha de tier em
+tier_policy.py); fora do `with`, o contexto volta ao que era.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from llm_setup import ModelTier
+
+# --- CONFIGURAÇÃO ---
+TURN_DEADLINE = float(os.getenv("TURN_DEADLINE_SECONDS", "25"))
+
+# Tempo mínimo restante (s) para cada etapa opcional valer a pena
+REPLAN_MIN_BUDGET = 12.0
+SMART_MIN_BUDGET = 10.0
+RAG_MIN_BUDGET = 6.0
+RETRY_MIN_BUDGET = 8.0
+ARCHIVE_MIN_BUDGET = 8.0
+TOOL_STEP_ESTIMATE = 3.0   # Custo médio de uma volta do loop de ferramentas
+CANNED_MIN_BUDGET = 2.0    # Abaixo disso nem chamamos a LLM
+
+_turn: ContextVar[Optional[Dict[str, Any]]] = ContextVar("turn_state", default=None)
+
+CANNED_CONTINUATION = "O momento se estende em silêncio, e o mundo parece aguardar o seu próximo passo. O que você faz?"
+
+
+def start_turn(state: Dict[str, Any], seconds: Optional[float] = None) -> Dict[str, Any]:
+    """Marca o prazo do turno e zera as degradações (in-place). Chame antes de invoke."""
+    state["turn_deadline"] = time.time() + (TURN_DEADLINE if seconds is None else seconds)
+    state["degradations"] = []
+    return state
+
+
+@contextmanager
+def use_turn(state: Dict[str, Any]):
+    """Torna `state` o turno atual (também nas threads do LangGraph, que copiam o contexto)."""
+    token = _turn.set(state)
+    try:
+        yield state
+    finally:
+        _turn.reset(token)  # Worker reaproveitado não herda o turno (nem o prazo) de outro jogo
+
+
+def current_turn() -> Optional[Dict[str, Any]]:
+    """Estado do turno marcado por use_turn no contexto atual (None fora de um turno)."""
+    return _turn.get()
+
+
+def remaining(state: Dict[str, Any]) -> float:
+    """Segundos até o prazo do turno (infinito se o turno não tem prazo)."""
+    deadline = state.get("turn_deadline")
+    if not deadline: return float("inf")
+    return deadline - time.time()
+
+
+class TurnBudget:
+    """Consulta do prazo dentro de um nó; acumula as degradações aplicadas."""
+
+    def __init__(self, state: Dict[str, Any], node: str):
+        self.state = state
+        self.node = node
+        self.applied: List[str] = []
+
+    def remaining(self) -> float:
+        return remaining(self.state)
+
+    def _degrade(self, what: str):
+        tag = f"{self.node}:{what}"
+        if tag not in self.applied:
+            print(f"⏱️ [BUDGET] {tag} ({max(self.remaining(), 0):.1f}s restantes)")
+            self.applied.append(tag)
+
+    def allow(self, min_seconds: float, degradation: str) -> bool:
+        """True se sobra `min_seconds`; senão registra a degradação e retorna False."""
+        if self.remaining() >= min_seconds: return True
+        self._degrade(degradation)
+        return False
+
+    def exhausted(self) -> bool:
+        """Sem tempo nem para uma chamada de LLM: use CANNED_CONTINUATION."""
+        return not self.allow(CANNED_MIN_BUDGET, "canned")
+
+    def tier(self, tier: ModelTier) -> ModelTier:
+        """SMART vira FAST quando o tempo restante não comporta o modelo lento."""
+        if tier == ModelTier.SMART and not self.allow(SMART_MIN_BUDGET, "fast_tier"):
+            return ModelTier.FAST
+        return tier
+
+    def retry_attempts(self, attempts: int) -> int:
+        if attempts > 1 and not self.allow(RETRY_MIN_BUDGET, "single_attempt"):
+            return 1
+        return attempts
+
+    def max_steps(self, default: int) -> int:
+        """Limite de voltas do loop de ferramentas que cabem no tempo restante."""
+        left = self.remaining()
+        if left == float("inf") or left // TOOL_STEP_ESTIMATE >= default: return default
+        fits = int(left // TOOL_STEP_ESTIMATE)
+        self._degrade("tool_steps_capped")
+        return max(1, fits)
+
+    def updates(self) -> Dict[str, Any]:
+        """Campo para o retorno do nó (reducer operator.add em GameState.degradations)."""
+        return {"degradations": list(self.applied)} if self.applied else {}